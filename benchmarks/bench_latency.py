@@ -0,0 +1,48 @@
+"""
+Latency benchmark for a model config, sweeping batch sizes, input resolutions and CPU thread counts.
+
+usage: python benchmarks/bench_latency.py MODEL_CFG [--batch-sizes 1 8] [--resolutions 224x224] [--threads 1 4]
+       [--device cpu] [--output latency.json]
+"""
+import argparse
+import sys
+import torch
+
+sys.path.insert(0, ".")
+from bonsai.modules.bonsai_model import BonsaiModel  # noqa: E402
+from bonsai.utils.benchmark import benchmark_sweep, write_benchmark_json  # noqa: E402
+
+
+def _resolution(value):
+    height, width = value.lower().split("x")
+    return int(height), int(width)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model_cfg")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1])
+    parser.add_argument("--resolutions", type=_resolution, nargs="+", default=None)
+    parser.add_argument("--threads", type=int, nargs="+", default=None)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--max-time", type=float, default=2.)
+    parser.add_argument("--output", default=None, help="JSON output path")
+    args = parser.parse_args()
+
+    model = BonsaiModel(args.model_cfg).to(args.device)
+    hyperparams = model.hyperparams
+    input_size = [hyperparams["in_channels"], hyperparams.get("height", 224), hyperparams.get("width", 224)]
+    results = benchmark_sweep(model, input_size, torch.device(args.device), args.batch_sizes, args.resolutions,
+                              args.threads, warmup=args.warmup, max_time=args.max_time)
+
+    for result in results:
+        print(f"bs {result['batch_size']:4d} {result['height']}x{result['width']} threads {result['num_threads']:2d}: "
+              f"p50 {result['p50'] * 1e3:.3f}ms p90 {result['p90'] * 1e3:.3f}ms p99 {result['p99'] * 1e3:.3f}ms "
+              f"std {result['std'] * 1e3:.3f}ms ({result['iterations']} runs)")
+    if args.output:
+        write_benchmark_json(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
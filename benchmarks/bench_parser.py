@@ -0,0 +1,72 @@
+"""
+Import time and parse time benchmark for bonsai_parser.
+
+usage: python benchmarks/bench_parser.py [--repeats N]
+"""
+import argparse
+import subprocess
+import sys
+import time
+import torch
+from torch import nn
+from torchvision.models import resnet50
+
+sys.path.insert(0, ".")
+from u_net import UNet  # noqa: E402
+
+IMPORT_SNIPPET = """
+import resource, time
+tic = time.perf_counter()
+import bonsai.modules.bonsai_parser
+print(time.perf_counter() - tic, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+class ResidualBlock(nn.Module):
+
+    def __init__(self, channels):
+        super(ResidualBlock, self).__init__()
+        self.conv = nn.Conv2d(channels, channels, 3, padding=1)
+        self.bn = nn.BatchNorm2d(channels)
+
+    def forward(self, x):
+        return x + torch.relu(self.bn(self.conv(x)))
+
+
+def deep_residual_model(num_blocks=1000, channels=8):
+    """
+    Returns: a generated model of num_blocks residual blocks, for measuring how parsing scales with depth
+    """
+    return nn.Sequential(nn.Conv2d(3, channels, 3, padding=1), *[ResidualBlock(channels) for _ in range(num_blocks)])
+
+
+def bench_import():
+    output = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], capture_output=True, text=True, check=True)
+    import_time, max_rss = output.stdout.split()
+    print(f"import bonsai_parser: {float(import_time):.3f}s, max RSS {int(max_rss) / 1024:.1f} MB")
+
+
+def bench_parse(name, model, model_in, repeats, method=None):
+    from bonsai.modules.bonsai_parser import bonsai_parser
+    times = []
+    for _ in range(repeats):
+        tic = time.perf_counter()
+        parsed_model = bonsai_parser(model, model_in, method)
+        times.append(time.perf_counter() - tic)
+    print(f"parse {name} ({method or 'fx'}): best {min(times):.3f}s over {repeats} runs, {len(parsed_model)} modules")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    bench_import()
+    for method in ["fx", "jit"]:
+        bench_parse("UNet", UNet(4, 4), torch.rand(1, 4, 128, 128), args.repeats, method)
+        bench_parse("ResNet-50", resnet50(), torch.rand(1, 3, 224, 224), args.repeats, method)
+        bench_parse("1000 residual blocks", deep_residual_model(), torch.rand(1, 3, 16, 16), args.repeats, method)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,11 @@
-from bonsai.main import Bonsai
+"""
+pytorch-bonsai, the training pipeline (Bonsai) is imported on first access, so building and running a BonsaiModel
+doesn't load ignite, tensorboard or the plotting libraries.
+"""
+
+
+def __getattr__(name):
+    if name == "Bonsai":
+        from bonsai.main import Bonsai
+        return Bonsai
+    raise AttributeError(f"module 'bonsai' has no attribute '{name}'")
@@ -0,0 +1,43 @@
+"""
+Command line interface, installed as the bonsai command:
+
+    bonsai sweep sweep.yaml             runs every trial of a sweep config file, see bonsai.utils.sweep
+    bonsai sweep sweep.yaml --dry-run   prints the trials of a sweep without running them
+"""
+import argparse
+import json
+from typing import List
+
+
+def _sweep(args):
+    # the sweep module imports only the config, torch is imported by the trial processes
+    from bonsai.utils.sweep import plan_sweep, run_sweep, summarize_sweep
+
+    plan = plan_sweep(args.config, args.name)
+    if args.dry_run:
+        print(f"Sweep {plan['name']}: {len(plan['trials'])} trials, {plan['workers']} at a time")
+        for trial in plan["trials"]:
+            print(json.dumps(trial["params"]), trial["prefix"] or "")
+        return
+    run_sweep(args.config, args.name)
+    print(summarize_sweep(plan["settings"]["database"], plan["name"]))
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="bonsai", description="pytorch-bonsai command line tools")
+    subparsers = parser.add_subparsers(dest="command")
+    subparsers.required = True
+
+    sweep_parser = subparsers.add_parser("sweep", help="run a grid of pruning configurations")
+    sweep_parser.add_argument("config", help="yaml config file with a sweep section")
+    sweep_parser.add_argument("--name", default=None,
+                              help="sweep name in the database, the config file name by default")
+    sweep_parser.add_argument("--dry-run", action="store_true", help="print the trials without running them")
+    sweep_parser.set_defaults(func=_sweep)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,14 @@ import logging
 import yaml
 import warnings
 import os
-import confuse
+
+DEFAULT_CONFIG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config_default.yaml")
 
 
 class Config(object):
     """This is a wrapper for the python confuse package, which handles setting and getting configuration variables via
-    various ways (notably via argparse and kwargs).
+    various ways (notably via argparse and kwargs). The configuration is read on first access, importing the package
+    doesn't import confuse or touch any file.
     """
 
     config = None
@@ -20,32 +22,57 @@ class Config(object):
         return cls.instance
 
     def __init__(self, config_path: str = None):
-        if config_path is None or not os.path.exists(config_path):
+        self.config_path = config_path
+        self.config = None
+
+    def _load(self):
+        import confuse
+
+        config_path = self.config_path
+        if config_path is not None and not os.path.exists(config_path):
             warnings.warn(f"provided bonsai config file: '{config_path}', is not found. using default config...")
-            config_path = "config_default.yml"
-            generate_default_config(config_path)
+            config_path = None
 
         self.config = confuse.Configuration("BonsaiPruning", __name__)
-        self.config.set_file(config_path)
+        self.config.set_file(config_path or DEFAULT_CONFIG_PATH)
         logging.debug(
             "The config constructor should be called only once, you should see this message only once."
         )
 
     def __getitem__(self, item):
+        if self.config is None:
+            self._load()
         return self.config[item]
 
     def __setitem__(self, key, value):
+        if self.config is None:
+            self._load()
         self.config[key].set(value)
 
+    def set_file(self, path: str):
+        """
+        overlays the values of a yaml config file on the current configuration
+        """
+        if self.config is None:
+            self._load()
+        self.config.set_file(path)
+
 
 def generate_default_config(path: str):
+    """
+    writes the default configuration to a yaml file, to be used as a template for a custom config file
+
+    Args:
+        path: output file path
+    """
 
     default_dict = {"pruning": {"num_iterations": 9,
                                 "prune_percent": 0.1,
                                 "finetune_epochs": 3,
                                 "patience": 2,
                                 "out_path": "pruning_results",
-                                "early_stopping": True
+                                "early_stopping": True,
+                                "bundle": True
                                 },
 
                     "optimizer": {"type": "Adam",
@@ -57,8 +84,107 @@ def generate_default_config(path: str):
                                 "logdir": "runs",
                                 "train_log_interval": 1
                                 },
+                    "execution": {"channels_last": False,
+                                  "autocast": None,  # e.g. "bfloat16", None for fp32
+                                  "compile": False,
+                                  "compile_mode": "default",
+                                  "checkpoint_segments": 0,  # 0 to disable, -1 for automatic
+                                  "inplace_activations": False
+                                  },
+
+                    "accuracy_budget": {"enabled": False,
+                                        "metric": "loss",
+                                        "higher_is_better": False,
+                                        "max_drop": 0.05,
+                                        "max_iterations": 50,
+                                        "bisect_steps": 2  # 0 to roll back without retrying smaller steps
+                                        },
+
+                    "auto_batch": {"enabled": False,
+                                   "phases": ["rank", "finetune", "eval"],
+                                   "candidates": [8, 16, 32, 64, 128, 256],
+                                   "memory_cap": None,  # bytes, None for the free cuda memory / no limit on CPU
+                                   "probe_iterations": 3
+                                   },
+
+                    "dataset_cache": {"enabled": False,
+                                      "phases": ["rank", "eval"],
+                                      "memory_limit": 2 ** 31,  # bytes, larger caches are memory mapped
+                                      "cache_dir": None
+                                      },
+
                     "evaluate":
-                        {"eval_speed": 5}  # inference iterations to average when measuring inference time, 0 to cancel
+                        {"eval_speed": 5},  # inference iterations to average when measuring inference time, 0 to cancel
+
+                    "exploration": {"enabled": False,
+                                    "pruners": [None],  # pruner class names, None for the Bonsai object's pruner
+                                    "normalize": [False, True],
+                                    "caps": [None, 0.5],
+                                    "calibration_batches": 10,
+                                    "eval_batches": 10,
+                                    "workers": 0,
+                                    "metric": "loss",
+                                    "higher_is_better": False
+                                    },
+
+                    "prefetch": {"enabled": False,
+                                 "batches": 2,
+                                 "stall_threshold": 0.2
+                                 },
+
+                    "profiling": {"enabled": False,
+                                  "runs": 10,
+                                  "sort_by": "time_ms"
+                                  },
+
+                    "proxy_eval": {"enabled": False,
+                                   "fraction": 0.1,
+                                   "seed": 0,
+                                   "bootstrap_resamples": 200,
+                                   "confidence": 0.95,
+                                   "metric": "loss",
+                                   "higher_is_better": False,
+                                   "max_drop": None  # escalate to full evaluation above this metric drop
+                                   },
+
+                    "quantization": {"enabled": False,
+                                     "backend": "fbgemm"
+                                     },
+
+                    "sensitivity": {"enabled": False,
+                                    "ratios": [0.1, 0.25, 0.5, 0.75],
+                                    "max_batches": 10,
+                                    "workers": 0,
+                                    "metric": "loss",
+                                    "higher_is_better": False,
+                                    "max_drop": 0.02,
+                                    "every": 0  # 0 to scan only at the first pruning iteration
+                                    },
+
+                    "sparsity": {"enabled": False,
+                                 "level": 0.5,
+                                 "min_sparsity": 0.9
+                                 },
+
+                    "sweep": {"model": None,
+                              "weights": None,
+                              "data": None,  # "module:function" returning the data loaders and criterion
+                              "data_kwargs": {},
+                              "pruner": "WeightL2Prunner",
+                              "normalize": False,
+                              "grid": {},  # dotted config keys, pruner or normalize to lists of values
+                              "database": "sweep.db",
+                              "out_dir": "sweeps",
+                              "max_parallel": None,
+                              "cpus_per_trial": 1,
+                              "memory_per_trial": None,  # bytes, None to only budget cpus
+                              "cache_ranks": True,
+                              "rerun": False
+                              },
+
+                    "telemetry": {"enabled": False,
+                                  "jsonl": "telemetry.jsonl"
+                                  }
                     }
 
     with open(path, "w") as f:
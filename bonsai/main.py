@@ -1,18 +1,37 @@
 import os
+import json
+import itertools
+import weakref
 from typing import Callable
 import numpy as np
 import torch
+from torch.utils.data import DataLoader, IterableDataset, Subset
 from ignite.engine import Events
-from ignite.handlers import TerminateOnNan, ModelCheckpoint, EarlyStopping
+from ignite.handlers import TerminateOnNan, EarlyStopping
 from ignite.metrics import Metric
-from torch.utils.tensorboard import SummaryWriter
 from bonsai.utils.progress_bar import Progbar
 from bonsai.utils.performance_utils import log_performance
+from bonsai.utils.compile_utils import compile_if_profitable
+from bonsai.utils.batch_tuner import find_batch_size, rebatch_loader, loader_kwargs, default_memory_cap
+from bonsai.utils.checkpoint_writer import AsyncCheckpointWriter
+from bonsai.utils.module_profiler import ModuleProfiler
+from bonsai.utils.prefetch import PrefetchLoader
+from bonsai.utils.dataset_cache import TensorCacheDataset, cached_loader
+from bonsai.utils.proxy_eval import subset_indices, concat_outputs, bootstrap_metrics
+from bonsai.utils.telemetry import PipelineTelemetry
+from bonsai.utils.model_bundle import write_bundle
+from bonsai.utils.quantization_utils import prepare_static_quantization, convert_static_quantization
 from bonsai.config import config
 from bonsai.modules.bonsai_model import BonsaiModel
-from bonsai.modules.model_cfg_parser import write_pruned_config
+from bonsai.modules.bonsai_modules import BBatchNorm2d
+from bonsai.modules.model_cfg_parser import pruned_model_cfg, write_model_cfg
 from bonsai.pruning.abstract_pruners import AbstractPruner, WeightBasedPruner
 from bonsai.pruning.optimizer_factory import optimizer_constructor_from_config
+from bonsai.pruning.sensitivity import sensitivity_scan, layer_caps_from_sensitivity
+from bonsai.pruning.exploration import pruner_class, candidate_grid, merge_caps, recalibrate_batch_norm, \
+    score_candidates, best_candidate
+from bonsai.pruning.sparsity import compute_linear_sparsity_masks, apply_sparsity_masks, \
+    convert_linear_layers_to_sparse
 from bonsai.pruning.pruning_engines import create_supervised_ranker, create_supervised_trainer, \
     create_supervised_evaluator
 from bonsai.utils.engine_hooks import log_training_loss, run_evaluator, log_evaluator_metrics, calc_model_speed, \
@@ -33,6 +52,7 @@ class Bonsai:
 
     def __init__(self, model_cfg_path: str, pruner=None, normalize=False):
         self.model = BonsaiModel(model_cfg_path, self)
+        self._configure_model(self.model)
         if pruner is not None and isinstance(pruner(self), AbstractPruner):
             self.prunner = pruner(self, normalize=normalize)  # type: AbstractPruner
         # elif config["pruning"]["type"].get():
@@ -46,25 +66,203 @@ class Bonsai:
 
         self._eval_handlers = []
         self._finetune_handlers = []
+
+        # torch.compile'd version of the current model used by the fine tuning and evaluation engines, if any
+        self._compiled_model = None
+        self.compile_stats = []
+        # batch sizes chosen by the automatic batch tuner, per iteration and phase
+        self.batch_sizes = {}
+        # last probed batch size per phase, valid while the model and device are unchanged, see _auto_batch
+        self._batch_size_cache = {}
+        # transformed datasets cached by _cached_loader, by dataset id
+        self._dataset_caches = {}
+        # metrics of the last evaluation, and the steps of the accuracy budget search, see _run_budget_pruning
+        self.last_metrics = {}
+        self.budget_history = []
+        self.best_iteration = None
+        # proxy evaluation subset, baseline and per iteration estimates with confidence intervals, see _proxy_eval
+        self._proxy_dl = None
+        self._proxy_baseline = None
+        self.proxy_metrics = {}
+        # per layer profiles of every evaluated pruning iteration, see _profile
+        self.profiles = {}
+        # per layer sensitivity scans by pruning iteration, see _scan_sensitivity
+        self.sensitivity = {}
+        # scores of the candidate pruning plans by pruning iteration, see _explore
+        self.exploration = {}
+        # file the first iteration's ranks are loaded from if it exists, and saved to otherwise, see _rank
+        self.rank_cache = None
+        # per phase wall time, cpu time, memory and data loading stats of run_pruning
+        self.telemetry = PipelineTelemetry()
+        # checkpoints and pruned configs are written in the background, see wait_for_checkpoints
+        self.checkpoint_writer = AsyncCheckpointWriter()
         # _metrics is used to store the metrics the user wants to calculate besides the loss
         self._metrics = {}
 
     def __call__(self, *args, **kwargs):
         return self.model(*args, **kwargs)
 
+    @staticmethod
+    def _execution_kwargs():
+        """
+        Returns: memory format and autocast keyword arguments for the ranking, fine tuning and evaluation engines
+        """
+        autocast_dtype = config["execution"]["autocast"].get()
+        if autocast_dtype is not None:
+            autocast_dtype = getattr(torch, autocast_dtype)
+        return {"channels_last": bool(config["execution"]["channels_last"].get()),
+                "autocast_dtype": autocast_dtype}
+
+    @staticmethod
+    def _configure_model(model: BonsaiModel):
+        """
+        applies the execution config options that change the model itself, called for every newly built model
+        """
+        if config["execution"]["inplace_activations"].get():
+            model.enable_inplace_activations()
+
+    def _engine_model(self):
+        """
+        Returns: the model the fine tuning and evaluation engines should run, compiled if compilation was profitable
+        """
+        if self._compiled_model is not None:
+            return self._compiled_model
+        return self.model
+
+    def _compile(self, train_dl, val_dl, test_dl, iter_num):
+        """
+        Compiles the current model for the fine tuning and evaluation of this pruning iteration, falling back to eager
+        execution when the compile time would exceed the projected savings over the iteration's remaining epochs.
+        Compile time and speedup are logged to tensorboard.
+
+        Args:
+            train_dl: Data loader for the training set.
+            val_dl: Data loader for the validation set.
+            test_dl: Data loader for the test set.
+            iter_num: current pruning iteration
+        """
+        self._compiled_model = None
+        if not config["execution"]["compile"].get():
+            return
+
+        finetune_epochs = config["pruning"]["finetune_epochs"].get()
+        # training steps run both forward and backward, counted as three forward passes
+        remaining_steps = finetune_epochs * (3 * len(train_dl) + len(val_dl)) + len(test_dl)
+        batch_size = train_dl.batch_size or 1
+        sample_input = torch.randn(batch_size, *train_dl.dataset[0][0].size()).to(self.device)
+        self.model.to(self.device)
+
+        previous_stats = self.compile_stats[-1] if self.compile_stats else None
+        self._compiled_model, stats = compile_if_profitable(self.model, sample_input, self.device, remaining_steps,
+                                                            previous_stats, config["execution"]["compile_mode"].get())
+        stats["iteration"] = iter_num
+        self.compile_stats.append(stats)
+
+        if stats["compiled"]:
+            print(f"Compiled model in {stats['compile_time']:.2f}s, speedup {stats['speedup']:.2f}")
+        else:
+            print("Compilation isn't expected to pay off, running eagerly")
+        if self.writer and stats["compiled_time"] is not None:
+            self.writer.add_scalar("compile/compile_time", stats["compile_time"], iter_num)
+            self.writer.add_scalar("compile/speedup", stats["speedup"], iter_num)
+
+    def _prepare_loader(self, dl, phase: str, iter_num: int):
+        """
+        Prepares a data loader for an engine, re-choosing its batch size when automatic batching is enabled for the
+        phase and wrapping it with a background prefetcher when prefetching is enabled.
+
+        Args:
+            dl: Data loader given by the user for the phase.
+            phase: one of rank, finetune or eval.
+            iter_num: current pruning iteration, 0 for the evaluation of the unpruned model
+
+        Returns: the data loader the engine should run on
+        """
+        if dl is None:
+            return dl
+        if config["auto_batch"]["enabled"].get() and phase in config["auto_batch"]["phases"].get():
+            dl = self._auto_batch(dl, phase, iter_num)
+        if config["dataset_cache"]["enabled"].get() and phase in config["dataset_cache"]["phases"].get():
+            dl = self._cached_loader(dl)
+        if config["prefetch"]["enabled"].get():
+            dl = PrefetchLoader(dl, self.device, config["prefetch"]["batches"].get(),
+                                self._execution_kwargs()["channels_last"], config["prefetch"]["stall_threshold"].get())
+        return dl
+
+    def _cached_loader(self, dl):
+        """
+        Returns: a data loader reading dl's dataset from its in memory cache, the dataset is cached on first use and the
+        cache is kept for the rest of the pruning run, see bonsai.utils.dataset_cache
+        """
+        if not isinstance(dl, DataLoader) or isinstance(dl.dataset, IterableDataset):
+            return dl
+        cached = self._dataset_caches.get(id(dl.dataset))
+        if cached is None or cached[0] is not dl.dataset:
+            cache = TensorCacheDataset(dl.dataset, config["dataset_cache"]["memory_limit"].get(),
+                                       config["dataset_cache"]["cache_dir"].get(), dl.num_workers)
+            cached = self._dataset_caches[id(dl.dataset)] = (dl.dataset, cache)
+        return cached_loader(dl, cached[1])
+
+    def _auto_batch(self, dl, phase: str, iter_num: int):
+        """
+        Re-chooses the batch size of a data loader for the current model, see bonsai.utils.batch_tuner. The chosen
+        batch size is logged to tensorboard, and reused by later loaders of the same phase until the model changes, e.g.
+        the fine tuning validation and test evaluations of an iteration share a probe.
+
+        Args:
+            dl: Data loader given by the user for the phase.
+            phase: one of rank, finetune or eval.
+            iter_num: current pruning iteration, 0 for the evaluation of the unpruned model
+
+        Returns: data loader with the throughput optimal batch size, or dl if no candidate fits
+        """
+        cached = self._batch_size_cache.get(phase)
+        if cached is not None and cached[0]() is self.model and cached[1] == self.device:
+            batch_size = cached[2]
+        else:
+            memory_cap = config["auto_batch"]["memory_cap"].get()
+            if memory_cap is None:
+                memory_cap = default_memory_cap(self.device)
+            self.model.to(self.device)
+            # probes run on random data, which must not reach the pruner's ranks
+            to_rank, self.model.to_rank = self.model.to_rank, False
+            try:
+                batch_size = find_batch_size(self.model, dl.dataset[0][0], self.device, training=phase != "eval",
+                                             candidates=config["auto_batch"]["candidates"].get(),
+                                             memory_cap=memory_cap,
+                                             iterations=config["auto_batch"]["probe_iterations"].get())
+            finally:
+                self.model.to_rank = to_rank
+            self._batch_size_cache[phase] = (weakref.ref(self.model), self.device, batch_size)
+        if batch_size is None:
+            return dl
+
+        self.batch_sizes.setdefault(iter_num, {})[phase] = batch_size
+        if self.writer:
+            self.writer.add_scalar(f"batch_size/{phase}", batch_size, iter_num)
+        return rebatch_loader(dl, batch_size)
+
     # TODO - wrap most of _rank functionality inside bonsai.prunning.abstract_prunners.AbstractPrunner
     def _rank(self, rank_dl, criterion, iter_num):
         print("Ranking")
+        # the first iteration ranks the unpruned model, which runs sharing the model and pruner can reuse
+        use_cache = iter_num == 1 and self.rank_cache is not None
+        if use_cache and os.path.exists(self.rank_cache):
+            self._load_ranks(self.rank_cache)
+            return
+        rank_dl = self._prepare_loader(rank_dl, "rank", iter_num)
         self.model.to_rank = True
         self.prunner.set_up()
         if not isinstance(self.prunner, WeightBasedPruner):
-            ranker_engine = create_supervised_ranker(self.model, self.prunner, criterion, device=self.device)
+            ranker_engine = create_supervised_ranker(self.model, self.prunner, criterion, device=self.device,
+                                                     **self._execution_kwargs())
             # add progress bar
             pbar = Progbar(rank_dl, metrics='none')
             ranker_engine.add_event_handler(Events.ITERATION_COMPLETED, pbar)
             # add event hook for accumulation of scores over the dataset
             ranker_engine.add_event_handler(Events.ITERATION_COMPLETED, self.prunner.compute_model_ranks)
             # ranker_engine.add_event_handler(Events.ITERATION_STARTED, self.prunner.reset)
+            self.telemetry.attach(ranker_engine)
             ranker_engine.run(rank_dl, max_epochs=1)
         else:
             self.prunner.compute_model_ranks()
@@ -73,6 +271,8 @@ class Bonsai:
             self.prunner.normalize_ranks()
 
         self.prunner.equalize_elementwise()
+        if use_cache:
+            self._save_ranks(self.rank_cache)
 
         if self.writer:
             histogram_name = f"layer ranks - iteration {iter_num}"
@@ -83,12 +283,21 @@ class Bonsai:
     def _finetune(self, train_dl, val_dl, criterion, iter_num):
         print("Recovery")
         self.model.to_rank = False
+        train_dl = self._prepare_loader(train_dl, "finetune", iter_num)
+        val_dl = self._prepare_loader(val_dl, "eval", iter_num)
         finetune_epochs = config["pruning"]["finetune_epochs"].get()
 
+        # activation checkpointing, segment boundaries are planned for the training input resolution
+        checkpoint_segments = config["execution"]["checkpoint_segments"].get()
+        if checkpoint_segments:
+            height, width = train_dl.dataset[0][0].size()[-2:]
+            self.model.enable_checkpointing(checkpoint_segments if checkpoint_segments > 0 else None, height, width)
+
         optimizer_constructor = optimizer_constructor_from_config(config)
         optimizer = optimizer_constructor(self.model.parameters())
 
-        finetune_engine = create_supervised_trainer(self.model, optimizer, criterion, self.device)
+        finetune_engine = create_supervised_trainer(self._engine_model(), optimizer, criterion, self.device,
+                                                    **self._execution_kwargs())
         # progress bar
         pbar = Progbar(train_dl, metrics='none')
         finetune_engine.add_event_handler(Events.ITERATION_COMPLETED, pbar)
@@ -101,14 +310,19 @@ class Bonsai:
         # terminate on Nan
         finetune_engine.add_event_handler(Events.ITERATION_COMPLETED, TerminateOnNan())
 
-        # model checkpoints
-        checkpoint = ModelCheckpoint(config["pruning"]["out_path"].get(), require_empty=False,
-                                     filename_prefix=f"pruning_iteration_{iter_num}", save_interval=1)
-        finetune_engine.add_event_handler(Events.COMPLETED, checkpoint, {"weights": self.model.cpu()})
+        # unstructured sparsity of linear layers, masks are re-applied after every optimizer step
+        if config["sparsity"]["enabled"].get():
+            masks = compute_linear_sparsity_masks(self.model, config["sparsity"]["level"].get())
+            apply_sparsity_masks(self.model, masks)
+            finetune_engine.add_event_handler(Events.ITERATION_COMPLETED,
+                                              lambda engine: apply_sparsity_masks(self.model, masks))
+
+        # model checkpoints, written in the background while the next pruning phase runs
+        finetune_engine.add_event_handler(Events.COMPLETED, lambda engine: self._save_checkpoint(iter_num))
 
         # add early stopping
-        validation_evaluator = create_supervised_evaluator(self.model, device=self.device,
-                                                           metrics=self._metrics)
+        validation_evaluator = create_supervised_evaluator(self._engine_model(), device=self.device,
+                                                           metrics=self._metrics, **self._execution_kwargs())
 
         if config["pruning"]["early_stopping"].get():
             def _score_function(evaluator):
@@ -124,24 +338,81 @@ class Bonsai:
                                               *handler_dict["args"], **handler_dict["kwargs"])
 
         # run training engine
+        self.telemetry.attach(finetune_engine)
         finetune_engine.run(train_dl, max_epochs=finetune_epochs)
 
-    def _eval(self, eval_dl):
-        print("Evaluation")
+    def _save_checkpoint(self, iter_num):
+        """
+        snapshots the current model's weights and writes them, and its bundle if enabled, on the checkpoint writer
+        thread. The model isn't moved off its device.
 
-        evaluator = create_supervised_evaluator(self.model, device=self.device,
-                                                metrics=self._metrics)
+        Args:
+            iter_num: current pruning iteration
+        """
+        out_path = config["pruning"]["out_path"].get()
+        os.makedirs(out_path, exist_ok=True)
+        writes = [(os.path.join(out_path, f"pruning_iteration_{iter_num}_weights.pth"), torch.save)]
+        if config["pruning"]["bundle"].get():
+            model_cfg = self.model.full_cfg
+            metadata = {"kept_channels": self.model.kept_channels}
+            writes.append((os.path.join(out_path, f"pruning_iteration_{iter_num}.bonsai"),
+                           lambda state_dict, path: write_bundle(path, model_cfg, state_dict, metadata)))
+        # both files are written from a single snapshot
+        self.checkpoint_writer.save_model_files(self.model, writes)
+
+    def wait_for_checkpoints(self):
+        """
+        blocks until all checkpoints and pruned model configs are written, re-raising any error raised while writing
+        """
+        self.checkpoint_writer.wait()
+
+    def _eval(self, eval_dl, iter_num=0, final=False):
+        """
+        Evaluates the current model, logging its metrics and inference time. With proxy evaluation enabled, the model
+        is evaluated on a fixed subset of eval_dl instead, except before pruning, at the final iteration and when the
+        subset's estimate drops more than allowed, see _proxy_eval.
 
+        Args:
+            eval_dl: Data loader for the evaluation set.
+            iter_num: current pruning iteration, 0 for the evaluation of the unpruned model
+            final: whether this is the evaluation of the final pruning iteration
+        """
+        print("Evaluation")
+        evaluator, evaluated_dl = None, eval_dl
+        if config["proxy_eval"]["enabled"].get() and not final:
+            evaluator, evaluated_dl = self._proxy_eval(eval_dl, iter_num)
+        if evaluator is None:
+            evaluator, evaluated_dl = self._run_evaluator(eval_dl, iter_num), eval_dl
+
+        self.last_metrics = {name: value for name, value in evaluator.state.metrics.items()
+                             if isinstance(value, (int, float))}
         # TODO - add logger
         if self.writer:
-            evaluator.add_event_handler(Events.EPOCH_COMPLETED,
-                                        lambda engine: log_evaluator_metrics(engine, self.writer))
-
-        input_size = [1] + list(eval_dl.dataset[0][0].size())
+            log_evaluator_metrics(evaluator, self.writer)
         if config["evaluate"]["eval_speed"].get():
-            evaluator.add_event_handler(Events.EPOCH_COMPLETED,
-                                        lambda engine: calc_model_speed(engine, self, input_size,
-                                                                        config["evaluate"]["eval_speed"].get()))
+            input_size = [1] + list(evaluated_dl.dataset[0][0].size())
+            calc_model_speed(evaluator, self, input_size, config["evaluate"]["eval_speed"].get())
+
+        if config["profiling"]["enabled"].get():
+            self._profile(eval_dl, iter_num)
+
+    def _run_evaluator(self, eval_dl, iter_num, output_handler: Callable = None):
+        """
+        runs the evaluation engine over a data loader
+
+        Args:
+            eval_dl: Data loader to evaluate on.
+            iter_num: current pruning iteration
+            output_handler: called with the engine output of every batch, if given
+
+        Returns: the evaluator engine, with the computed metrics in its state
+        """
+        eval_dl = self._prepare_loader(eval_dl, "eval", iter_num)
+
+        evaluator = create_supervised_evaluator(self._engine_model(), device=self.device,
+                                                metrics=self._metrics, **self._execution_kwargs())
+        if output_handler is not None:
+            evaluator.add_event_handler(Events.ITERATION_COMPLETED, lambda engine: output_handler(engine.state.output))
 
         pbar = Progbar(eval_dl, None)
         evaluator.add_event_handler(Events.ITERATION_COMPLETED, pbar)
@@ -150,19 +421,227 @@ class Bonsai:
             evaluator.add_event_handler(handler_dict["event_name"], handler_dict["handler"],
                                         *handler_dict["args"], **handler_dict["kwargs"])
 
+        self.telemetry.attach(evaluator)
         evaluator.run(eval_dl, 1)
+        return evaluator
+
+    def _proxy_eval(self, eval_dl, iter_num):
+        """
+        Evaluates the model on a fixed, stratified subset of the evaluation set and computes bootstrap confidence
+        intervals of the metrics, stored in proxy_metrics and logged to tensorboard. The estimates before pruning are
+        the baseline, later estimates are accepted unless the tracked metric drops more than proxy_eval.max_drop
+        from it.
+
+        Args:
+            eval_dl: Data loader for the evaluation set.
+            iter_num: current pruning iteration
+
+        Returns: tuple of (evaluator engine or None if a full evaluation is needed, the subset data loader)
+        """
+        proxy_config = config["proxy_eval"]
+        if self._proxy_dl is None or self._proxy_dl[0] is not eval_dl:
+            indices = subset_indices(eval_dl.dataset, proxy_config["fraction"].get(), proxy_config["seed"].get())
+            subset_dl = DataLoader(Subset(eval_dl.dataset, indices), batch_size=eval_dl.batch_size,
+                                   collate_fn=eval_dl.collate_fn, **loader_kwargs(eval_dl))
+            self._proxy_dl = (eval_dl, subset_dl)
+        subset_dl = self._proxy_dl[1]
+
+        outputs = []
+        evaluator = self._run_evaluator(subset_dl, iter_num, outputs.append)
+        estimates = {name: value for name, value in evaluator.state.metrics.items()
+                     if isinstance(value, (int, float))}
+        intervals = bootstrap_metrics(self._metrics, concat_outputs(outputs), len(subset_dl.dataset),
+                                      proxy_config["bootstrap_resamples"].get(), proxy_config["confidence"].get(),
+                                      proxy_config["seed"].get())
+        self.proxy_metrics[iter_num] = {name: {"estimate": estimates[name], "low": low, "high": high}
+                                        for name, (low, high) in intervals.items() if name in estimates}
+        if self.writer:
+            for name, stats in self.proxy_metrics[iter_num].items():
+                for key, value in stats.items():
+                    self.writer.add_scalar(f"proxy/{name}/{key}", value, iter_num)
+
+        metric_name = proxy_config["metric"].get()
+        if iter_num == 0 or metric_name not in estimates:
+            if iter_num == 0:
+                self._proxy_baseline = estimates.get(metric_name)
+            return None, eval_dl
+
+        drop = self._proxy_baseline - estimates[metric_name]
+        if not proxy_config["higher_is_better"].get():
+            drop = -drop
+        max_drop = proxy_config["max_drop"].get()
+        if max_drop is not None and drop > max_drop:
+            print(f"Proxy {metric_name} dropped by {drop:.4f}, running full evaluation")
+            return None, eval_dl
+        return evaluator, subset_dl
+
+    def _profile(self, eval_dl, iter_num):
+        """
+        profiles the time, FLOPs and memory of each cfg layer of the current model on a random batch, writes the table
+        to the output directory and logs it to tensorboard
+
+        Args:
+            eval_dl: Data loader whose batch and sample size are used for the profiled batch.
+            iter_num: current pruning iteration
+        """
+        batch_size = eval_dl.batch_size or 1
+        model_input = torch.randn(batch_size, *eval_dl.dataset[0][0].size(), device=self.device)
+        profiler = ModuleProfiler(self.model.to(self.device))
+        self.profiles[iter_num] = profiler.profile(model_input, config["profiling"]["runs"].get())
+
+        out_path = config["pruning"]["out_path"].get()
+        os.makedirs(out_path, exist_ok=True)
+        with open(os.path.join(out_path, f"pruning_iteration_{iter_num}_profile.md"), "w") as f:
+            f.write(profiler.table(config["profiling"]["sort_by"].get()) + "\n")
+        if self.writer:
+            profiler.log_to_tensorboard(self.writer, iter_num)
+
+    def _scan_sensitivity(self, val_dl, criterion, iter_num):
+        """
+        scans the sensitivity of every layer to pruning using the current ranks, see
+        bonsai.pruning.sensitivity.sensitivity_scan, and caps how much of each layer the following pruning iterations
+        may remove. The scan is written to the output directory and the caps are logged to tensorboard.
+
+        Args:
+            val_dl: Data loader for the validation set, the first sensitivity.max_batches batches are used.
+            criterion: Loss function, evaluated as the loss metric.
+            iter_num: current pruning iteration
+        """
+        print("Sensitivity scan")
+        sensitivity_config = config["sensitivity"]
+        scan = sensitivity_scan(self, val_dl, criterion, sensitivity_config["ratios"].get(),
+                                sensitivity_config["max_batches"].get(), sensitivity_config["workers"].get())
+        self.sensitivity[iter_num] = scan
+        self.prunner.layer_caps = layer_caps_from_sensitivity(scan, sensitivity_config["max_drop"].get(),
+                                                              sensitivity_config["metric"].get(),
+                                                              sensitivity_config["higher_is_better"].get())
+
+        out_path = config["pruning"]["out_path"].get()
+        os.makedirs(out_path, exist_ok=True)
+        with open(os.path.join(out_path, f"pruning_iteration_{iter_num}_sensitivity.json"), "w") as f:
+            json.dump({"baseline": scan["baseline"], "caps": self.prunner.layer_caps,
+                       "curves": {self.model.module_list[i].module_cfg["name"]: curve
+                                  for i, curve in scan["curves"].items()}}, f, indent=2)
+        if self.writer:
+            for i, cap in self.prunner.layer_caps.items():
+                self.writer.add_scalar(f"sensitivity/{self.model.module_list[i].module_cfg['name']}/cap", cap,
+                                       iter_num)
+
+    def _explore(self, train_dl, val_dl, criterion, num_filters_to_prune, iter_num):
+        """
+        Prunes the model with the best of several candidate plans, see bonsai.pruning.exploration. The candidates are
+        every combination of the exploration config's pruners, normalize settings and caps. The model is ranked once
+        per pruner and normalize setting, each candidate model is built in memory and scored after recalibrating its
+        batch norm statistics, and the best one replaces the current model. The scores are stored in exploration,
+        written to the output directory and logged to tensorboard.
+
+        Args:
+            train_dl: Data loader for the training set, its first batches are used for batch norm recalibration.
+            val_dl: Data loader for the validation set, used for ranking and scoring.
+            criterion: Loss function, evaluated as the loss metric.
+            num_filters_to_prune: number of neurons to prune
+            iter_num: current pruning iteration
+        """
+        print("Exploring pruning plans")
+        explore_config = config["exploration"]
+        prunner = self.prunner
+        residual, layer_caps = prunner.pruning_residual, prunner.layer_caps
+        prunable_indices = [i for i, _ in prunner._prunable_modules_iterator()]
+        grid = candidate_grid(explore_config["pruners"].get(), explore_config["normalize"].get(),
+                              explore_config["caps"].get())
+
+        candidates, models, plans = [], [], []
+        # cached ranks belong to the Bonsai object's pruner only
+        rank_cache, self.rank_cache = self.rank_cache, None
+        try:
+            for (pruner_name, normalize), group in itertools.groupby(grid, lambda c: (c["pruner"], c["normalize"])):
+                self.prunner = pruner_class(pruner_name, type(prunner))(self, normalize=normalize)
+                self.prunner.reset()
+                self._rank(val_dl, criterion, iter_num)
+                for candidate in group:
+                    self.prunner.pruning_residual = residual
+                    self.prunner.layer_caps = merge_caps(layer_caps, prunable_indices, candidate["cap"])
+                    pruning_targets = self.prunner.get_prunning_plan(num_filters_to_prune)
+                    filters_to_keep = self.prunner.inverse_pruning_targets(pruning_targets)
+                    if filters_to_keep in plans:
+                        # same plan as an earlier candidate, not worth scoring twice
+                        continue
+                    plans.append(filters_to_keep)
+                    models.append(self._build_pruned_model(filters_to_keep))
+                    candidates.append({"pruner": type(self.prunner).__name__, "normalize": normalize,
+                                       "cap": candidate["cap"], "residual": self.prunner.pruning_residual,
+                                       "num_filters": models[-1].total_prunable_filters()})
+        finally:
+            self.prunner = prunner
+            self.rank_cache = rank_cache
+
+        calibration_batches = list(itertools.islice(train_dl, explore_config["calibration_batches"].get()))
+        eval_batches = list(itertools.islice(val_dl, explore_config["eval_batches"].get()))
+        num_workers = explore_config["workers"].get()
+        scores = score_candidates(models, calibration_batches, eval_batches, dict(self._metrics),
+                                  "cpu" if num_workers else self.device, num_workers)
+        best = best_candidate(scores, explore_config["metric"].get(), explore_config["higher_is_better"].get())
+        for i, (candidate, score) in enumerate(zip(candidates, scores)):
+            candidate.update(score, chosen=i == best)
+        self.exploration[iter_num] = candidates
+        print(f"Chose candidate {best}: {candidates[best]}")
+
+        out_path = config["pruning"]["out_path"].get()
+        os.makedirs(out_path, exist_ok=True)
+        with open(os.path.join(out_path, f"pruning_iteration_{iter_num}_exploration.json"), "w") as f:
+            json.dump(candidates, f, indent=2)
+        if self.writer:
+            for name, value in scores[best].items():
+                self.writer.add_scalar(f"exploration/{name}", value, iter_num)
+
+        # scores from workers leave the models untouched, recalibration gives the same statistics again
+        recalibrate_batch_norm(models[best], calibration_batches)
+        prunner.pruning_residual = candidates[best]["residual"]
+        self._set_pruned_model(models[best], iter_num)
+
+    def _save_ranks(self, path: str):
+        """
+        saves the ranks of every prunable module, written to a temporary file first so concurrent readers never see a
+        partial file
+        """
+        ranks = {i: module.ranking for i, module in self.prunner._prunable_modules_iterator()}
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        torch.save(ranks, tmp_path)
+        os.replace(tmp_path, path)
+
+    def _load_ranks(self, path: str):
+        """
+        loads ranks saved by _save_ranks into the prunable modules
+        """
+        print(f"Loading ranks from {path}")
+        ranks = torch.load(path)
+        for i, module in self.prunner._prunable_modules_iterator():
+            module.ranking = ranks[i].clone()
+        # ranks of modules going into the same elementwise module are shared again
+        self.prunner.equalize_elementwise()
 
     # TODO - add docstring
     def _prune_model(self, num_filters_to_prune, iter_num):
         pruning_targets = self.prunner.get_prunning_plan(num_filters_to_prune)
         filters_to_keep = self.prunner.inverse_pruning_targets(pruning_targets)
-        # out_path = f"pruning_iteration_{iter_num}.cfg"
-        os.makedirs(config["pruning"]["out_path"].get(), exist_ok=True)
-        out_path = os.path.join(config["pruning"]["out_path"].get(), f"pruning_iteration_{iter_num}.cfg")
-        write_pruned_config(self.model.full_cfg, out_path, filters_to_keep)
+        self._set_pruned_model(self._build_pruned_model(filters_to_keep), iter_num)
+
+    def _build_pruned_model(self, filters_to_keep: dict) -> BonsaiModel:
+        """
+        builds the pruned model in memory, holding the kept filters of the current model and their weights
+
+        Args:
+            filters_to_keep: module index to the indices of its kept filters, see AbstractPruner.inverse_pruning_targets
 
+        Returns: the pruned model, on the cpu
+        """
+        new_cfg = pruned_model_cfg(self.model.full_cfg, filters_to_keep)
         self.model.propagate_pruning_targets(filters_to_keep)
-        new_model = BonsaiModel(out_path, self)
+        # all of the new model's weights are loaded from the pruned model, so initializing them is skipped
+        new_model = BonsaiModel(new_cfg, self, empty_init=True).materialize()
+        self._configure_model(new_model)
+        new_model.kept_channels = self.model.kept_channels_after_pruning()
 
         self.model.cpu()
 
@@ -170,9 +649,19 @@ class Bonsai:
         for i, (old_module, new_module) in enumerate(zip(self.model.module_list, new_model.module_list)):
             pruned_state_dict = old_module.prune_weights(final_pruning_targets[i + 1], final_pruning_targets[i])
             new_module.load_state_dict(pruned_state_dict)
+        return new_model
+
+    def _set_pruned_model(self, new_model: BonsaiModel, iter_num):
+        """
+        replaces the current model with its pruned version and writes the pruned config in the background
+        """
+        os.makedirs(config["pruning"]["out_path"].get(), exist_ok=True)
+        out_path = os.path.join(config["pruning"]["out_path"].get(), f"pruning_iteration_{iter_num}.cfg")
+        self.checkpoint_writer.submit(write_model_cfg, new_model.full_cfg, out_path)
 
         self.prunner.reset()
         self.model = new_model
+        self._compiled_model = None
 
     def run_pruning(self, train_dl, val_dl, test_dl, criterion, prune_percent=None, iterations=None):
         """
@@ -198,35 +687,251 @@ class Bonsai:
         if self.prunner is None:
             raise ValueError("you need a prunner object in the Bonsai model to run pruning")
         self.metrics_list = []
+        self.batch_sizes = {}
+        self._batch_size_cache = {}
+        self.profiles = {}
+        self.sensitivity = {}
+        self.exploration = {}
+        self.prunner.layer_caps = {}
+        self.proxy_metrics = {}
+        self._proxy_dl = None
+        self.budget_history = []
+        self.best_iteration = None
         self._metrics["loss"] = BonsaiLoss(criterion)
 
         if prune_percent is None:
             prune_percent = config["pruning"]["prune_percent"].get()
         if iterations is None:
             iterations = config["pruning"]["num_iterations"].get()
-        assert prune_percent * iterations < 1, f"prune_percent * iterations is bigger than entire model, " \
-            f"can't prune that much"
+        # with an accuracy budget the number of iterations is decided by the metric
+        assert config["accuracy_budget"]["enabled"].get() or prune_percent * iterations < 1, \
+            "prune_percent * iterations is bigger than entire model, can't prune that much"
         num_filters_to_prune = int(np.floor(prune_percent * self.model.total_prunable_filters()))
 
         if config["logging"]["use_tensorboard"].get():
+            from torch.utils.tensorboard import SummaryWriter
             self.writer = SummaryWriter(log_dir=config["logging"]["logdir"].get())
 
-        self._eval(test_dl)
+        telemetry_enabled = config["telemetry"]["enabled"].get()
+        self.telemetry.writer = self.writer if telemetry_enabled else None
+        self.telemetry.jsonl_path = None
+        if telemetry_enabled:
+            os.makedirs(config["pruning"]["out_path"].get(), exist_ok=True)
+            self.telemetry.jsonl_path = os.path.join(config["pruning"]["out_path"].get(),
+                                                     config["telemetry"]["jsonl"].get())
 
-        for iteration in range(1, iterations+1):
-            print(iteration)
-            # run ranking engine on val dataset
-            self._rank(val_dl, criterion, iteration)
+        with self.telemetry.phase("eval", 0):
+            self._eval(test_dl)
 
-            # prune model and init optimizer, etc
-            self._prune_model(num_filters_to_prune, iteration)
+        try:
+            if config["accuracy_budget"]["enabled"].get():
+                self._run_budget_pruning(train_dl, val_dl, test_dl, criterion, num_filters_to_prune)
+            else:
+                for iteration in range(1, iterations+1):
+                    self._pruning_step(train_dl, val_dl, test_dl, criterion, num_filters_to_prune, iteration,
+                                       final=iteration == iterations)
+        finally:
+            self.wait_for_checkpoints()
+
+        log_performance(self.metrics_list, self.writer)
+
+        if config["quantization"]["enabled"].get():
+            self.quantize(val_dl, test_dl)
+        elif config["sparsity"]["enabled"].get():
+            self.sparsify(test_dl)
+
+    def _pruning_step(self, train_dl, val_dl, test_dl, criterion, num_filters_to_prune, iteration, final=False):
+        """
+        runs a single pruning iteration: ranking, pruning, fine tuning and evaluation of the pruned model
+        """
+        print(iteration)
+        sensitivity_config = config["sensitivity"]
+        every = sensitivity_config["every"].get()
+        scan = sensitivity_config["enabled"].get() and (iteration == 1 or (every and iteration % every == 0))
+        explore = config["exploration"]["enabled"].get()
+
+        # run ranking engine on val dataset, exploration ranks with every candidate pruner itself
+        if scan or not explore:
+            with self.telemetry.phase("rank", iteration):
+                self._rank(val_dl, criterion, iteration)
+
+        if scan:
+            with self.telemetry.phase("sensitivity", iteration):
+                self._scan_sensitivity(val_dl, criterion, iteration)
+
+        # prune model and init optimizer, etc
+        if explore:
+            with self.telemetry.phase("explore", iteration):
+                self._explore(train_dl, val_dl, criterion, num_filters_to_prune, iteration)
+        else:
+            with self.telemetry.phase("prune", iteration):
+                self._prune_model(num_filters_to_prune, iteration)
+        with self.telemetry.phase("compile", iteration):
+            self._compile(train_dl, val_dl, test_dl, iteration)
 
+        with self.telemetry.phase("finetune", iteration):
             self._finetune(train_dl, val_dl, criterion, iteration)
 
-            # eval performance loss
-            self._eval(test_dl)
+        # eval performance loss
+        with self.telemetry.phase("eval", iteration):
+            self._eval(test_dl, iteration, final=final)
 
-        log_performance(self.metrics_list, self.writer)
+    def _metric_drop(self, baseline: dict) -> float:
+        """
+        Returns: how much worse the budget metric of the last evaluation is than its baseline value
+        """
+        metric_name = config["accuracy_budget"]["metric"].get()
+        drop = baseline[metric_name] - self.last_metrics[metric_name]
+        return drop if config["accuracy_budget"]["higher_is_better"].get() else -drop
+
+    def _run_budget_pruning(self, train_dl, val_dl, test_dl, criterion, num_filters_to_prune):
+        """
+        Prunes until the fine tuned model's metric drops more than accuracy_budget.max_drop below its value before
+        pruning, then rolls back to the last model within the budget. The step that crossed the budget is optionally
+        bisected, retrying smaller steps from the rolled back model, so the final model is the smallest one found within
+        the budget. Every step is recorded in budget_history.
+
+        Args:
+            train_dl: Data loader for the training set.
+            val_dl: Data loader for the validation set.
+            test_dl: Data loader for the test set.
+            criterion: Loss function used in the fine tuning step.
+            num_filters_to_prune: number of neurons to prune in each iteration
+        """
+        budget_config = config["accuracy_budget"]
+        baseline = dict(self.last_metrics)
+        max_drop = budget_config["max_drop"].get()
+        self.budget_history = []
+        good_model, good_iteration = self.model, 0
+
+        def try_step(num_filters, iteration):
+            metrics_count = len(self.metrics_list)
+            self._pruning_step(train_dl, val_dl, test_dl, criterion, num_filters, iteration)
+            drop = self._metric_drop(baseline)
+            accepted = drop <= max_drop
+            self.budget_history.append({"iteration": iteration, "num_filters": num_filters, "metric_drop": drop,
+                                        "accepted": accepted})
+            if self.writer:
+                self.writer.add_scalar("budget/metric_drop", drop, iteration)
+            if not accepted:
+                # rejected models are left out of the performance plots
+                del self.metrics_list[metrics_count:]
+            return accepted
+
+        iteration, crossed = 0, False
+        while iteration < budget_config["max_iterations"].get() and \
+                self.model.total_prunable_filters() > num_filters_to_prune:
+            iteration += 1
+            if not try_step(num_filters_to_prune, iteration):
+                crossed = True
+                break
+            good_model, good_iteration = self.model, iteration
+        if not crossed:
+            self._finish_budget_pruning(good_model, good_iteration, test_dl)
+            return
+
+        # bisect the step size between the last accepted model and the rejected step
+        low, high = 0, num_filters_to_prune
+        best_model, best_iteration = good_model, good_iteration
+        for _ in range(budget_config["bisect_steps"].get()):
+            middle = (low + high) // 2
+            if middle == low:
+                break
+            self._set_model(good_model)
+            iteration += 1
+            if try_step(middle, iteration):
+                low, best_model, best_iteration = middle, self.model, iteration
+            else:
+                high = middle
+        self._finish_budget_pruning(best_model, best_iteration, test_dl)
+
+    def _set_model(self, model: BonsaiModel):
+        self.model = model
+        self._compiled_model = None
+        self.prunner.reset()
+
+    def _finish_budget_pruning(self, model: BonsaiModel, iteration: int, test_dl):
+        """
+        keeps the chosen model of the accuracy budget search, which is fully evaluated if evaluations were done on a
+        subset
+        """
+        self.best_iteration = iteration
+        print(f"Keeping the model of pruning iteration {iteration}")
+        if model is not self.model:
+            self._set_model(model)
+        if config["proxy_eval"]["enabled"].get():
+            self._eval(test_dl, iteration, final=True)
+
+    def quantize(self, calibration_dl, eval_dl=None):
+        """
+        Performs int8 static quantization of the model for CPU inference. The model's modules are fused, observers are
+        calibrated on the given data and the model is converted to int8 in place, after which it can't be pruned
+        anymore. If eval_dl is given, the quantized model is evaluated using the evaluation engine, which logs its
+        metrics and inference time.
+
+        Args:
+            calibration_dl: Data loader used for calibrating the quantization observers, usually the validation set.
+            eval_dl: Data loader for evaluating the quantized model, usually the test set.
+        """
+        print("Quantization")
+        self._compiled_model = None
+        self._batch_size_cache = {}
+        # quantized kernels run only on CPU
+        self.device = torch.device("cpu")
+        prepare_static_quantization(self.model, config["quantization"]["backend"].get())
+
+        calibration_engine = create_supervised_evaluator(self.model, device=self.device)
+        pbar = Progbar(calibration_dl, None)
+        calibration_engine.add_event_handler(Events.ITERATION_COMPLETED, pbar)
+        calibration_engine.run(calibration_dl, 1)
+
+        convert_static_quantization(self.model)
+
+        if eval_dl is not None:
+            self._eval(eval_dl, final=True)
+
+    def sparsify(self, eval_dl=None):
+        """
+        Converts the prunable linear layers of the model to sparse CSR weights with a sparse matmul forward, for layers
+        at least as sparse as the configured min_sparsity. After conversion the model can't be trained or pruned
+        anymore. If eval_dl is given, the sparse model is evaluated using the evaluation engine, which logs its metrics
+        and inference time.
+
+        Args:
+            eval_dl: Data loader for evaluating the sparse model, usually the test set.
+        """
+        print("Sparsification")
+        self._compiled_model = None
+        self._batch_size_cache = {}
+        self.model.cpu()
+        self.device = torch.device("cpu")
+        convert_linear_layers_to_sparse(self.model, config["sparsity"]["min_sparsity"].get())
+
+        if eval_dl is not None:
+            self._eval(eval_dl, final=True)
+
+    def export_pruning_plan(self) -> dict:
+        """
+        Exports the channels kept by all pruning iterations so far, keyed by the names of the original model's modules
+        recorded by bonsai_parser in the model config. The plan can be applied to the original model using
+        bonsai.utils.pruning_plan_utils.apply_pruning_plan.
+
+        Returns: dictionary with original module names as keys, and dictionaries holding the kept "in" and "out"
+        channel / feature indices as values, None where all are kept
+        """
+        plan = {}
+        for module, kept in zip(self.model.module_list, self.model.kept_channels):
+            weight_names = module.module_cfg.get("weight_names")
+            if weight_names is None:
+                continue
+            if not isinstance(weight_names, list):
+                weight_names = [weight_names]
+            if isinstance(module, BBatchNorm2d):
+                # batch normalization keeps the channels of its input
+                kept = {"in": kept["in"], "out": kept["in"]}
+            for weight_name in weight_names:
+                plan[weight_name] = dict(kept)
+        return plan
 
     def attach_handler_to_eval(self, event: Events, handler: Callable, *args, **kwargs):
         """
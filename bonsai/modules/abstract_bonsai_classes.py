@@ -49,9 +49,9 @@ class Prunable(BonsaiModule):
         self.activation = None
         self.grad = None
         if self.module_cfg.get("out_channels"):
-            self.ranking = torch.zeros(self.module_cfg["out_channels"])
+            self.ranking = torch.zeros(self.module_cfg["out_channels"], device="cpu")
         elif self.module_cfg.get("out_features"):
-            self.ranking = torch.zeros(self.module_cfg["out_features"])
+            self.ranking = torch.zeros(self.module_cfg["out_features"], device="cpu")
 
     def forward(self, layer_input):
         raise NotImplementedError
@@ -61,9 +61,9 @@ class Prunable(BonsaiModule):
         self.activation = None
         self.grad = None
         if self.module_cfg.get("out_channels"):
-            self.ranking = torch.zeros(self.module_cfg["out_channels"])
+            self.ranking = torch.zeros(self.module_cfg["out_channels"], device="cpu")
         elif self.module_cfg.get("out_features"):
-            self.ranking = torch.zeros(self.module_cfg["out_features"])
+            self.ranking = torch.zeros(self.module_cfg["out_features"], device="cpu")
 
     def calc_layer_output_size(self, input_size):
         raise NotImplementedError
@@ -1,13 +1,21 @@
 import copy
+import math
+import os
+import tempfile
 import weakref
 from collections import Counter, OrderedDict
-from typing import List
+from itertools import chain
+from typing import List, Tuple
+import numpy as np
 import torch
 from torch import nn
+from torch.utils.checkpoint import checkpoint
 from bonsai.modules.abstract_bonsai_classes import Prunable
 from bonsai.modules.receptive_field_calculation import calc_receptive_field
 from bonsai.modules.factories.bonsai_module_factory import BonsaiFactory
+from bonsai.modules.memory_planner import MemoryPlanner
 from bonsai.modules.model_cfg_parser import basic_model_cfg_parsing
+from bonsai.utils.model_bundle import write_bundle, read_bundle
 
 
 class BonsaiModel(torch.nn.Module):
@@ -16,11 +24,14 @@ class BonsaiModel(torch.nn.Module):
     propagating pruning instructions between different modules.
 
     Args:
-        cfg_path (str): a path to the model config file, look at example models for reference.
+        cfg_path (str or list): a path to the model config file, look at example models for reference. an already
+            parsed config (list of module dictionaries, starting with the hyperparams) is also accepted.
         bonsai : the model's parent Bonsai object
+        empty_init (bool): build the modules on the meta device, without allocating or initializing weights. used when
+            the weights are about to be overwritten, call materialize before loading them.
     """
 
-    def __init__(self, cfg_path, bonsai=None):
+    def __init__(self, cfg_path, bonsai=None, empty_init=False):
         super(BonsaiModel, self).__init__()
         self.bonsai = None
         if bonsai:
@@ -37,17 +48,146 @@ class BonsaiModel(torch.nn.Module):
         self.pruning_targets = []
         self.to_rank = False
 
-        self.full_cfg = basic_model_cfg_parsing(cfg_path)  # type: List[dict]
+        # quantization stubs, set by bonsai.utils.quantization_utils.prepare_static_quantization
+        self.quant = None
+        self.dequant = None
+
+        # activation checkpointing segments as (start, end) module indices, see enable_checkpointing
+        self.checkpoint_segments: List[Tuple[int, int]] = []
+        self._segment_external_layers: List[List[int]] = []
+
+        if isinstance(cfg_path, str):
+            self.full_cfg = basic_model_cfg_parsing(cfg_path)  # type: List[dict]
+        else:
+            self.full_cfg = copy.deepcopy(list(cfg_path))
         self.module_cfgs = copy.deepcopy(self.full_cfg)
         self.hyperparams = self.module_cfgs.pop(0)  # type: dict
 
-        self.module_list: nn.ModuleList = self._create_bonsai_modules()
+        if empty_init and hasattr(torch.device, "__enter__"):
+            with torch.device("meta"):
+                self.module_list: nn.ModuleList = self._create_bonsai_modules()
+        else:
+            self.module_list: nn.ModuleList = self._create_bonsai_modules()
 
         self.output_manager = self._create_output_manager()
 
+        # indices of the original model's channels / features kept at each module input and output after pruning, None
+        # if all of them are kept. see kept_channels_after_pruning
+        self.kept_channels: List[dict] = [{"in": None, "out": None} for _ in self.module_list]
+
     def __call__(self, *args, **kwargs):
         return super().__call__(*args, **kwargs)
 
+    @classmethod
+    def from_torch_module(cls, model: nn.Module, example_input: torch.Tensor, bonsai=None, method=None,
+                          rtol=1e-3, atol=1e-5):
+        """
+        parses a pytorch model into a BonsaiModel and copies its weights, so it can be pruned without retraining.
+        weights are mapped using the weight names recorded by the parser, and the outputs of both models are compared
+        on the example input.
+
+        Args:
+            model: the pytorch model to convert
+            example_input: input tensor used for tracing the model and verifying the outputs
+            bonsai: the model's parent Bonsai object
+            method: graph tracing method, 'fx' or 'jit', None for fx with jit fallback
+            rtol: relative tolerance for the output comparison
+            atol: absolute tolerance for the output comparison
+
+        Returns: BonsaiModel with the weights of the given model
+
+        Raises:
+            ValueError: if the bonsai model outputs don't match the original model outputs
+        """
+        from bonsai.modules.bonsai_parser import bonsai_parser
+        parsed_model = bonsai_parser(model, example_input, method)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cfg_path = os.path.join(tmp_dir, "model.cfg")
+            parsed_model.save_cfg(cfg_path)
+            bonsai_model = cls(cfg_path, bonsai)
+
+        named_modules = dict(model.named_modules())
+        for parsed_module, module in zip(parsed_model.modules[1:], bonsai_model.module_list):
+            for weight_name in parsed_module.weight_names:
+                source = named_modules[weight_name]
+                if isinstance(source, nn.Conv2d):
+                    module.conv2d.load_state_dict(source.state_dict())
+                elif isinstance(source, nn.ConvTranspose2d):
+                    module.deconv2d.load_state_dict(source.state_dict())
+                elif isinstance(source, nn.BatchNorm2d):
+                    module.bn.load_state_dict(source.state_dict())
+                elif isinstance(source, nn.Linear):
+                    module.linear.load_state_dict(source.state_dict())
+        bonsai_model.to(example_input.device)
+
+        was_training = model.training
+        model.eval()
+        bonsai_model.eval()
+        with torch.no_grad():
+            expected = model(example_input)
+            output = bonsai_model(example_input)
+        model.train(was_training)
+
+        if isinstance(expected, torch.Tensor):
+            expected = [expected]
+        if len(output) != len(expected):
+            raise ValueError(f"parsed model has {len(output)} outputs, the original model has {len(expected)}")
+        for i, (x, y) in enumerate(zip(output, expected)):
+            if x.size() != y.size():
+                raise ValueError(f"output {i} of the parsed model has size {tuple(x.size())}, "
+                                 f"expected {tuple(y.size())}")
+            if not torch.allclose(x, y, rtol=rtol, atol=atol):
+                raise ValueError(f"output {i} of the parsed model doesn't match the original model, max difference "
+                                 f"{(x - y).abs().max().item()}")
+        return bonsai_model
+
+    def materialize(self, device="cpu"):
+        """
+        allocates uninitialized storage for a model built with empty_init, its weights should be loaded right after.
+        does nothing for models that already have storage.
+
+        Args:
+            device: device to allocate the weights on
+
+        Returns: the model
+        """
+        if any(tensor.is_meta for tensor in chain(self.parameters(), self.buffers())):
+            self.to_empty(device=device)
+        return self
+
+    def save_bundle(self, path: str):
+        """
+        writes the model config, weights and kept channels to a single bundle file, see bonsai.utils.model_bundle
+
+        Args:
+            path: output file path
+        """
+        write_bundle(path, self.full_cfg, self.state_dict(), {"kept_channels": self.kept_channels})
+
+    @classmethod
+    def from_bundle(cls, path: str, bonsai=None):
+        """
+        loads a model from a bundle file. the modules are built without initialization and their weights are the
+        memory mapped tensors of the bundle when the torch version supports assigning them, otherwise they are copied.
+
+        Args:
+            path: bundle file path
+            bonsai: the model's parent Bonsai object
+
+        Returns: BonsaiModel on cpu
+        """
+        model_cfg, state_dict, metadata = read_bundle(path)
+        model = cls(model_cfg, bonsai, empty_init=True)
+        try:
+            model.load_state_dict(state_dict, assign=True)
+        except TypeError:
+            model.materialize().load_state_dict(state_dict)
+        # modules that ended up without weights in the bundle, e.g. non persistent buffers, still need storage
+        model.materialize()
+        if "kept_channels" in metadata:
+            model.kept_channels = metadata["kept_channels"]
+        return model
+
     def get_bonsai(self):
         """
         Returns: the model's parent Bonsai object
@@ -71,20 +211,74 @@ class BonsaiModel(torch.nn.Module):
         else:
             raise TypeError(f"Model input must be torch.Tensor or List[torch.Tensor], got {type(model_input)}")
 
+        if self.quant is not None:
+            if x is None:
+                model_input = [self.quant(tensor) for tensor in model_input]
+            else:
+                x = model_input = self.quant(x)
+
         output = []
         self.output_manager.reset()
 
-        for i, module in enumerate(self.module_list):
-            if "input" in module.module_cfg.keys():
-                x = module(model_input[module.module_cfg["input"]])
-            else:
-                x = module(x)
-            self.output_manager[module.module_cfg["name"]] = x
-            if module.module_cfg.get("output"):
-                output.append(x)
+        if self.checkpoint_segments and self.training and torch.is_grad_enabled() and not self.to_rank:
+            for (start, end), external_layers in zip(self.checkpoint_segments, self._segment_external_layers):
+                # skip connections coming from previous segments are passed explicitly, for recomputation
+                external = {}
+                for layer_idx in external_layers:
+                    name = self.module_list[layer_idx].module_cfg["name"]
+                    external[name] = self.output_manager.outputs[name]
+                segment_output = checkpoint(self._run_segment, start, end, x, model_input, external,
+                                            use_reentrant=False)
+                x = segment_output[0]
+                output.extend(segment_output[1:])
+        else:
+            for module in self.module_list:
+                x = self._run_module(module, x, model_input)
+                if module.module_cfg.get("output"):
+                    output.append(x)
         self.output_manager.reset()
+
+        if self.dequant is not None:
+            output = [self.dequant(tensor) for tensor in output]
         return output
 
+    def _run_module(self, module, x, model_input):
+        if "input" in module.module_cfg.keys():
+            x = module(model_input[module.module_cfg["input"]])
+        else:
+            x = module(x)
+        self.output_manager[module.module_cfg["name"]] = x
+        return x
+
+    def _run_segment(self, start, end, x, model_input, external):
+        """
+        runs the modules of a single checkpointing segment
+
+        Args:
+            start: index of the segment's first module
+            end: index after the segment's last module
+            x: the segment input
+            model_input: the model input, for modules taking their input directly from it
+            external: outputs of layers before the segment read by the segment's modules, by layer name
+
+        Returns:
+            tuple of the segment output followed by the model outputs produced in the segment
+        """
+        if len(self.output_manager.outputs) != start:
+            # recomputation during backward - the output manager resolves relative layer indices by position, so the
+            # preceding layers are restored, holding only the outputs read by this segment
+            self.output_manager.reset()
+            for module in self.module_list[:start]:
+                name = module.module_cfg["name"]
+                self.output_manager[name] = external.get(name)
+
+        output = []
+        for module in self.module_list[start:end]:
+            x = self._run_module(module, x, model_input)
+            if module.module_cfg.get("output"):
+                output.append(x)
+        return (x, *output)
+
     def _create_bonsai_modules(self) -> nn.ModuleList:
         """
         Iterates over given module configs from the model config file.
@@ -158,6 +352,147 @@ class BonsaiModel(torch.nn.Module):
                 current_target = []
             self.pruning_targets.append(current_target)
 
+    def kept_channels_after_pruning(self) -> List[dict]:
+        """
+        composes the pruning targets set by propagate_pruning_targets with the channels kept by previous pruning
+        iterations, giving the indices of the original model channels kept by the pruned model.
+
+        Returns: for each module, dictionary holding the kept input and output channel indices, None if all are kept
+        """
+        def compose(kept, targets):
+            return list(targets) if kept is None else [kept[i] for i in targets]
+
+        kept_channels = []
+        for i, (module, kept) in enumerate(zip(self.module_list, self.kept_channels)):
+            input_targets, output_targets = self.pruning_targets[i], self.pruning_targets[i + 1]
+            # same rules as BonsaiModule.prune_weights
+            kept_in = compose(kept["in"], input_targets) if input_targets else kept["in"]
+            kept_out = compose(kept["out"], output_targets) if isinstance(module, Prunable) else kept["out"]
+            kept_channels.append({"in": kept_in, "out": kept_out})
+        return kept_channels
+
+    def layer_references(self) -> List[List[int]]:
+        """
+        Returns: for each module, the indices of the layers whose output it reads from the output manager (the inputs of
+        route and residual_add modules), not including the output of the previous module it gets as input
+        """
+        names = [module.module_cfg["name"] for module in self.module_list]
+        references = []
+        for i, module in enumerate(self.module_list):
+            layers = module.module_cfg.get("layers") or []
+            if isinstance(layers, int):
+                layers = [layers]
+            module_references = []
+            for layer in layers:
+                if isinstance(layer, str):
+                    module_references.append(names.index(layer))
+                elif layer < 0:
+                    module_references.append(i + layer)
+                else:
+                    module_references.append(layer)
+            references.append(module_references)
+        return references
+
+    def calc_output_sizes(self, height=None, width=None) -> List:
+        """
+        calculates the output size of every layer for the given input resolution, without changing the model's static
+        output_sizes. Models containing flatten or linear layers only support the resolution they were built with.
+
+        Args:
+            height: input height, if None the static output sizes from the model config are returned
+            width: input width, if None the static output sizes from the model config are returned
+
+        Returns: list of output sizes, starting with the model input size
+        """
+        if height is None or width is None:
+            return list(self.output_sizes)
+
+        static_output_sizes = self.output_sizes
+        # modules look up the sizes of previous layers through the model, same as when the model is built
+        self.output_sizes = [(self.hyperparams.get("in_channels"), height, width)]
+        try:
+            for module in self.module_list:
+                self.output_sizes.append(module.calc_layer_output_size(self.output_sizes[-1]))
+            return self.output_sizes
+        finally:
+            self.output_sizes = static_output_sizes
+
+    def activation_sizes(self, height=None, width=None) -> List[int]:
+        """
+        number of elements in each layer output for a single sample. unknown spatial dimensions count as 1, so pass the
+        input resolution for fully convolutional models.
+
+        Args:
+            height: input height, defaults to the model config height
+            width: input width, defaults to the model config width
+
+        Returns: list of number of elements, one per module
+        """
+        sizes = []
+        for output_size in self.calc_output_sizes(height, width)[1:]:
+            if isinstance(output_size, (tuple, list)):
+                sizes.append(int(np.prod([dim for dim in output_size if dim is not None])))
+            else:
+                sizes.append(int(output_size))
+        return sizes
+
+    def plan_checkpoint_segments(self, num_segments=None, height=None, width=None) -> List[Tuple[int, int]]:
+        """
+        splits the module list into contiguous segments holding roughly equal activation memory, based on the static
+        output sizes.
+
+        Args:
+            num_segments: number of segments, defaults to the square root of the number of modules
+            height: input height used for the memory estimates, defaults to the model config height
+            width: input width used for the memory estimates, defaults to the model config width
+
+        Returns: list of (start, end) module indices of each segment
+        """
+        sizes = self.activation_sizes(height, width)
+        num_modules = len(sizes)
+        if num_segments is None:
+            num_segments = int(round(math.sqrt(num_modules)))
+        num_segments = max(min(num_segments, num_modules), 1)
+        target = sum(sizes) / num_segments
+
+        segments = []
+        start = 0
+        accumulated = 0
+        for i, size in enumerate(sizes):
+            accumulated += size
+            if accumulated >= target and i + 1 < num_modules and len(segments) < num_segments - 1:
+                segments.append((start, i + 1))
+                start = i + 1
+                accumulated = 0
+        segments.append((start, num_modules))
+        return segments
+
+    def enable_checkpointing(self, num_segments=None, height=None, width=None):
+        """
+        enables activation checkpointing during training: each segment's intermediate activations are dropped in the
+        forward pass and recomputed during backward, trading compute for memory. Outputs of earlier layers consumed by
+        route / residual_add modules of a segment are passed into it explicitly, so they are available when the
+        segment is recomputed. Note that batch norm running statistics are updated again when recomputing.
+
+        Args:
+            num_segments: number of checkpointing segments, defaults to the square root of the number of modules
+            height: input height used for the memory estimates, defaults to the model config height
+            width: input width used for the memory estimates, defaults to the model config width
+
+        Returns: None
+        """
+        self.checkpoint_segments = self.plan_checkpoint_segments(num_segments, height, width)
+        references = self.layer_references()
+        self._segment_external_layers = []
+        for start, end in self.checkpoint_segments:
+            external_layers = {layer for module_references in references[start:end]
+                               for layer in module_references if layer < start}
+            self._segment_external_layers.append(sorted(external_layers))
+
+    def disable_checkpointing(self):
+        self.checkpoint_segments = []
+        self._segment_external_layers = []
+
     def calc_receptive_field(self):
         """
         calculates convolutions receptive field at each layer of the model
@@ -167,35 +502,46 @@ class BonsaiModel(torch.nn.Module):
 
     def _create_output_manager(self):
         """
-        static analysis of layers, counting the number of times a layer output is used for memory management
-        Returns:
+        static analysis of layers, counting the number of times a layer output is read by later layers for memory
+        management. outputs which are never read are not kept, and the rest are freed after their last read.
+        Returns: _OutputManager for the model
+        """
+        counter = OrderedDict((module.module_cfg["name"], 0) for module in self.module_list)
+        names = [module.module_cfg["name"] for module in self.module_list]
+        for module_references in self.layer_references():
+            for layer in module_references:
+                counter[names[layer]] += 1
+        return _OutputManager(counter)
 
+    def memory_planner(self):
+        """
+        Returns: bonsai.modules.memory_planner.MemoryPlanner for the model
+        """
+        return MemoryPlanner(self)
 
+    def estimate_peak_memory(self, batch_size, dtype=torch.float32, training=False, height=None, width=None) -> int:
         """
-        counter = OrderedDict()
-        for module_config in self.module_cfgs:
+        estimates the peak activation memory of a forward pass from the static output sizes, see
+        MemoryPlanner.estimate_peak_memory
 
-            if module_config["name"] in counter.keys():
-                counter[module_config["name"]] += 1
-            else:
-                counter[module_config["name"]] = 1
-
-            if "input" in module_config.keys():
-                if isinstance(module_config["input"], int):
-                    name = list(counter.keys())[module_config["input"]]
-                    counter[name] += 1
-                elif isinstance(module_config["input"], str):
-                    counter[module_config["input"]] += 1
-
-            if module_config.get("layers"):
-                for layer in module_config.get("layers"):
-                    if isinstance(layer, int):
-                        name = list(counter.keys())[layer]
-                        counter[name] += 1
-                    elif isinstance(layer, str):
-                        counter[module_config["input"]] += 1
+        Args:
+            batch_size: number of samples in the batch
+            dtype: activations data type
+            training: whether to estimate for a training forward pass, keeping all activations for backward
+            height: input height, defaults to the model config height
+            width: input width, defaults to the model config width
 
-        return _OutputManager(counter)
+        Returns: estimated peak activation memory in bytes
+        """
+        return self.memory_planner().estimate_peak_memory(batch_size, dtype, training, height, width)
+
+    def enable_inplace_activations(self) -> List[int]:
+        """
+        switches activations whose input is not used anywhere else to run in place
+
+        Returns: indices of the modules whose activation was changed
+        """
+        return self.memory_planner().apply_inplace_activations()
 
 
 class _OutputManager:
@@ -206,9 +552,8 @@ class _OutputManager:
         self.outputs = OrderedDict()
 
     def __setitem__(self, key, value):
-        # if isinstance(key, int):
-        #     key = list(self.outputs.keys())[key]
-        self.outputs[key] = value
+        # the key is kept even if the output is never read, relative layer indices are resolved by position
+        self.outputs[key] = value if self.counter.get(key, 0) > 0 else None
 
     def __getitem__(self, item):
         if isinstance(item, int):
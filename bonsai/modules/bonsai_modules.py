@@ -1,6 +1,7 @@
 from typing import Dict, Any
 import torch
 from torch import nn
+from torch.nn.quantized import FloatFunctional
 from itertools import chain
 from bonsai.modules.abstract_bonsai_classes import BonsaiModule, Prunable, Elementwise
 from bonsai.modules.factories.activation_factory import construct_activation_from_config
@@ -229,9 +230,11 @@ class BRoute(BonsaiModule):
         out_channels = sum([bonsai_model.output_channels[layer_i] for layer_i in self.module_cfg["layers"]])
         # pass output channels to next module using bonsai model
         bonsai_model.output_channels.append(out_channels)
+        # functional wrapper allows the concatenation to be quantized, acts as torch.cat otherwise
+        self.functional = FloatFunctional()
 
     def forward(self, layer_input):
-        return torch.cat(tuple(self.get_model().output_manager[i] for i in self.module_cfg["layers"]), dim=1)
+        return self.functional.cat([self.get_model().output_manager[i] for i in self.module_cfg["layers"]], dim=1)
 
     def calc_layer_output_size(self, input_size):
         prev_layers_output_sizes = [self.get_model().output_sizes[i] for i in self.module_cfg["layers"]]
@@ -312,7 +315,11 @@ class BMaxPool2d(BonsaiModule):
 
     def __init__(self, bonsai_model, module_cfg: Dict[str, Any]):
         super(BMaxPool2d, self).__init__(bonsai_model, module_cfg)
-        self.maxpool = call_constructor_with_cfg(nn.MaxPool2d, self.module_cfg)
+        maxpool_cfg = dict(self.module_cfg)
+        # cfg files store ceil_mode as 0 / 1, while max pooling only accepts a bool
+        if "ceil_mode" in maxpool_cfg:
+            maxpool_cfg["ceil_mode"] = bool(maxpool_cfg["ceil_mode"])
+        self.maxpool = call_constructor_with_cfg(nn.MaxPool2d, maxpool_cfg)
         # since max pooling doesn't change the tensor's number of channels, re append previous output channels
         bonsai_model.output_channels.append(bonsai_model.output_channels[-1])
 
@@ -540,12 +547,14 @@ class BElementwiseAdd(Elementwise):
         if module_cfg.get('activation'):
             self.f = construct_activation_from_config(module_cfg)
         bonsai_model.output_channels.append(out_channels)
+        # functional wrapper allows the addition to be quantized, acts as torch.add otherwise
+        self.functional = FloatFunctional()
 
     def forward(self, layer_input):
         layers = self.module_cfg["layers"]
         output = self.get_model().output_manager[layers[0]]
         for layer in layers[1:]:
-            output += self.get_model().output_manager[layer]
+            output = self.functional.add(output, self.get_model().output_manager[layer])
         if self.f:
             output = self.f(output)
         return output
@@ -1,7 +1,10 @@
+import operator
+import warnings
+from bisect import bisect_left
+from collections import OrderedDict, namedtuple
+import torch
 import torch.nn as nn
-
-from tensorflow.python.framework.graph_util_impl import _extract_graph_summary
-import torch.utils.tensorboard._pytorch_graph as pg
+import torch.nn.functional as F
 
 
 class BonsaiParsedModule:
@@ -40,6 +43,9 @@ class BonsaiParsedModule:
         output = f'[{self.type_name}]\n'
         for k, v in self.params.items():
             output += f'{k}={v}\n'
+        if self.weight_names:
+            # names of the original modules, used for mapping weights and pruning plans back to the original model
+            output += f'weight_names={",".join(self.weight_names)}\n'
         return output
 
     def __repr__(self):
@@ -52,16 +58,24 @@ class BonsaiParsedModel:
         Represents a complete pytorch model after parsing
         """
         self.modules = []
+        # weight name to layer index, built lazily and invalidated whenever modules are added
+        self._weight_index = None
 
     # Adding modules to the model
 
     def append_module(self, in_str: str):
         new_module = BonsaiParsedModule(in_str)
         self.modules.append(new_module)
+        self._weight_index = None
 
     def insert_module(self, idx: int, in_str: str):
         new_module = BonsaiParsedModule(in_str)
         self.modules.insert(idx, new_module)
+        self._weight_index = None
+
+    def remove_module(self, idx: int):
+        self.modules.pop(idx)
+        self._weight_index = None
 
     # Adding parameters to the modules
 
@@ -76,6 +90,7 @@ class BonsaiParsedModel:
             raise ValueError(f'Module index {idx} out of bounds for list of length {len(self.modules)}')
         else:
             self.modules[idx].add_weight_name(weight_name)
+            self._weight_index = None
 
     def add_param(self, key, value):
         self.insert_param(-1, key, value)
@@ -101,6 +116,15 @@ class BonsaiParsedModel:
     # Useful for generating route layers
 
     def get_layer_by_weight(self, weight_name):
+        if self._weight_index is None:
+            self._weight_index = {}
+            for i, module in enumerate(self.modules):
+                for weight in module.weight_names:
+                    self._weight_index.setdefault(weight, i)
+        if weight_name in self._weight_index:
+            return self._weight_index[weight_name]
+
+        # partial weight names are matched by scanning
         for i, module in enumerate(self.modules):
             for weight in module.weight_names:
                 if weight_name in weight:
@@ -152,19 +176,22 @@ class BonsaiParsedModel:
             f.write(file_contents)
 
 
-def write_2d_params(layer, bonsai_parsed_model):
+def write_2d_params(layer, bonsai_parsed_model, names=('kernel_size', 'stride', 'padding', 'dilation')):
     """
-    Adding 2d parameters conveniently, e.g. kernel size, stride and more.
+    Adding 2d parameters conveniently, e.g. kernel size, stride and more. Square parameters are written as a single int.
     Args:
         layer: the layer to be added to
-        bonsai_parsed_model:
+        bonsai_parsed_model: parsed model so far, the parameters are added to its last module
+        names: names of the layer attributes to add, attributes the layer doesn't have are skipped
     Returns:
 
     """
-    for var, name in {layer.kernel_size: 'kernel_size',
-                      layer.stride: 'stride',
-                      layer.padding: 'padding',
-                      layer.dilation: 'dilation'}.items():
+    for name in names:
+        var = getattr(layer, name, None)
+        if var is None:
+            continue
+        if type(var) == tuple and len(var) == 2 and var[0] == var[1]:
+            var = var[0]
 
         if type(var) == tuple and len(var) == 2:
             bonsai_parsed_model.add_param(name, str(var)[1:-1])  # removing braces
@@ -218,11 +245,7 @@ def inner_model_parser(model, bonsai_parsed_model, prefix=''):
                 called_prefix = prefix + '.' + layer_name
             inner_model_parser(layer, bonsai_parsed_model, prefix=called_prefix)
 
-        # handling non linear functions
-        elif getattr(type(layer), '__module__') == 'torch.nn.modules.activation':
-            bonsai_parsed_model.add_param('activation', repr(type(layer)).split("\'")[1].split('.')[-1])
-            if type(layer) == nn.LeakyReLU:
-                bonsai_parsed_model.add_param('negative_slope', layer.negative_slope)
+        # non linear functions are attached to the layers they follow in the traced graph, see bonsai_parser
 
         # handling each layer type
         # TODO: add more modules here OR connect to the bonsai factories OR generalize to any module
@@ -236,12 +259,17 @@ def inner_model_parser(model, bonsai_parsed_model, prefix=''):
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
 
             write_2d_params(layer, bonsai_parsed_model)
+            if type(layer) == nn.ConvTranspose2d and any(layer.output_padding):
+                write_2d_params(layer, bonsai_parsed_model, names=('output_padding',))
+                # used by the bonsai module for output size calculation
+                bonsai_parsed_model.add_param('out_padding', layer.output_padding[0])
 
             bonsai_parsed_model.add_param('groups', layer.groups)
+            bonsai_parsed_model.add_param('bias', int(layer.bias is not None))
             # bonsai_parsed_model.add_param('padding_mode', layer.padding_mode) #TBA
 
         elif type(layer) in [nn.MaxPool2d, nn.AvgPool2d]:
-            type_value = ('maxpool', 'avgpool')[type(layer) == nn.AvgPool2d]
+            type_value = ('maxpool', 'avgpool2d')[type(layer) == nn.AvgPool2d]
             bonsai_parsed_model.append_module(type_value)
 
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
@@ -257,33 +285,55 @@ def inner_model_parser(model, bonsai_parsed_model, prefix=''):
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
 
         elif type(layer) in [nn.BatchNorm2d]:
-            bonsai_parsed_model.append_module('batch_normalization2d')
-            bonsai_parsed_model.add_param('num_features', layer.num_features)
+            # folded into the preceding convolution when it directly follows it, see bonsai_parser
+            bonsai_parsed_model.append_module('batchnorm2d')
+            bonsai_parsed_model.add_param('in_channels', layer.num_features)
             bonsai_parsed_model.add_param('eps', layer.eps)
             bonsai_parsed_model.add_param('momentum', layer.momentum)
-            bonsai_parsed_model.add_param('affine', layer.affine)
-            bonsai_parsed_model.add_param('track_running_stats', layer.track_running_stats)
+            bonsai_parsed_model.add_param('affine', int(layer.affine))
+            bonsai_parsed_model.add_param('track_running_stats', int(layer.track_running_stats))
 
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
 
         elif type(layer) in [nn.AdaptiveAvgPool2d]:
             bonsai_parsed_model.append_module('adaptive_avgpool2d')
-            bonsai_parsed_model.add_param('output_size', layer.output_size)
+            output_size = layer.output_size
+            if isinstance(output_size, tuple):
+                output_size = ', '.join(str(x) for x in output_size)
+            bonsai_parsed_model.add_param('output_size', output_size)
 
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
 
         elif type(layer) in [nn.Linear]:
-            bonsai_parsed_model.append_module('linear')
+            bonsai_parsed_model.append_module('prunable_linear')
             bonsai_parsed_model.add_param('in_features', layer.in_features)
             bonsai_parsed_model.add_param('out_features', layer.out_features)
-            bonsai_parsed_model.add_param('bias', layer.bias is not None)
+            bonsai_parsed_model.add_param('bias', int(layer.bias is not None))
 
             bonsai_parsed_model.add_weight_name_by_prefix(layer_name, prefix)
 
 
+# graph node, layer is the parsed layer name for nodes running a parsed layer, operation is Concat, Add or Flatten for
+# nodes that become route, residual_add and flatten modules, and activation is the activation module of nodes applying
+# a non linear function
+GraphNode = namedtuple("GraphNode", ["layer", "operation", "inputs", "activation"])
+
+FX_OPERATIONS = {torch.cat: "Concat", "cat": "Concat",
+                 torch.add: "Add", operator.add: "Add", operator.iadd: "Add", "add": "Add", "add_": "Add",
+                 torch.flatten: "Flatten", "flatten": "Flatten"}
+FX_ACTIVATIONS = {torch.relu: nn.ReLU, F.relu: nn.ReLU, "relu": nn.ReLU, "relu_": nn.ReLU,
+                  torch.sigmoid: nn.Sigmoid, "sigmoid": nn.Sigmoid, torch.tanh: nn.Tanh, "tanh": nn.Tanh}
+JIT_OPERATIONS = {"aten::cat": "Concat", "aten::add": "Add", "aten::add_": "Add", "aten::flatten": "Flatten"}
+JIT_ACTIVATIONS = {"aten::relu": nn.ReLU, "aten::relu_": nn.ReLU, "aten::sigmoid": nn.Sigmoid, "aten::tanh": nn.Tanh}
+
+
+def _is_activation(module):
+    return getattr(type(module), '__module__') == 'torch.nn.modules.activation'
+
+
 def get_node_name(node_str):
     """
-    Gets the weight/node name from the full node name supplied by tensorflow's GraphDef
+    Gets the weight/node name from the full scope name supplied by the jit tracer, e.g. Net/Sequential[layer1]/Conv2d[0]
     Args:
         node_str: the full string name
 
@@ -294,26 +344,159 @@ def get_node_name(node_str):
     return '.'.join(pure_names)
 
 
-def find_real_ancestors(curr_weights, predecessors, real_nodes):
+def _fx_graph(model, layer_names):
+    """
+    Extracts the model's graph connectivity using torch.fx symbolic tracing
+    Args:
+        model: pytorch model to be traced
+        layer_names: names of the parsed layers
+
+    Returns:
+        OrderedDict of GraphNode by node name, in execution order
+    """
+    graph_module = torch.fx.symbolic_trace(model)
+    named_modules = dict(model.named_modules())
+    graph = OrderedDict()
+    for node in graph_module.graph.nodes:
+        layer, operation, activation = None, None, None
+        if node.op == 'call_module':
+            module = named_modules.get(node.target)
+            if node.target in layer_names:
+                layer = node.target
+            elif isinstance(module, nn.Flatten):
+                operation = 'Flatten'
+            elif _is_activation(module):
+                activation = module
+        elif node.op in ['call_function', 'call_method']:
+            operation = FX_OPERATIONS.get(node.target)
+            if node.target in FX_ACTIVATIONS:
+                activation = FX_ACTIVATIONS[node.target]()
+        graph[node.name] = GraphNode(layer, operation, [x.name for x in node.all_input_nodes], activation)
+    return graph
+
+
+def _jit_graph(model, model_in, layer_names):
+    """
+    Extracts the model's graph connectivity using torch.jit tracing, for models symbolic tracing can't handle.
+    All the ops of a parsed layer are merged into a single node.
+    Args:
+        model: pytorch model to be traced
+        model_in: model input
+        layer_names: names of the parsed layers
+
+    Returns:
+        OrderedDict of GraphNode by node name, in execution order
+    """
+    # tracing runs the model, evaluation mode keeps the batch norm statistics untouched
+    was_training = model.training
+    model.eval()
+    try:
+        traced = torch.jit.trace(model, (model_in,), check_trace=False)
+    finally:
+        model.train(was_training)
+    named_modules = dict(model.named_modules())
+    graph = OrderedDict()
+    producers = {}
+    for i, node in enumerate(traced.inlined_graph.nodes()):
+        kind = node.kind()
+        if kind == 'prim::Constant':
+            continue
+        inputs = [key for value in node.inputs() for key in producers.get(value.debugName(), [])]
+        if kind in ['prim::ListConstruct', 'prim::TupleConstruct']:
+            # tensor lists are resolved to their items, keeping their order for concatenation
+            for value in node.outputs():
+                producers[value.debugName()] = inputs
+            continue
+
+        scope = node.scopeName().split('/')[-1]
+        scope = get_node_name(scope) if '[' in scope else scope.replace('__module.', '')
+        layer = scope if scope in layer_names else None
+        key = layer if layer is not None else f'{kind}_{i}'
+        if key in graph:
+            # another op of the same layer, the layer is moved to its latest position in execution order
+            inputs = graph.pop(key).inputs + inputs
+
+        activation = None
+        if layer is None and _is_activation(named_modules.get(scope)):
+            activation = named_modules[scope]
+        elif layer is None and kind in JIT_ACTIVATIONS:
+            activation = JIT_ACTIVATIONS[kind]()
+        operation = JIT_OPERATIONS.get(kind) if layer is None else None
+        graph[key] = GraphNode(layer, operation, [x for x in inputs if x != key], activation)
+        for value in node.outputs():
+            producers[value.debugName()] = [key]
+
+    outputs = [key for value in traced.inlined_graph.outputs() for key in producers.get(value.debugName(), [])]
+    graph['output'] = GraphNode(None, None, outputs, None)
+    return graph
+
+
+def trace_graph(model, model_in, layer_names, method=None):
+    """
+    Extracts the model's graph connectivity, using torch.fx symbolic tracing and falling back to torch.jit tracing for
+    models with data dependent control flow
+    Args:
+        model: pytorch model to be traced
+        model_in: model input
+        layer_names: names of the parsed layers
+        method: 'fx' or 'jit' to force a tracing method, None for fx with jit fallback
+
+    Returns:
+        OrderedDict of GraphNode by node name, in execution order
     """
-    A recursive function that replaces a layer's parents in the graph with real layers,
-    instead of intermediate tensor names.
+    if method == 'jit':
+        return _jit_graph(model, model_in, layer_names)
+    try:
+        return _fx_graph(model, layer_names)
+    except Exception as e:
+        if method == 'fx':
+            raise
+        warnings.warn(f'symbolic tracing failed ({e}), falling back to torch.jit.trace')
+        return _jit_graph(model, model_in, layer_names)
+
+
+def _resolve_intermediate(node, predecessors, real_nodes, memo):
+    """
+    Resolves the real ancestors of an intermediate node iteratively, storing them in memo for every intermediate node
+    visited on the way. Nodes without predecessors, such as the model input, have no real ancestors.
+    """
+    stack = [node]
+    while stack:
+        current = stack[-1]
+        if current in memo:
+            stack.pop()
+            continue
+        pending = [x for x in predecessors.get(current, []) if x not in real_nodes and x not in memo]
+        if pending:
+            stack.extend(pending)
+            continue
+        stack.pop()
+        memo[current] = [ancestor for x in predecessors.get(current, [])
+                         for ancestor in ([x] if x in real_nodes else memo[x])]
+
+
+def find_real_ancestors(curr_weights, predecessors, real_nodes, memo=None):
+    """
+    Replaces a layer's parents in the graph with real layers, instead of intermediate tensor names.
     Args:
         curr_weights: current weights left to be processed
         predecessors: the graph connections
-        real_nodes: list of real layer names
+        real_nodes: set of real layer names
+        memo: real ancestors of intermediate nodes resolved so far, shared between calls on the same graph
 
     Returns:
         A list of weight names that relate to 'real' layers
     """
-    if len(curr_weights) == 0:
-        return []
-    elif curr_weights[0] in real_nodes:
-        return [curr_weights[0]] + find_real_ancestors(curr_weights[1:], predecessors, real_nodes)
-    else:
-        curr_weights = predecessors[curr_weights[0]] + curr_weights[1:]
-
-        return find_real_ancestors(curr_weights, predecessors, real_nodes)
+    if memo is None:
+        memo = {}
+    real_ancestors = []
+    for weight in curr_weights:
+        if weight in real_nodes:
+            real_ancestors.append(weight)
+        else:
+            _resolve_intermediate(weight, predecessors, real_nodes, memo)
+            real_ancestors.extend(memo[weight])
+    return real_ancestors
 
 
 def get_real_predecessors(predecessors, real_nodes):
@@ -321,23 +504,45 @@ def get_real_predecessors(predecessors, real_nodes):
     Replace intermediate value predecessors with real ancestor layers that represent graph connectivity truthfully
     Args:
         predecessors: graph connections
-        real_nodes: list of real layer names
+        real_nodes: set of real layer names
 
     Returns:
          A list of weight names that relate to 'real' layers
     """
-    real_prevs = {weight: [] for weight, _ in predecessors.items()}
-    for weight, prev_weights in predecessors.items():
-        real_prevs[weight] = find_real_ancestors(prev_weights, predecessors, real_nodes)
-    return real_prevs
+    memo = {}
+    return {weight: find_real_ancestors(prev_weights, predecessors, real_nodes, memo)
+            for weight, prev_weights in predecessors.items()}
 
 
-def bonsai_parser(model, model_in):
+def _fold_batch_norms(bonsai_parsed_model, graph, real_predecessors):
+    """
+    Folds batch normalization layers into the convolution parsed right before them, if they run on its output
+    """
+    for k, node in graph.items():
+        if node.layer is None or len(real_predecessors[k]) != 1:
+            continue
+        idx = bonsai_parsed_model.get_layer_by_weight(node.layer)
+        ancestor = graph[real_predecessors[k][0]]
+        if bonsai_parsed_model.modules[idx].type_name != 'batchnorm2d' or ancestor.layer is None:
+            continue
+        conv_idx = bonsai_parsed_model.get_layer_by_weight(ancestor.layer)
+        conv = bonsai_parsed_model.modules[conv_idx]
+        if conv_idx == idx - 1 and conv.type_name in ['prunable_conv2d', 'prunable_deconv2d'] and \
+                'batch_normalize' not in conv.params:
+            conv.add('batch_normalize', 1)
+            conv.add_weight_name(node.layer)
+            bonsai_parsed_model.remove_module(idx)
+
+
+def bonsai_parser(model, model_in, method=None):
     """
-    Full parsing function, handling the route layers
+    Full parsing function, handling the route layers. Modules are kept in the model's registration order, and the
+    route, residual_add and flatten modules are inserted after the last layer executed before them. Layers that don't
+    read the output of the module before them get a route to their input, so the config can be built by BonsaiModel.
     Args:
         model: pytorch model to be processed
         model_in: model input
+        method: graph tracing method, 'fx' or 'jit', None for fx with jit fallback
 
     Returns:
         A complete BonsaiParsedModel
@@ -347,47 +552,104 @@ def bonsai_parser(model, model_in):
     bonsai_parsed_model = parse_simple_model(model, model_in.size())
 
     # Getting the graph that represents the underlying network connectivity
-    gd = pg.graph(model, args=(model_in,))
-    name_to_input_name, name_to_node, name_to_seq_num = _extract_graph_summary(gd[0])
-
-    # Convert node numbers to their short weight name
-    graph_layers_to_weights = {get_node_name(k):v for k,v in name_to_seq_num.items()}
-
-    # Route layers
-    route_layers = {k: v.op.split('::')[1] for k,v in name_to_node.items() if v.op in ['onnx::Concat', 'onnx::Add']}
-    route_weight_names = [get_node_name(x) for x in route_layers]
+    layer_names = set(bonsai_parsed_model.get_weight_names())
+    graph = trace_graph(model, model_in, layer_names, method)
+    positions = {k: i for i, k in enumerate(graph)}
 
-    # matching node (full name, node shortened name, and previous nodes connected by the graph)
-    raw_predecessors = {(k, get_node_name(k)): [get_node_name(x) for x in in_names_list] for k, in_names_list in name_to_input_name.items()}
-
-    # removing duplicates and empty strings
-    predecessors = {weight: list(set([x for x in weight_list if len(x) > 0])) for (name, weight), weight_list in raw_predecessors.items()}
+    # Graph operations added as modules, concatenations and additions of at least two tensors and flattening
+    op_nodes = [k for k, node in graph.items()
+                if node.operation == 'Flatten' or (node.operation is not None and len(node.inputs) > 1)]
+    op_set = set(op_nodes)
+    layer_nodes = [k for k, node in graph.items() if node.layer is not None]
 
     # removing nodes that are intermediate values, they dont correspond to graph layers
-    real_nodes = list(set(bonsai_parsed_model.get_weight_names())) + route_weight_names
-    real_predecessors = get_real_predecessors(predecessors.copy(), real_nodes)
-
-    # getting the relevant layers for the routing computation
-    route_real_predecessors = {k:v for k,v in real_predecessors.items() if k in route_weight_names}
-    route_predecessors_layers = {k:bonsai_parsed_model.get_layers_by_weights(v) for k,v in route_real_predecessors.items()}
-
-    # computing the layer number of the generated route layer
-    # here we set it to be 1 after the node that is previous to it in the GraphDef graph
-    graph_connection = {graph_layers_to_weights[k]: [graph_layers_to_weights[x] for x in v] for k, v in route_real_predecessors.items()}
-    prev_index = {k: v.index(int(k)-1) for k, v in graph_connection.items()}
-    res_layers = {v[prev_index[graph_layers_to_weights[k]]] + 1: v for k, v in route_predecessors_layers.items()}
+    predecessors = {k: node.inputs for k, node in graph.items()}
+    real_nodes = set(layer_nodes) | op_set
+    memo = {}
+    real_predecessors = {k: find_real_ancestors(predecessors[k], predecessors, real_nodes, memo)
+                         for k in layer_nodes + op_nodes}
+
+    _fold_batch_norms(bonsai_parsed_model, graph, real_predecessors)
+
+    def layer_index(k):
+        return bonsai_parsed_model.get_layer_by_weight(graph[k].layer)
+
+    # computing the layer number of the generated modules
+    # here we set it to be 1 after the last layer executed before it, modules sharing it keep execution order
+    sort_keys = {}
+    last_layer = 0
+    for k, node in graph.items():
+        if node.layer is not None:
+            last_layer = layer_index(k)
+        elif k in op_set:
+            sort_keys[k] = (last_layer, positions[k])
+
+    # routing the input of layers that don't read the previous module's output
+    input_routes = {}
+    for k in layer_nodes:
+        idx = layer_index(k)
+        if len(real_predecessors[k]) != 1 or idx == 1:
+            continue
+        ancestor = real_predecessors[k][0]
+        if ancestor not in op_set and layer_index(ancestor) == idx:
+            # a batch normalization folded into its convolution
+            continue
+        preceding_ops = [op for op in op_nodes if sort_keys[op][0] == idx - 1 and positions[op] < positions[k]]
+        if preceding_ops:
+            previous = max(preceding_ops, key=sort_keys.get)
+            reads_previous = ancestor == previous
+        else:
+            reads_previous = ancestor not in op_set and layer_index(ancestor) == idx - 1
+        if not reads_previous:
+            route = f'{k}_input'
+            input_routes[route] = ancestor
+            real_predecessors[route] = [ancestor]
+            sort_keys[route] = (idx - 1, positions[k] - 0.5)
 
     # keeping in mind that layer indices shift when we add new layers
-    shifted_values = {k: [val + len([x for x in res_layers if int(x) < int(val)]) for val in v] for k, v in res_layers.items()}
-    final_layers = {int(k) + len([x for x in shifted_values if int(x) < int(k)]): v for k, v in shifted_values.items()}
-
-    # adding the layers to the model
-    for (k, v), operation in zip(final_layers.items(), route_layers.values()):
-        if operation == 'Concat':
-            bonsai_parsed_model.insert_module(int(k), 'route')
-            bonsai_parsed_model.insert_param(int(k), 'layers', str(v))
-        elif operation == 'Add':
-            bonsai_parsed_model.insert_module(int(k), 'residual_add')
-            bonsai_parsed_model.insert_param(int(k), 'layers', str(v))
+    ordered_nodes = sorted(sort_keys, key=sort_keys.get)
+    final_index = {k: sort_keys[k][0] + 1 + i for i, k in enumerate(ordered_nodes)}
+    sorted_anchors = [sort_keys[k][0] for k in ordered_nodes]
+
+    def shifted_layer(k):
+        if k in final_index:
+            return final_index[k]
+        layer = layer_index(k)
+        return layer + bisect_left(sorted_anchors, layer)
+
+    # layer numbers are computed before adding any module, since adding shifts the parsed layers
+    relative_layers = {k: [shifted_layer(ancestor) - final_index[k] for ancestor in real_predecessors[k]]
+                       for k in ordered_nodes}
+    activations = {}
+    for k, node in graph.items():
+        if node.activation is not None:
+            ancestors = find_real_ancestors(node.inputs, predecessors, real_nodes, memo)
+            if len(ancestors) == 1:
+                activations.setdefault(shifted_layer(ancestors[0]), node.activation)
+    # the last graph node returns the model outputs
+    output_ancestors = find_real_ancestors(predecessors[next(reversed(graph))], predecessors, real_nodes, memo)
+    output_layers = [shifted_layer(k) for k in output_ancestors]
+
+    # adding the modules to the model
+    for k in ordered_nodes:
+        operation = 'Concat' if k in input_routes else graph[k].operation
+        type_name = {'Concat': 'route', 'Add': 'residual_add', 'Flatten': 'flatten'}[operation]
+        bonsai_parsed_model.insert_module(final_index[k], type_name)
+        if operation != 'Flatten':
+            bonsai_parsed_model.insert_param(final_index[k], 'layers',
+                                             ', '.join(str(layer) for layer in relative_layers[k]))
+
+    for idx, activation in activations.items():
+        bonsai_parsed_model.insert_param(idx, 'activation', type(activation).__name__)
+        if type(activation) == nn.LeakyReLU:
+            bonsai_parsed_model.insert_param(idx, 'negative_slope', activation.negative_slope)
+
+    # the last layer with weights keeps its size, the rest can be pruned
+    for module in reversed(bonsai_parsed_model.modules):
+        if module.type_name.startswith('prunable_'):
+            module.type_name = module.type_name[len('prunable_'):]
+            break
+    for idx in output_layers:
+        bonsai_parsed_model.insert_param(idx, 'output', 1)
 
     return bonsai_parsed_model
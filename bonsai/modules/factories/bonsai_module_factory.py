@@ -34,6 +34,7 @@ BonsaiFactory.register_new_creator('prunable_deconv2d', PBDeconv2d)
 BonsaiFactory.register_new_creator('route', BRoute)
 BonsaiFactory.register_new_creator('maxpool', BMaxPool2d)
 BonsaiFactory.register_new_creator('avgpool2d', BAvgPool2d)
+BonsaiFactory.register_new_creator('adaptive_avgpool2d', BGlobalAvgPool)
 BonsaiFactory.register_new_creator('pixel_shuffle', BPixelShuffle)
 BonsaiFactory.register_new_creator('flatten', BFlatten)
 BonsaiFactory.register_new_creator('linear', BLinear)
@@ -0,0 +1,125 @@
+"""
+Static activation memory planning for Bonsai models, based on the layer output sizes calculated when the model is built
+and on which layers read each output (see BonsaiModel.layer_references).
+"""
+from typing import List, Tuple
+import torch
+from bonsai.modules.abstract_bonsai_classes import Prunable
+from bonsai.modules.bonsai_modules import BElementwiseAdd, BBatchNorm2d
+
+
+class MemoryPlanner:
+    """
+    Computes the live range of each layer output, the peak activation memory of the model and which activations can
+    safely run in place.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to plan for
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def live_ranges(self) -> List[Tuple[int, int]]:
+        """
+        Returns: for each module, a tuple of (index of the module producing the output, index of the last module using
+        it). model outputs are used until the end of the forward pass, marked by the number of modules.
+        """
+        num_modules = len(self.model.module_list)
+        last_use = [min(i + 1, num_modules - 1) for i in range(num_modules)]
+        for i, module_references in enumerate(self.model.layer_references()):
+            for layer in module_references:
+                last_use[layer] = max(last_use[layer], i)
+        for i, module in enumerate(self.model.module_list):
+            if module.module_cfg.get("output"):
+                last_use[i] = num_modules
+        return [(i, last) for i, last in enumerate(last_use)]
+
+    @staticmethod
+    def _num_intermediates(module) -> int:
+        """
+        Returns: number of tensors in the size of the module output created by the module's forward
+        """
+        num_intermediates = 1
+        if getattr(module, "bn", None) is not None and not isinstance(module, BBatchNorm2d):
+            num_intermediates += 1
+        f = getattr(module, "f", None)
+        if f is not None and not getattr(f, "inplace", False):
+            num_intermediates += 1
+        return num_intermediates
+
+    def estimate_peak_memory(self, batch_size: int, dtype: torch.dtype = torch.float32, training: bool = False,
+                             height: int = None, width: int = None) -> int:
+        """
+        estimates the peak activation memory of a forward pass, not including the model weights.
+        In inference, outputs are freed after their last use, as done by the model's output manager.
+        In training, every intermediate activation is kept for the backward pass.
+
+        Args:
+            batch_size: number of samples in the batch
+            dtype: activations data type
+            training: whether to estimate for a training forward pass
+            height: input height, defaults to the model config height
+            width: input width, defaults to the model config width
+
+        Returns: estimated peak activation memory in bytes
+        """
+        element_size = torch.tensor([], dtype=dtype).element_size()
+        output_sizes = self.model.calc_output_sizes(height, width)
+        sizes = [size * batch_size * element_size for size in self.model.activation_sizes(height, width)]
+        in_c, in_h, in_w = output_sizes[0]
+        model_input = (in_c or 1) * (in_h or 1) * (in_w or 1) * batch_size * element_size
+        intermediates = [self._num_intermediates(module) for module in self.model.module_list]
+
+        if training:
+            return model_input + sum(size * num for size, num in zip(sizes, intermediates))
+
+        # difference array over the forward steps, each output is live from its creation until its last use
+        num_modules = len(sizes)
+        live_delta = [0] * (num_modules + 2)
+        for (first, last), size in zip(self.live_ranges(), sizes):
+            live_delta[first] += size
+            live_delta[last + 1] -= size
+
+        peak = 0
+        live = 0
+        for step in range(num_modules):
+            live += live_delta[step]
+            # the input of the step is alive until it returns, along with the module's temporary tensors
+            step_input = model_input if step == 0 else 0
+            temporary = sizes[step] * (intermediates[step] - 1)
+            peak = max(peak, live + step_input + temporary)
+        return peak
+
+    def inplace_safe_modules(self) -> List[int]:
+        """
+        finds the modules whose activation can run in place. the activation input must be a tensor created inside the
+        module and consumed only by the activation - the output of batch normalization or of an elementwise addition.
+        the pre-activation output of prunable layers without batch normalization is kept for rank calculation, so it
+        can't be overwritten.
+
+        Returns: indices of modules whose activation can be switched to in place
+        """
+        safe_modules = []
+        for i, module in enumerate(self.model.module_list):
+            f = getattr(module, "f", None)
+            if f is None or not hasattr(f, "inplace"):
+                continue
+            if isinstance(module, (BElementwiseAdd, BBatchNorm2d)):
+                safe_modules.append(i)
+            elif getattr(module, "bn", None) is not None:
+                safe_modules.append(i)
+            elif hasattr(module, "bn") and not isinstance(module, Prunable):
+                safe_modules.append(i)
+        return safe_modules
+
+    def apply_inplace_activations(self) -> List[int]:
+        """
+        switches every activation found safe by inplace_safe_modules to run in place
+
+        Returns: indices of the modules whose activation was changed
+        """
+        safe_modules = self.inplace_safe_modules()
+        for i in safe_modules:
+            self.model.module_list[i].f.inplace = True
+        return safe_modules
@@ -2,11 +2,14 @@
 Utils for reading, parsing and writing model configuration files. Used for writing the pruned models instructions
 """
 
+import copy
 from typing import List
 from bonsai.modules.errors import ModuleConfigError
 
 
 GLOBAL_MODULE_CFGS = ["type", "name", "output"]
+# module names aren't converted to numbers, nested module names such as 0.10 would change
+STRING_MODULE_CFGS = ["weight_names"]
 
 
 def basic_model_cfg_parsing(path: str) -> List[dict]:
@@ -26,9 +29,14 @@ def basic_model_cfg_parsing(path: str) -> List[dict]:
             module_defs[-1]['type'] = line[1:-1].replace(" ", "")
         else:
             key, value = line.split("=")
+            key = key.replace(" ", "")
             value = value.replace(" ", "")
-            value = _convert_module_cfg_value(value)
-            module_defs[-1][key.replace(" ", "")] = value
+            if key in STRING_MODULE_CFGS:
+                value = value.split(",")
+                value = value[0] if len(value) == 1 else value
+            else:
+                value = _convert_module_cfg_value(value)
+            module_defs[-1][key] = value
     return module_defs
 
 
@@ -78,26 +86,47 @@ def validate_model_cfg(model_cfg: List[dict]) -> None:
                 raise ModuleConfigError("'conv2d' or similar layer after 'linear' or 'flatten' is not supported yet")
 
 
-def write_pruned_config(full_cfg: List[dict], output_path: str, pruning_targets: dict):
+def pruned_model_cfg(full_cfg: List[dict], pruning_targets: dict) -> List[dict]:
     """
-    After each pruning stage, write the pruned model configuration so it could be used for next iteration or by user.
+    creates the pruned model configuration in memory, so the pruned model can be built without waiting for it to be
+    written
     Args:
         full_cfg: The old model configuration.
-        output_path: where to write the new model's configuration
         pruning_targets: dictionary with the current iterations pruning targets.
 
+    Returns: list of dictionaries, the new model's configuration
+    """
+    new_cfg = copy.deepcopy(full_cfg)
+    first_pruned = min(pruning_targets.keys(), default=None)
+    for i, block in enumerate(new_cfg[1:]):
+        if i in pruning_targets.keys():
+            for k in ("out_channels", "out_features"):
+                if k in block:
+                    block[k] = len(pruning_targets[i])
+        # inputs of layers after a pruned layer are taken from the previous layer's output when the model is built
+        if first_pruned is not None and i > first_pruned:
+            block.pop("in_channels", None)
+            block.pop("in_features", None)
+    return new_cfg
+
+
+def write_model_cfg(model_cfg: List[dict], output_path: str):
+    """
+    writes a model configuration to a config file, which can be parsed back with basic_model_cfg_parsing
+    Args:
+        model_cfg: list of dictionaries containing modules parameters
+        output_path: where to write the model's configuration
+
     Returns: None
     """
     write_layer_num = False
     with open(output_path, 'w')as f:
-        for i, block in enumerate(full_cfg):
+        for i, block in enumerate(model_cfg):
             if write_layer_num:
                 f.write(f"#{i - 1}\n")
             for k, v in block.items():
                 if k == 'type':
                     f.write('[' + v + ']')
-                elif (k == 'out_channels' or k == 'out_features') and i - 1 in pruning_targets.keys():
-                    f.write(k + '=' + str(len(pruning_targets[i - 1])))
                 else:
                     if isinstance(v, list):
                         f.write(k + "=" + ",".join(str(x) for x in v))
@@ -106,3 +135,16 @@ def write_pruned_config(full_cfg: List[dict], output_path: str, pruning_targets:
                 f.write('\n')
             f.write('\n')
             write_layer_num = True
+
+
+def write_pruned_config(full_cfg: List[dict], output_path: str, pruning_targets: dict):
+    """
+    After each pruning stage, write the pruned model configuration so it could be used for next iteration or by user.
+    Args:
+        full_cfg: The old model configuration.
+        output_path: where to write the new model's configuration
+        pruning_targets: dictionary with the current iterations pruning targets.
+
+    Returns: None
+    """
+    write_model_cfg(pruned_model_cfg(full_cfg, pruning_targets), output_path)
@@ -28,6 +28,8 @@ class AbstractPruner:
         self.bonsai = weakref.ref(bonsai)
         self.normalize = normalize
         self.pruning_residual = 0
+        # module index to the largest fraction of its filters pruned in a single iteration, see pruning.sensitivity
+        self.layer_caps = {}
 
     def _get_bonsai(self):
         return self.bonsai()
@@ -83,8 +85,13 @@ class AbstractPruner:
 
     def compute_model_ranks(self, _=None):
         for _, module in self._prunable_modules_iterator():
+            # ranks are accumulated in fp32 even if the ranking forward / backward ran under reduced precision autocast
+            if module.activation is not None:
+                module.activation = module.activation.float()
+            if module.grad is not None:
+                module.grad = module.grad.float()
             layer_current_ranks = self.compute_single_layer_ranks(module)
-            module.ranking += layer_current_ranks.cpu()
+            module.ranking += layer_current_ranks.float().cpu()
 
     @staticmethod
     def _normalize_filter_ranks_per_layer(module: Prunable):
@@ -168,14 +175,21 @@ class AbstractPruner:
         print("pruning residual", self.pruning_residual)
         data = []
         for i, module in self._prunable_modules_iterator():
-            for j, rank in enumerate(module.ranking):
-                data.append((i, j, rank))
+            module_data = [(i, j, rank) for j, rank in enumerate(module.ranking)]
+            if i in self.layer_caps:
+                # only the lowest ranking filters within the layer's cap are candidates
+                module_data = sorted(module_data, key=lambda x: x[2])[:int(self.layer_caps[i] * len(module_data))]
+            data += module_data
         data = sorted(data, key=lambda x: x[2])
         ranks = np.array([x[2] for x in data])
         desired_num_to_prune = num_filters_to_prune - self.pruning_residual
+        if desired_num_to_prune >= len(data):
+            # the caps leave fewer candidates than requested
+            self.pruning_residual = 0
+            return data
         max_prunable_rank = ranks[desired_num_to_prune]
         ranks_mask = ranks <= max_prunable_rank
-        current_num_filters_to_prune = sum(ranks_mask)
+        current_num_filters_to_prune = int(ranks_mask.sum())
         self.pruning_residual = current_num_filters_to_prune - desired_num_to_prune
 
         return data[:current_num_filters_to_prune]
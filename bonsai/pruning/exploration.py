@@ -0,0 +1,153 @@
+"""
+Exploration of several pruning plans per pruning iteration. Candidate plans differ in the pruner, the ranks
+normalization and a uniform per layer cap. Every candidate model is built in memory and scored cheaply, by recalibrating
+its batch norm statistics on a few training batches and evaluating it on a few validation batches, so only the best
+candidate has to be fine tuned. Candidates are scored in forked worker processes, sharing the models and batches with
+the parent copy-on-write.
+"""
+import itertools
+import multiprocessing
+import warnings
+from typing import Dict, Iterable, List, Optional, Sequence
+import torch
+from torch import nn
+from bonsai.pruning.sensitivity import evaluate_batches
+
+# candidate models, batches and metrics of the running scoring, set before forking so workers inherit them
+_scoring_state = None
+
+
+def pruner_class(name: Optional[str], default: type) -> type:
+    """
+    Args:
+        name: name of a pruner class in bonsai.pruning, e.g. ActivationL2Prunner
+        default: class returned for name None
+
+    Returns: the pruner class
+    """
+    if name is None:
+        return default
+    import bonsai.pruning
+    pruner = getattr(bonsai.pruning, name, None)
+    if not isinstance(pruner, type):
+        raise ValueError(f"unknown pruner {name}")
+    return pruner
+
+
+def candidate_grid(pruners: Sequence[Optional[str]], normalize: Sequence[bool],
+                   caps: Sequence[Optional[float]]) -> List[dict]:
+    """
+    Returns: a dictionary of pruner, normalize and cap for every combination of the settings
+    """
+    return [{"pruner": pruner, "normalize": norm, "cap": cap}
+            for pruner, norm, cap in itertools.product(pruners, normalize, caps)]
+
+
+def merge_caps(layer_caps: Dict[int, float], module_indices: Iterable[int], cap: Optional[float]) -> Dict[int, float]:
+    """
+    combines per layer caps, e.g. from a sensitivity scan, with a uniform cap applied to every prunable module
+
+    Args:
+        layer_caps: module index to cap
+        module_indices: indices of all prunable modules
+        cap: uniform cap, None for no uniform cap
+
+    Returns: module index to the tighter of the two caps
+    """
+    if cap is None:
+        return dict(layer_caps)
+    return {i: min(layer_caps.get(i, 1.), cap) for i in module_indices}
+
+
+def recalibrate_batch_norm(model: nn.Module, batches: list, device="cpu"):
+    """
+    re-estimates the running statistics of every batch norm layer as their average over the batches. Pruning shifts
+    the statistics of the layers following pruned ones, and recalibrating them recovers much of the lost accuracy
+    without any training. Other parameters are unchanged and the model's training mode is restored.
+
+    Args:
+        model: the model
+        batches: list of (x, y) batches
+        device: device the batches are moved to
+    """
+    batch_norms = [module for module in model.modules() if isinstance(module, nn.modules.batchnorm._BatchNorm)]
+    if not batch_norms or not batches:
+        return
+    momenta = [batch_norm.momentum for batch_norm in batch_norms]
+    for batch_norm in batch_norms:
+        batch_norm.reset_running_stats()
+        # a momentum of None keeps a cumulative average
+        batch_norm.momentum = None
+    was_training = model.training
+    model.train()
+    try:
+        with torch.no_grad():
+            for x, _ in batches:
+                model(x.to(device))
+    finally:
+        for batch_norm, momentum in zip(batch_norms, momenta):
+            batch_norm.momentum = momentum
+        model.train(was_training)
+
+
+def _score(index: int) -> Dict[str, float]:
+    models, calibration_batches, eval_batches, metrics, device = _scoring_state
+    model = models[index].to(device)
+    try:
+        recalibrate_batch_norm(model, calibration_batches, device)
+        model.eval()
+        return evaluate_batches(model, eval_batches, metrics, device)
+    finally:
+        model.cpu()
+
+
+def _init_worker():
+    # workers run side by side, intra op threads would only oversubscribe the cores
+    torch.set_num_threads(1)
+
+
+def score_candidates(models: List[nn.Module], calibration_batches: list, eval_batches: list, metrics: dict,
+                     device="cpu", num_workers: int = 0) -> List[Dict[str, float]]:
+    """
+    scores candidate models by recalibrating their batch norm statistics and evaluating them. Models scored in the
+    main process keep their recalibrated statistics, models scored by workers are unchanged.
+
+    Worker processes are forked, so they need the fork start method and a cpu device, otherwise the candidates are
+    scored in the main process.
+
+    Args:
+        models: candidate models, on the cpu
+        calibration_batches: list of (x, y) batches for the batch norm statistics
+        eval_batches: list of (x, y) batches the candidates are evaluated on
+        metrics: metric name to ignite Metric
+        device: device the candidates are scored on
+        num_workers: number of worker processes, 0 to score in the main process
+
+    Returns: metric name to value for every candidate
+    """
+    global _scoring_state
+    device = torch.device(device)
+    if num_workers > 0 and device.type == "cuda":
+        warnings.warn("candidate scoring workers need a cpu device, scoring in the main process")
+        num_workers = 0
+    if num_workers > 0 and "fork" not in multiprocessing.get_all_start_methods():
+        warnings.warn("candidate scoring workers need the fork start method, scoring in the main process")
+        num_workers = 0
+
+    _scoring_state = (models, calibration_batches, eval_batches, metrics, device)
+    try:
+        if num_workers > 0:
+            with multiprocessing.get_context("fork").Pool(num_workers, initializer=_init_worker) as pool:
+                return pool.map(_score, range(len(models)))
+        return [_score(i) for i in range(len(models))]
+    finally:
+        _scoring_state = None
+
+
+def best_candidate(scores: List[Dict[str, float]], metric: str = "loss", higher_is_better: bool = False) -> int:
+    """
+    Returns: index of the candidate with the best value of the metric, the first one on ties
+    """
+    values = [score[metric] for score in scores]
+    best = max(values) if higher_is_better else min(values)
+    return values.index(best)
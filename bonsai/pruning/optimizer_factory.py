@@ -1,9 +1,12 @@
+from typing import TYPE_CHECKING
 from torch import optim
-from confuse import Configuration
 from bonsai.utils.construct_utils import call_constructor_with_cfg
 
+if TYPE_CHECKING:
+    from confuse import Configuration
 
-def optimizer_constructor_from_config(config: Configuration):
+
+def optimizer_constructor_from_config(config: "Configuration"):
     """
     wrapper function returning optimizer constructor based on configuration for every model parameters
     Args:
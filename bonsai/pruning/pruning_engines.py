@@ -16,10 +16,48 @@ def _prepare_batch(batch, device=None, non_blocking=False):
             convert_tensor(y, device=device, non_blocking=non_blocking))
 
 
+def _to_channels_last(x):
+    """Convert 4D tensors (or lists of tensors) to channels last memory format.
+
+    """
+    if isinstance(x, (list, tuple)):
+        return type(x)(_to_channels_last(tensor) for tensor in x)
+    if isinstance(x, torch.Tensor) and x.dim() == 4:
+        return x.contiguous(memory_format=torch.channels_last)
+    return x
+
+
+def _to_float(y_pred):
+    """Cast reduced precision model outputs (or lists of outputs) back to fp32.
+
+    """
+    if isinstance(y_pred, (list, tuple)):
+        return type(y_pred)(_to_float(tensor) for tensor in y_pred)
+    if isinstance(y_pred, torch.Tensor) and y_pred.is_floating_point():
+        return y_pred.float()
+    return y_pred
+
+
+def _autocast(device, autocast_dtype):
+    """Autocast context for the engine's device, disabled if autocast_dtype is None.
+
+    """
+    device_type = torch.device(device).type if device else "cpu"
+    return torch.autocast(device_type, dtype=autocast_dtype, enabled=autocast_dtype is not None)
+
+
+def _prepare_model(model, device, channels_last):
+    if device:
+        model.to(device)
+    if channels_last:
+        model.to(memory_format=torch.channels_last)
+
+
 def create_supervised_trainer(model, optimizer, loss_fn,
                               device=None, non_blocking=False,
                               prepare_batch=_prepare_batch,
-                              output_transform=lambda x, y, y_pred, loss: loss.item()):
+                              output_transform=lambda x, y, y_pred, loss: loss.item(),
+                              channels_last=False, autocast_dtype=None):
     """
     Factory function for creating a trainer for supervised models.
 
@@ -35,26 +73,31 @@ def create_supervised_trainer(model, optimizer, loss_fn,
             tuple of tensors `(batch_x, batch_y)`.
         output_transform (callable, optional): function that receives 'x', 'y', 'y_pred', 'loss' and returns value
             to be assigned to engine's state.output after each iteration. Default is returning `loss.item()`.
+        channels_last (bool, optional): if True, the model and 4D batches are converted to channels last memory format.
+        autocast_dtype (torch.dtype, optional): if given, forward pass and loss run under `torch.autocast` with this
+            dtype (e.g. `torch.bfloat16`), the backward pass runs outside of the autocast context.
 
     Note: `engine.state.output` for this engine is the loss of the processed batch.
 
     Returns:
         Engine: a trainer engine with supervised update function.
     """
-    if device:
-        model.to(device)
+    _prepare_model(model, device, channels_last)
 
     def _update(engine, batch):
         model.train()
         optimizer.zero_grad()
         x, y = prepare_batch(batch, device=device, non_blocking=non_blocking)
-        y_pred = model(x)
-        if isinstance(loss_fn, list):
-            assert len(y_pred) == len(y) == len(loss_fn), \
-                "If loss_fn is a list, its length should match the number of outputs and labels"
-            loss = sum(loss_fn[i](y_pred[i], y[i]) for i in range(len(loss_fn)))
-        else:
-            loss = sum([loss_fn(y_pred[i], y) for i in range(len(y_pred))])
+        if channels_last:
+            x = _to_channels_last(x)
+        with _autocast(device, autocast_dtype):
+            y_pred = model(x)
+            if isinstance(loss_fn, list):
+                assert len(y_pred) == len(y) == len(loss_fn), \
+                    "If loss_fn is a list, its length should match the number of outputs and labels"
+                loss = sum(loss_fn[i](y_pred[i], y[i]) for i in range(len(loss_fn)))
+            else:
+                loss = sum([loss_fn(y_pred[i], y) for i in range(len(y_pred))])
         loss.backward()
         optimizer.step()
         return output_transform(x, y, y_pred, loss)
@@ -65,7 +108,8 @@ def create_supervised_trainer(model, optimizer, loss_fn,
 def create_supervised_evaluator(model, metrics={},
                                 device=None, non_blocking=True,
                                 prepare_batch=_prepare_batch,
-                                output_transform=lambda x, y, y_pred: (y_pred, y,)):
+                                output_transform=lambda x, y, y_pred: (y_pred, y,),
+                                channels_last=False, autocast_dtype=None):
     """
     Factory function for creating an evaluator for supervised models.
 
@@ -81,20 +125,27 @@ def create_supervised_evaluator(model, metrics={},
         output_transform (callable, optional): function that receives 'x', 'y', 'y_pred' and returns value
             to be assigned to engine's state.output after each iteration. Default is returning `(y_pred, y,)` which fits
             output expected by metrics. If you change it you should use `output_transform` in metrics.
+        channels_last (bool, optional): if True, the model and 4D batches are converted to channels last memory format.
+        autocast_dtype (torch.dtype, optional): if given, inference runs under `torch.autocast` with this dtype
+            (e.g. `torch.bfloat16`), predictions are cast back to fp32 before being passed to the metrics.
 
     Note: `engine.state.output` for this engine is a tuple of `(batch_pred, batch_y)`.
 
     Returns:
         Engine: an evaluator engine with supervised inference function.
     """
-    if device:
-        model.to(device)
+    _prepare_model(model, device, channels_last)
 
     def _inference(engine, batch):
         model.eval()
         with torch.no_grad():
             x, y = prepare_batch(batch, device=device, non_blocking=non_blocking)
-            y_pred = model(x)
+            if channels_last:
+                x = _to_channels_last(x)
+            with _autocast(device, autocast_dtype):
+                y_pred = model(x)
+            if autocast_dtype is not None:
+                y_pred = _to_float(y_pred)
             return output_transform(x, y, y_pred)
 
     engine = Engine(_inference)
@@ -109,7 +160,8 @@ def create_supervised_evaluator(model, metrics={},
 def create_supervised_ranker(model, prunner: AbstractPruner, loss_fn,
                              device=None, non_blocking=True,
                              prepare_batch=_prepare_batch,
-                             output_transform=lambda x, y, y_pred, loss: loss.item()):
+                             output_transform=lambda x, y, y_pred, loss: loss.item(),
+                             channels_last=False, autocast_dtype=None):
     """
     Factory function for creating a ranker for supervised models
 
@@ -125,23 +177,28 @@ def create_supervised_ranker(model, prunner: AbstractPruner, loss_fn,
             tuple of tensors `(batch_x, batch_y)`.
         output_transform (callable, optional): function that receives 'x', 'y', 'y_pred', 'loss' and returns value
             to be assigned to engine's state.output after each iteration. Default is returning `loss.item()`.
+        channels_last (bool, optional): if True, the model and 4D batches are converted to channels last memory format.
+        autocast_dtype (torch.dtype, optional): if given, forward pass and loss run under `torch.autocast` with this
+            dtype (e.g. `torch.bfloat16`). The pruner still accumulates the ranks in fp32.
 
     Returns:
         Engine: a trainer engine with supervised update function
     """
-    if device:
-        model.to(device)
+    _prepare_model(model, device, channels_last)
 
     def _update(engine, batch):
         model.train()
         x, y = prepare_batch(batch, device, non_blocking=non_blocking)
-        y_pred = model(x)
-        if isinstance(loss_fn, list):
-            assert len(y_pred) == len(y) == len(loss_fn), \
-                "If loss_fn is a list, its length should match the number of outputs and labels"
-            loss = sum(loss_fn[i](y_pred[i], y[i]) for i in range(len(loss_fn)))
-        else:
-            loss = sum([loss_fn(y_pred[i], y) for i in range(len(y_pred))])
+        if channels_last:
+            x = _to_channels_last(x)
+        with _autocast(device, autocast_dtype):
+            y_pred = model(x)
+            if isinstance(loss_fn, list):
+                assert len(y_pred) == len(y) == len(loss_fn), \
+                    "If loss_fn is a list, its length should match the number of outputs and labels"
+                loss = sum(loss_fn[i](y_pred[i], y[i]) for i in range(len(loss_fn)))
+            else:
+                loss = sum([loss_fn(y_pred[i], y) for i in range(len(y_pred))])
 
         if isinstance(prunner, GradBasedPruner):
             loss.backward()
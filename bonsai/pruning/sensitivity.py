@@ -0,0 +1,184 @@
+"""
+Per layer pruning sensitivity. Every prunable layer is pruned alone at several ratios, using its current ranks, and the
+variant is evaluated on a few validation batches without fine tuning. Pruning is simulated by zeroing the layer's lowest
+ranking output channels with a forward hook, so no variant model is built. This matches removing the channels when the
+layer's batch norm and activation are part of the module, as in models built from cfg files. Variants are independent
+and are evaluated in forked worker processes, sharing the model and the batches with the parent copy-on-write.
+"""
+import itertools
+import multiprocessing
+import warnings
+from typing import Dict, List, Sequence
+import torch
+from bonsai.modules.abstract_bonsai_classes import Prunable
+from bonsai.utils.engine_hooks import BonsaiLoss
+
+# model, batches, metrics and layer groups of the running scan, set before forking so workers inherit them
+_scan_state = None
+
+
+def layer_groups(model) -> Dict[int, List[int]]:
+    """
+    groups prunable modules that are pruned together, i.e. modules going into the same elementwise module, which share
+    their ranks after AbstractPruner.equalize_elementwise
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the ranked model
+
+    Returns: index of the first module of every group to the indices of all modules of the group
+    """
+    groups = {}
+    for i, module in enumerate(model.module_list):
+        if not isinstance(module, Prunable):
+            continue
+        for first, members in groups.items():
+            if model.module_list[first].ranking is module.ranking:
+                members.append(i)
+                break
+        else:
+            groups[i] = [i]
+    return groups
+
+
+def _mask_hook(channels: torch.Tensor):
+    def hook(module, module_input, output):
+        output = output.clone()
+        output[:, channels.to(output.device)] = 0
+        return output
+    return hook
+
+
+def evaluate_batches(model, batches, metrics: dict, device) -> Dict[str, float]:
+    """
+    evaluates a model in its current mode on a list of (x, y) batches, without an engine
+
+    Args:
+        model: the model, returning its predictions as the evaluation engine expects them
+        batches: list of (x, y) batches
+        metrics: metric name to ignite Metric, reset before evaluating
+        device: device the batches are moved to
+
+    Returns: metric name to value, for metrics computing a number
+    """
+    for metric in metrics.values():
+        metric.reset()
+    with torch.no_grad():
+        for x, y in batches:
+            output = (model(x.to(device)), y.to(device))
+            for metric in metrics.values():
+                metric.update(metric._output_transform(output))
+    results = {}
+    for name, metric in metrics.items():
+        value = metric.compute()
+        if isinstance(value, torch.Tensor) and value.numel() == 1:
+            value = value.item()
+        if isinstance(value, (int, float)):
+            results[name] = value
+    return results
+
+
+def _evaluate_variant(task):
+    group, ratio = task
+    model, batches, metrics, groups, device = _scan_state
+    modules = [model.module_list[i] for i in groups[group]]
+    num_pruned = int(ratio * len(modules[0].ranking))
+    channels = torch.argsort(modules[0].ranking)[:num_pruned]
+    handles = [module.register_forward_hook(_mask_hook(channels)) for module in modules]
+    try:
+        results = evaluate_batches(model, batches, metrics, device)
+    finally:
+        for handle in handles:
+            handle.remove()
+    return group, ratio, num_pruned, results
+
+
+def _init_worker():
+    # workers run side by side, intra op threads would only oversubscribe the cores
+    torch.set_num_threads(1)
+
+
+def sensitivity_scan(bonsai, eval_dl, criterion, ratios: Sequence[float] = (0.1, 0.25, 0.5, 0.75),
+                     max_batches: int = None, num_workers: int = 0) -> dict:
+    """
+    measures how the metrics change when each prunable layer is pruned alone, using the ranks computed by the last
+    Bonsai._rank call. Layers sharing their ranks through an elementwise module are pruned together.
+
+    Worker processes are forked, so they need the fork start method and a model on the cpu, otherwise the variants are
+    evaluated in the main process.
+
+    Args:
+        bonsai (bonsai.main.Bonsai): Bonsai object with a ranked model
+        eval_dl: Data loader the variants are evaluated on
+        criterion: loss function, evaluated as the loss metric
+        ratios: fractions of each layer's output channels to prune
+        max_batches: number of batches of eval_dl to evaluate on, None for all of them
+        num_workers: number of worker processes, 0 to evaluate in the main process
+
+    Returns: dictionary with the "baseline" metrics of the unpruned model, the layer "groups" (see layer_groups) and
+    per layer "curves", mapping the index of the first module of every group to a list with a dictionary of ratio,
+    num_pruned and metrics for every ratio
+    """
+    global _scan_state
+    model = bonsai.model
+    device = next(model.parameters()).device
+    metrics = dict(bonsai._metrics)
+    metrics["loss"] = BonsaiLoss(criterion)
+    batches = list(itertools.islice(eval_dl, max_batches))
+    groups = layer_groups(model)
+    tasks = [(group, ratio) for group in groups for ratio in ratios]
+
+    was_training, to_rank = model.training, model.to_rank
+    model.eval()
+    model.to_rank = False
+    _scan_state = (model, batches, metrics, groups, device)
+    try:
+        baseline = evaluate_batches(model, batches, metrics, device)
+        if num_workers > 0 and device.type == "cuda":
+            warnings.warn("sensitivity scan workers need a model on the cpu, evaluating in the main process")
+            num_workers = 0
+        if num_workers > 0 and "fork" not in multiprocessing.get_all_start_methods():
+            warnings.warn("sensitivity scan workers need the fork start method, evaluating in the main process")
+            num_workers = 0
+        if num_workers > 0:
+            with multiprocessing.get_context("fork").Pool(num_workers, initializer=_init_worker) as pool:
+                results = pool.map(_evaluate_variant, tasks)
+        else:
+            results = [_evaluate_variant(task) for task in tasks]
+    finally:
+        _scan_state = None
+        model.train(was_training)
+        model.to_rank = to_rank
+
+    curves = {group: [] for group in groups}
+    for group, ratio, num_pruned, variant_metrics in results:
+        curves[group].append({"ratio": ratio, "num_pruned": num_pruned, **variant_metrics})
+    return {"baseline": baseline, "curves": curves, "groups": groups}
+
+
+def layer_caps_from_sensitivity(sensitivity: dict, max_drop: float, metric: str = "loss",
+                                higher_is_better: bool = False) -> Dict[int, float]:
+    """
+    turns a sensitivity scan into per layer pruning caps for AbstractPruner.layer_caps. Each layer is capped at the
+    largest scanned ratio whose metric drop is within max_drop, and at 0 if even the smallest ratio drops more.
+
+    Args:
+        sensitivity: result of sensitivity_scan
+        max_drop: largest allowed drop of the metric from its baseline
+        metric: metric name
+        higher_is_better: whether higher values of the metric are better, e.g. accuracy vs. loss
+
+    Returns: module index to the largest fraction of its channels that may be pruned in a single iteration, for every
+    module of every group
+    """
+    baseline = sensitivity["baseline"][metric]
+    caps = {}
+    for group, curve in sensitivity["curves"].items():
+        cap = 0.
+        for point in sorted(curve, key=lambda point: point["ratio"]):
+            drop = baseline - point[metric] if higher_is_better else point[metric] - baseline
+            if drop > max_drop:
+                break
+            cap = point["ratio"]
+        for module_idx in sensitivity["groups"][group]:
+            caps[module_idx] = cap
+    return caps
@@ -0,0 +1,161 @@
+"""
+Unstructured magnitude sparsity for the fully connected layers of Bonsai models.
+Structured pruning of prunable_linear layers has to remove entire features, so on top of it the layer weights can be
+masked by magnitude during fine tuning, and exported as sparse CSR weights which use a sparse matmul on inference.
+"""
+import math
+import time
+from typing import Dict, Iterable
+import torch
+from torch import nn
+from bonsai.modules.bonsai_modules import PBLinear
+
+
+def magnitude_mask(weight: torch.Tensor, sparsity: float) -> torch.Tensor:
+    """
+    creates a mask keeping the largest magnitude weights of a tensor
+
+    Args:
+        weight: the weight tensor to mask
+        sparsity: fraction of the weights to zero, in the range [0, 1)
+
+    Returns: boolean mask in the shape of weight, False for weights that should be zeroed
+    """
+    # rounded up so the mask reaches at least the requested sparsity, after dropping float noise like 0.7 * 10
+    num_to_zero = math.ceil(round(sparsity * weight.numel(), 6))
+    if num_to_zero == 0:
+        return torch.ones_like(weight, dtype=torch.bool)
+    magnitude = weight.detach().abs()
+    threshold = magnitude.flatten().kthvalue(num_to_zero).values
+    return magnitude > threshold
+
+
+def compute_linear_sparsity_masks(model, sparsity: float) -> Dict[int, torch.Tensor]:
+    """
+    computes magnitude masks for all the prunable linear layers of the model
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to sparsify
+        sparsity: fraction of each layer weights to zero
+
+    Returns: dictionary with layer index as key and the layer weight mask as value
+    """
+    masks = {}
+    for i, module in enumerate(model.module_list):
+        if isinstance(module, PBLinear):
+            masks[i] = magnitude_mask(module.linear.weight, sparsity)
+    return masks
+
+
+def apply_sparsity_masks(model, masks: Dict[int, torch.Tensor]):
+    """
+    zeros the masked weights of the model, should be called after every optimizer step so pruned weights stay zero
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model being fine tuned
+        masks: masks created by compute_linear_sparsity_masks
+
+    Returns: None
+    """
+    with torch.no_grad():
+        for i, mask in masks.items():
+            weight = model.module_list[i].linear.weight
+            weight.mul_(mask.to(weight.device))
+
+
+class SparseLinear(nn.Module):
+    """
+    inference only replacement for nn.Linear, holding the weights as a sparse CSR tensor and using a sparse matmul.
+
+    Args:
+        linear (nn.Linear): the dense layer to convert
+    """
+
+    def __init__(self, linear: nn.Linear):
+        super(SparseLinear, self).__init__()
+        self.in_features = linear.in_features
+        self.out_features = linear.out_features
+        self.register_buffer("weight", linear.weight.detach().to_sparse_csr())
+        self.register_buffer("bias", None if linear.bias is None else linear.bias.detach().clone())
+
+    def forward(self, layer_input):
+        # (out x in) @ (in x batch) keeps the sparse operand on the left, as required by the sparse kernel
+        output = torch.mm(self.weight, layer_input.t()).t()
+        if self.bias is not None:
+            output = output + self.bias
+        return output
+
+    def extra_repr(self):
+        return f"in_features={self.in_features}, out_features={self.out_features}, nnz={self.weight.values().numel()}"
+
+
+def weight_sparsity(weight: torch.Tensor) -> float:
+    """
+    Returns: fraction of zero elements in the weight tensor
+    """
+    return float((weight == 0).sum()) / weight.numel()
+
+
+def convert_linear_layers_to_sparse(model, min_sparsity: float = 0.):
+    """
+    replaces the nn.Linear layer of each prunable linear module with a SparseLinear, in place. the model can't be
+    trained or pruned afterwards.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to convert
+        min_sparsity: only layers whose weights are at least this sparse are converted, see sparse_linear_crossover
+
+    Returns: list of converted layer indices
+    """
+    converted = []
+    for i, module in enumerate(model.module_list):
+        if isinstance(module, PBLinear) and isinstance(module.linear, nn.Linear):
+            if weight_sparsity(module.linear.weight) >= min_sparsity:
+                module.linear = SparseLinear(module.linear.cpu())
+                converted.append(i)
+    return converted
+
+
+def _time_linear(layer: nn.Module, layer_input: torch.Tensor, iterations: int, warmup: int) -> float:
+    with torch.no_grad():
+        for _ in range(warmup):
+            layer(layer_input)
+        tic = time.perf_counter()
+        for _ in range(iterations):
+            layer(layer_input)
+        return (time.perf_counter() - tic) / iterations
+
+
+def sparse_linear_crossover(in_features: int, out_features: int, batch_size: int = 1,
+                            sparsities: Iterable[float] = (0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 0.98, 0.99),
+                            iterations: int = 100, warmup: int = 10) -> dict:
+    """
+    CPU benchmark of a dense linear layer against its sparse CSR version at several sparsity levels, used to find the
+    sparsity above which converting to SparseLinear pays off.
+
+    Args:
+        in_features: layer input features
+        out_features: layer output features
+        batch_size: number of samples in the benchmarked input
+        sparsities: sparsity levels to benchmark
+        iterations: timed iterations per measurement
+        warmup: untimed iterations before each measurement
+
+    Returns: dictionary containing the dense time, the sparse time of each sparsity level (seconds per call) and the
+    crossover - lowest sparsity at which the sparse layer is faster than the dense one, None if there is none
+    """
+    dense = nn.Linear(in_features, out_features)
+    layer_input = torch.randn(batch_size, in_features)
+    dense_time = _time_linear(dense, layer_input, iterations, warmup)
+
+    sparse_times = {}
+    crossover = None
+    for sparsity in sorted(sparsities):
+        masked = nn.Linear(in_features, out_features)
+        with torch.no_grad():
+            masked.weight.mul_(magnitude_mask(masked.weight, sparsity))
+        sparse_times[sparsity] = _time_linear(SparseLinear(masked), layer_input, iterations, warmup)
+        if crossover is None and sparse_times[sparsity] < dense_time:
+            crossover = sparsity
+
+    return {"dense_time": dense_time, "sparse_times": sparse_times, "crossover": crossover}
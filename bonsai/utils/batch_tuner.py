@@ -0,0 +1,156 @@
+"""
+Automatic batch size selection for the ranking, fine tuning and evaluation phases. The model gets smaller every pruning
+iteration, so the batch size that fit the unpruned model is usually not the fastest one for the pruned model.
+Candidate batch sizes are filtered using the model's static memory estimate, the remaining ones are probed for
+throughput and the data loader is rebuilt with the fastest one.
+"""
+import time
+import warnings
+from typing import Iterable, Optional
+import torch
+from torch.utils.data import DataLoader, IterableDataset
+from bonsai.utils.compile_utils import _synchronize
+
+
+def _is_out_of_memory(error: RuntimeError) -> bool:
+    return "out of memory" in str(error)
+
+
+def default_memory_cap(device) -> Optional[int]:
+    """
+    Returns: free memory of a cuda device in bytes, None for other devices
+    """
+    device = torch.device(device)
+    if device.type == "cuda" and hasattr(torch.cuda, "mem_get_info"):
+        free_memory, _ = torch.cuda.mem_get_info(device)
+        return free_memory
+    return None
+
+
+def estimate_step_memory(model, batch_size: int, training: bool, height: int = None, width: int = None) -> int:
+    """
+    estimates the memory needed for a single step of the model, including its weights. Training steps account for
+    gradients and optimizer state as two more copies of the weights.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to estimate for
+        batch_size: number of samples in the batch
+        training: whether the step runs backward
+        height: input height, defaults to the model config height
+        width: input width, defaults to the model config width
+
+    Returns: estimated memory in bytes
+    """
+    weights = sum(p.numel() * p.element_size() for p in model.parameters())
+    if training:
+        weights *= 3
+    return weights + model.estimate_peak_memory(batch_size, training=training, height=height, width=width)
+
+
+def probe_throughput(model, sample_input: torch.Tensor, batch_size: int, device, training: bool,
+                     iterations: int = 3) -> float:
+    """
+    measures the model's throughput for a given batch size on random input. Training probes run backward as well, the
+    model's gradients and batch norm statistics are restored afterwards.
+
+    Args:
+        model: the model to probe
+        sample_input: a single sample from the dataset, without batch dimension
+        batch_size: number of samples in the batch
+        device: the device the model runs on
+        training: whether to probe a training step or an inference step
+        iterations: number of timed steps, after one warmup step
+
+    Returns: samples per second
+    """
+    batch = torch.randn(batch_size, *sample_input.size(), device=device)
+    was_training = model.training
+    buffers = {name: buffer.clone() for name, buffer in model.named_buffers()}
+    model.train(training)
+    try:
+        with torch.set_grad_enabled(training):
+            for i in range(iterations + 1):
+                if i == 1:
+                    _synchronize(device)
+                    tic = time.perf_counter()
+                output = model(batch)
+                if training:
+                    sum(o.float().sum() for o in output).backward()
+            _synchronize(device)
+        return batch_size * iterations / (time.perf_counter() - tic)
+    finally:
+        model.zero_grad()
+        with torch.no_grad():
+            for name, buffer in model.named_buffers():
+                buffer.copy_(buffers[name])
+        model.train(was_training)
+
+
+def find_batch_size(model, sample_input: torch.Tensor, device, training: bool, candidates: Iterable[int],
+                    memory_cap: int = None, iterations: int = 3) -> Optional[int]:
+    """
+    finds the batch size with the highest throughput, among candidates that are estimated to fit in memory.
+    Candidates are probed in ascending order, stopping at the first one that runs out of memory.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to run
+        sample_input: a single sample from the dataset, without batch dimension
+        device: the device the model runs on
+        training: whether the phase runs backward
+        candidates: batch sizes to consider
+        memory_cap: memory limit in bytes for the static estimate, None for no limit
+        iterations: number of timed steps per probe
+
+    Returns: the fastest batch size, None if no candidate fits
+    """
+    height, width = (int(dim) for dim in sample_input.size()[-2:]) if sample_input.dim() >= 3 else (None, None)
+    best_batch_size, best_throughput = None, 0.
+    for batch_size in sorted(candidates):
+        if memory_cap is not None and \
+                estimate_step_memory(model, batch_size, training, height, width) > memory_cap:
+            break
+        try:
+            throughput = probe_throughput(model, sample_input, batch_size, device, training, iterations)
+        except RuntimeError as e:
+            if not _is_out_of_memory(e):
+                raise
+            if torch.device(device).type == "cuda":
+                torch.cuda.empty_cache()
+            break
+        if throughput > best_throughput:
+            best_batch_size, best_throughput = batch_size, throughput
+    return best_batch_size
+
+
+def loader_kwargs(dl: DataLoader) -> dict:
+    """
+    Returns: the worker, memory pinning and random generator settings of a data loader, as DataLoader keyword
+    arguments, so a data loader built from it loads and shuffles the same way
+    """
+    kwargs = {"num_workers": dl.num_workers, "pin_memory": dl.pin_memory, "timeout": dl.timeout,
+              "worker_init_fn": dl.worker_init_fn, "multiprocessing_context": dl.multiprocessing_context,
+              "generator": dl.generator, "persistent_workers": dl.persistent_workers}
+    # older pytorch versions reject a prefetch factor without workers
+    if dl.num_workers > 0:
+        kwargs["prefetch_factor"] = dl.prefetch_factor
+    return kwargs
+
+
+def rebatch_loader(dl: DataLoader, batch_size: int) -> DataLoader:
+    """
+    creates a data loader over the same dataset with a different batch size, keeping the sampler, collate function,
+    worker and generator settings. Loaders using a custom batch sampler or an iterable dataset are returned as is.
+
+    Args:
+        dl: the data loader to rebatch
+        batch_size: new batch size
+
+    Returns: data loader with the new batch size
+    """
+    if dl.batch_size == batch_size:
+        return dl
+    if dl.batch_size is None or isinstance(dl.dataset, IterableDataset):
+        warnings.warn("can't rebatch data loaders using a batch sampler or an iterable dataset, keeping the original")
+        return dl
+    return DataLoader(dl.dataset, batch_size=batch_size, sampler=dl.sampler, collate_fn=dl.collate_fn,
+                      drop_last=dl.drop_last, **loader_kwargs(dl))
@@ -0,0 +1,152 @@
+"""
+Latency benchmarks for models. Every forward pass is timed separately with perf_counter_ns under inference mode, after
+a configurable number of warmup passes, and the number of timed passes adapts to the model's speed and run to run
+noise. Results are plain dictionaries, so they can be dumped to JSON, logged to tensorboard or stored in the metrics
+passed to log_performance.
+"""
+import json
+import time
+from itertools import product
+from typing import Iterable, List, Sequence, Tuple, TYPE_CHECKING
+import numpy as np
+import torch
+from bonsai.utils.compile_utils import _synchronize
+
+if TYPE_CHECKING:
+    from torch.utils.tensorboard import SummaryWriter
+
+LATENCY_STATS = ["mean", "std", "p50", "p90", "p99"]
+
+
+def _inference_mode():
+    # inference_mode was added in pytorch 1.9
+    if hasattr(torch, "inference_mode"):
+        return torch.inference_mode()
+    return torch.no_grad()
+
+
+def latency_stats(times: Sequence[float]) -> dict:
+    """
+    Args:
+        times: measured times in seconds
+
+    Returns: dictionary of mean, sample standard deviation and 50th, 90th and 99th percentiles in seconds
+    """
+    times = np.asarray(times, dtype=np.float64)
+    p50, p90, p99 = np.percentile(times, [50, 90, 99])
+    return {"mean": float(times.mean()), "std": float(times.std(ddof=1)) if len(times) > 1 else 0.,
+            "p50": float(p50), "p90": float(p90), "p99": float(p99)}
+
+
+def measure_latency(model, model_input: torch.Tensor, device, warmup: int = 10, min_iterations: int = 10,
+                    max_iterations: int = 1000, max_time: float = 2., precision: float = 0.01) -> dict:
+    """
+    measures the latency of a model on a given input. Timing stops once at least min_iterations passes were measured
+    and either the standard error of the mean is within precision of the mean or max_time seconds were spent, and
+    always after max_iterations passes. The model's training mode is restored afterwards.
+
+    Args:
+        model: the model to benchmark
+        model_input: input batch, already on device
+        device: the device the model runs on
+        warmup: number of untimed passes before measuring
+        min_iterations: minimal number of timed passes
+        max_iterations: maximal number of timed passes
+        max_time: time budget in seconds for the timed passes, once min_iterations are done
+        precision: relative standard error of the mean to stop at, 0 to always use the whole time budget
+
+    Returns: dictionary of latency stats in seconds (see latency_stats), the number of timed iterations and the
+    throughput in samples per second
+    """
+    was_training = model.training
+    model.eval()
+    times = []
+    try:
+        with _inference_mode():
+            for _ in range(warmup):
+                model(model_input)
+            _synchronize(device)
+
+            start = time.perf_counter_ns()
+            while len(times) < max_iterations:
+                tic = time.perf_counter_ns()
+                model(model_input)
+                _synchronize(device)
+                times.append((time.perf_counter_ns() - tic) * 1e-9)
+
+                if len(times) < min_iterations:
+                    continue
+                if (time.perf_counter_ns() - start) * 1e-9 >= max_time:
+                    break
+                if precision and np.std(times, ddof=1) / np.sqrt(len(times)) <= precision * np.mean(times):
+                    break
+    finally:
+        model.train(was_training)
+
+    results = latency_stats(times)
+    results["iterations"] = len(times)
+    results["throughput"] = model_input.size(0) / results["mean"]
+    return results
+
+
+def benchmark_sweep(model, input_size: Sequence[int], device, batch_sizes: Iterable[int] = (1,),
+                    resolutions: Iterable[Tuple[int, int]] = None, num_threads: Iterable[int] = None,
+                    **kwargs) -> List[dict]:
+    """
+    measures the latency of a model for every combination of batch size, input resolution and number of CPU threads.
+    The number of threads is restored afterwards.
+
+    Args:
+        model: the model to benchmark, already on device
+        input_size: size of a single sample, without batch dimension (CxHxW for example)
+        device: the device the model runs on
+        batch_sizes: batch sizes to measure
+        resolutions: (height, width) pairs replacing the last two input dimensions, None for input_size only
+        num_threads: values for torch.set_num_threads, None for the current setting only
+        **kwargs: passed to measure_latency
+
+    Returns: list of measure_latency results, each with its batch_size, height, width and num_threads
+    """
+    input_size = list(input_size)
+    resolutions = list(resolutions) if resolutions is not None else [tuple(input_size[-2:])]
+    original_threads = torch.get_num_threads()
+    num_threads = list(num_threads) if num_threads is not None else [original_threads]
+
+    results = []
+    try:
+        for threads, batch_size, (height, width) in product(num_threads, batch_sizes, resolutions):
+            torch.set_num_threads(threads)
+            model_input = torch.randn(batch_size, *input_size[:-2], height, width, device=device)
+            result = {"batch_size": batch_size, "height": height, "width": width, "num_threads": threads}
+            result.update(measure_latency(model, model_input, device, **kwargs))
+            results.append(result)
+    finally:
+        torch.set_num_threads(original_threads)
+    return results
+
+
+def write_benchmark_json(results: List[dict], path: str):
+    """
+    writes benchmark results to a JSON file
+    """
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+
+
+def log_benchmark(results: List[dict], writer: "SummaryWriter", step: int = None, prefix: str = "latency"):
+    """
+    logs benchmark results as tensorboard scalars, one tag per latency stat and benchmark setting, and the raw results
+    as JSON text
+
+    Args:
+        results: benchmark_sweep results
+        writer: tensorboard summary writer
+        step: global step to log at, usually the pruning iteration
+        prefix: tag prefix
+    """
+    for result in results:
+        setting = f"bs{result['batch_size']}_{result['height']}x{result['width']}_threads{result['num_threads']}"
+        for stat in LATENCY_STATS:
+            writer.add_scalar(f"{prefix}/{setting}/{stat}", result[stat], step)
+        writer.add_scalar(f"{prefix}/{setting}/throughput", result["throughput"], step)
+    writer.add_text(prefix, json.dumps(results), step)
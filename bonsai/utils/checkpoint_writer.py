@@ -0,0 +1,101 @@
+"""
+Background writing of checkpoints and pruned model configs, so the pruning pipeline doesn't wait for the disk.
+The model's state is snapshotted into CPU memory once when a checkpoint is requested, serializing it happens on a
+single worker thread, in submission order, while the next pruning phase runs.
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import torch
+
+
+def snapshot_state_dict(model: torch.nn.Module) -> Tuple[Dict[str, torch.Tensor], Optional["torch.cuda.Event"]]:
+    """
+    copies the model's state dict into CPU memory, leaving the model where it is. cuda tensors are copied
+    asynchronously into pinned memory, the copies are complete once the returned event is synchronized.
+
+    Args:
+        model: the model to snapshot
+
+    Returns: tuple of (state dict copy, cuda event to synchronize before reading it, or None)
+    """
+    snapshot = OrderedDict()
+    uses_cuda = False
+    for name, tensor in model.state_dict().items():
+        tensor = tensor.detach()
+        if tensor.is_cuda:
+            uses_cuda = True
+            copy = torch.empty(tensor.size(), dtype=tensor.dtype, pin_memory=True)
+            snapshot[name] = copy.copy_(tensor, non_blocking=True)
+        else:
+            snapshot[name] = tensor.clone()
+    event = None
+    if uses_cuda:
+        event = torch.cuda.Event()
+        event.record()
+    return snapshot, event
+
+
+class AsyncCheckpointWriter:
+    """
+    writes checkpoints on a background thread. Errors raised while writing are re-raised by wait.
+    """
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bonsai_checkpoint")
+        self._pending: List = []
+
+    def submit(self, fn: Callable, *args, **kwargs):
+        """
+        runs fn(*args, **kwargs) on the writer thread, after all previously submitted writes
+        """
+        self._pending.append(self._executor.submit(fn, *args, **kwargs))
+
+    def save_model(self, model: torch.nn.Module, path: str, write_fn: Callable = None):
+        """
+        snapshots the model's state dict and saves it in the background
+
+        Args:
+            model: the model to save, it isn't moved or modified
+            path: output file path
+            write_fn: function called as write_fn(state_dict, path) on the writer thread, torch.save by default
+        """
+        self.save_model_files(model, [(path, write_fn or torch.save)])
+
+    def save_model_files(self, model: torch.nn.Module, writes: List[Tuple[str, Callable]]):
+        """
+        snapshots the model's state dict once and saves it to several files in the background
+
+        Args:
+            model: the model to save, it isn't moved or modified
+            writes: (path, write_fn) pairs, write_fn is called as write_fn(state_dict, path) on the writer thread
+        """
+        snapshot, event = snapshot_state_dict(model)
+        self.submit(self._write_snapshot, snapshot, event, writes)
+
+    @staticmethod
+    def _write_snapshot(snapshot, event, writes):
+        if event is not None:
+            event.synchronize()
+        for path, write_fn in writes:
+            write_fn(snapshot, path)
+
+    def wait(self):
+        """
+        blocks until all submitted writes are done
+
+        Raises:
+            the first error raised by a submitted write
+        """
+        pending, self._pending = self._pending, []
+        for future in pending:
+            future.result()
+
+    def close(self):
+        """
+        waits for the submitted writes and stops the writer thread
+        """
+        try:
+            self.wait()
+        finally:
+            self._executor.shutdown()
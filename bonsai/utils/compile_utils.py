@@ -0,0 +1,94 @@
+"""
+Utils for running the fine tuning and evaluation engines on a torch.compile'd model. Every pruning iteration changes
+the layers shapes, so the model is compiled once per iteration, and only when the compilation is expected to pay off.
+"""
+import time
+import warnings
+import torch
+
+
+def _synchronize(device):
+    if torch.device(device).type == "cuda":
+        torch.cuda.synchronize()
+
+
+def time_forward(model, model_input, device, iterations: int = 3) -> float:
+    """
+    measures the average inference time of a model, without autograd
+
+    Args:
+        model: the model to time
+        model_input: input batch for the model, already on device
+        device: the device the model runs on
+        iterations: number of timed forward passes
+
+    Returns: average time of a single forward pass in seconds
+    """
+    model.eval()
+    with torch.no_grad():
+        _synchronize(device)
+        tic = time.perf_counter()
+        for _ in range(iterations):
+            model(model_input)
+        _synchronize(device)
+    return (time.perf_counter() - tic) / iterations
+
+
+def compile_if_profitable(model, model_input, device, remaining_steps: int, previous_stats: dict = None,
+                          mode: str = "default", iterations: int = 3):
+    """
+    compiles the model using torch.compile, and decides if the compiled model should be used for the next steps.
+    compilation is skipped if the previous pruning iteration's compiled model wasn't faster, or if its compile time
+    exceeds the projected savings over the remaining steps, and the compiled model is discarded if its measured compile
+    time exceeds them. Skipped iterations return the previous compile time and speedup.
+
+    Args:
+        model: the model to compile
+        model_input: sample input batch for the model, already on device
+        device: the device the model runs on
+        remaining_steps: number of forward passes the compiled model would be used for
+        previous_stats: the stats returned by this function in the previous pruning iteration, if any
+        mode: torch.compile mode
+        iterations: number of timed forward passes for measuring speedup
+
+    Returns: tuple of (compiled model or None for eager execution, stats dictionary containing eager_time,
+    compiled_time, compile_time, speedup and a compiled flag, compiled_time is None when nothing was compiled)
+    """
+    stats = {"eager_time": time_forward(model, model_input, device, iterations), "compiled_time": None,
+             "compile_time": None, "speedup": None, "compiled": False}
+
+    if previous_stats and previous_stats.get("speedup") is not None:
+        # the measurements are carried over when skipping, so the next iteration decides with them as well
+        stats["compile_time"], stats["speedup"] = previous_stats["compile_time"], previous_stats["speedup"]
+        if stats["speedup"] <= 1:
+            return None, stats
+        projected_savings = remaining_steps * stats["eager_time"] * (1 - 1 / stats["speedup"])
+        if stats["compile_time"] > projected_savings:
+            return None, stats
+        stats["compile_time"], stats["speedup"] = None, None
+
+    if not hasattr(torch, "compile"):
+        warnings.warn("torch.compile requires pytorch 2.0 or above, running eagerly")
+        return None, stats
+
+    compiled_model = torch.compile(model, mode=mode)
+    # compilation happens lazily on the first call
+    compiled_model.eval()
+    with torch.no_grad():
+        _synchronize(device)
+        tic = time.perf_counter()
+        compiled_model(model_input)
+        _synchronize(device)
+    first_call_time = time.perf_counter() - tic
+
+    stats["compiled_time"] = time_forward(compiled_model, model_input, device, iterations)
+    stats["compile_time"] = max(first_call_time - stats["compiled_time"], 0.)
+    stats["speedup"] = stats["eager_time"] / stats["compiled_time"]
+
+    # the training graph is compiled on its first call as well, so it is only worth it if a compilation is cheaper
+    # than the projected savings
+    projected_savings = remaining_steps * (stats["eager_time"] - stats["compiled_time"])
+    if stats["compile_time"] >= projected_savings:
+        return None, stats
+    stats["compiled"] = True
+    return compiled_model, stats
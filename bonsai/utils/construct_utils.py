@@ -1,4 +1,11 @@
+from functools import lru_cache
 from inspect import getfullargspec
+from typing import Tuple
+
+
+@lru_cache(maxsize=None)
+def _constructor_args(constructor) -> Tuple[str, ...]:
+    return tuple(getfullargspec(constructor).args)
 
 
 def call_constructor_with_cfg(constructor, cfg: dict):
@@ -8,6 +15,6 @@ def call_constructor_with_cfg(constructor, cfg: dict):
     :param cfg: dict, containing keys for constructor
     :return: instance of class based on constructor and appropriate cfg
     """
-    kwargs = getfullargspec(constructor).args
+    kwargs = _constructor_args(constructor)
     constructor_cfg = {k: v for (k, v) in cfg.items() if k in kwargs}
     return constructor(**constructor_cfg)
@@ -0,0 +1,96 @@
+"""
+Caching of transformed datasets, for phases that pass over the same data every pruning iteration. The dataset is read
+through its transforms once and stored as two contiguous tensors of inputs and targets, in shared memory or, when
+larger than the memory limit, in a memory mapped file. Only datasets with deterministic transforms should be cached.
+"""
+import os
+import tempfile
+from typing import Optional
+import torch
+from torch.utils.data import BatchSampler, DataLoader, Dataset
+from bonsai.utils.batch_tuner import loader_kwargs
+
+
+def _allocate(size, dtype, memory_limit: int, cache_dir: Optional[str], name: str) -> torch.Tensor:
+    numel = 1
+    for dim in size:
+        numel *= dim
+    nbytes = numel * torch.tensor([], dtype=dtype).element_size()
+    if cache_dir is None or nbytes <= memory_limit:
+        return torch.empty(size, dtype=dtype).share_memory_()
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix=f"bonsai_{name}_", suffix=".bin", dir=cache_dir)
+    os.ftruncate(fd, nbytes)
+    os.close(fd)
+    # the mapping keeps the data alive, the file name isn't needed after mapping it
+    tensor = torch.from_file(path, shared=True, size=numel, dtype=dtype).view(size)
+    os.remove(path)
+    return tensor
+
+
+class TensorCacheDataset(Dataset):
+    """
+    a dataset holding the samples of another dataset, after its transforms, as contiguous tensors. Samples must be
+    (input, target) pairs of fixed size tensors or numbers.
+
+    Indexing with a list of indices returns the whole batch, as a view of the cache when the indices are consecutive,
+    see cached_loader.
+
+    Args:
+        dataset: the dataset to cache
+        memory_limit: caches larger than this many bytes are memory mapped from a file in cache_dir
+        cache_dir: directory for memory mapped caches, None to always keep the cache in memory
+        num_workers: data loader workers used for reading the dataset once
+        batch_size: batch size used for reading the dataset once
+    """
+
+    def __init__(self, dataset: Dataset, memory_limit: int = 2 ** 31, cache_dir: str = None, num_workers: int = 0,
+                 batch_size: int = 256):
+        num_samples = len(dataset)
+        if num_samples == 0:
+            raise ValueError("can't cache an empty dataset")
+        x, y = (torch.as_tensor(item) for item in dataset[0])
+        self.inputs = _allocate((num_samples, *x.size()), x.dtype, memory_limit, cache_dir, "inputs")
+        self.targets = _allocate((num_samples, *y.size()), y.dtype, memory_limit, cache_dir, "targets")
+
+        start = 0
+        for batch_x, batch_y in DataLoader(dataset, batch_size=batch_size, num_workers=num_workers):
+            end = start + len(batch_x)
+            self.inputs[start:end] = batch_x
+            self.targets[start:end] = torch.as_tensor(batch_y)
+            start = end
+        if start != num_samples:
+            raise ValueError(f"dataset returned {start} samples, expected {num_samples}")
+
+    def __len__(self):
+        return self.inputs.size(0)
+
+    def __getitem__(self, index):
+        if isinstance(index, (list, tuple)):
+            if index and list(index) == list(range(index[0], index[0] + len(index))):
+                index = slice(index[0], index[0] + len(index))
+            else:
+                index = torch.as_tensor(index, dtype=torch.long)
+        return self.inputs[index], self.targets[index]
+
+
+def _identity(batch):
+    return batch
+
+
+def cached_loader(dl: DataLoader, cache: TensorCacheDataset) -> DataLoader:
+    """
+    creates a data loader over a cache of dl's dataset, with the same batch size, sampler, worker and generator
+    settings. Whole batches are read from the cache at once, so consecutive batches (e.g. from a sequential sampler)
+    are zero-copy views of the cache, and workers receive them through shared memory.
+
+    Args:
+        dl: the data loader whose dataset is cached
+        cache: the dataset cache
+
+    Returns: data loader over the cache, or dl if it uses a custom batch sampler
+    """
+    if dl.batch_size is None:
+        return dl
+    batch_sampler = BatchSampler(dl.sampler, dl.batch_size, dl.drop_last)
+    return DataLoader(cache, batch_size=None, sampler=batch_sampler, collate_fn=_identity, **loader_kwargs(dl))
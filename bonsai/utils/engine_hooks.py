@@ -1,20 +1,21 @@
+from typing import TYPE_CHECKING
 from ignite.engine import Engine
-from torch.utils.tensorboard import SummaryWriter
 from bonsai.utils.performance_utils import speed_testing
 from bonsai.config import config
 from ignite.metrics import Metric
 from ignite.exceptions import NotComputableError
 
-log_interval = config["logging"]["train_log_interval"].get()
+if TYPE_CHECKING:
+    from torch.utils.tensorboard import SummaryWriter
 
 
-def log_training_loss(engine: Engine, writer: SummaryWriter):
+def log_training_loss(engine: Engine, writer: "SummaryWriter"):
     # iter = (engine.state.iteration - 1) % len(train_loader) + 1
     if engine.state.iteration % config["logging"]["train_log_interval"].get() == 0:
         writer.add_scalar("training/loss", engine.state.output, engine.state.iteration)
 
 
-def log_evaluator_metrics(engine: Engine, writer: SummaryWriter):
+def log_evaluator_metrics(engine: Engine, writer: "SummaryWriter"):
     metrics = engine.state.metrics
     if writer:
         for metric_name, metric_value in metrics.items():
@@ -23,7 +24,9 @@ def log_evaluator_metrics(engine: Engine, writer: SummaryWriter):
 
 def calc_model_speed(engine: Engine, bonsai, input_size, iterations):
     metrics = engine.state.metrics
-    metrics["avg_time"] = speed_testing(bonsai, input_size, verbose=False, iterations=iterations)
+    latency = speed_testing(bonsai, input_size, verbose=False, iterations=iterations, detailed=True)
+    metrics["avg_time"] = latency["mean"]
+    metrics["latency"] = latency
     bonsai.metrics_list.append(metrics)
 
 
@@ -0,0 +1,90 @@
+"""
+Single file model bundles, holding the model config and weights of a BonsaiModel. The file starts with a magic string
+and a JSON header describing the model config and every tensor, followed by a flat blob of raw tensor data with each
+tensor aligned to 64 bytes. Loading memory maps the file and builds the tensors directly on top of the mapping, so
+weights are read lazily by the OS on first use, without unpickling or random initialization.
+
+layout: MAGIC | header length (8 bytes, little endian) | JSON header | padding | tensor blob
+"""
+import json
+import mmap
+import struct
+from collections import OrderedDict
+from typing import Dict
+import torch
+
+MAGIC = b"BONSAI01"
+ALIGNMENT = 64
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _dtype_name(dtype: torch.dtype) -> str:
+    return str(dtype).split(".")[-1]
+
+
+def write_bundle(path: str, model_cfg: list, state_dict: Dict[str, torch.Tensor], metadata: dict = None):
+    """
+    writes a model bundle file
+
+    Args:
+        path: output file path
+        model_cfg: the model config, as parsed from a config file (list of dictionaries starting with the hyperparams)
+        state_dict: the model weights
+        metadata: extra JSON serializable information to store in the header
+
+    Returns: None
+    """
+    tensors = OrderedDict()
+    offset = 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu().contiguous()
+        nbytes = tensor.numel() * tensor.element_size()
+        tensors[name] = {"dtype": _dtype_name(tensor.dtype), "shape": list(tensor.size()), "offset": offset,
+                         "nbytes": nbytes}
+        offset = _align(offset + nbytes)
+    header = json.dumps({"cfg": model_cfg, "tensors": tensors, "metadata": metadata or {}}).encode("utf-8")
+    blob_start = _align(len(MAGIC) + 8 + len(header))
+
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(header)))
+        f.write(header)
+        f.write(b"\0" * (blob_start - f.tell()))
+        for name, tensor in state_dict.items():
+            tensor = tensor.detach().cpu().contiguous()
+            f.write(b"\0" * (blob_start + tensors[name]["offset"] - f.tell()))
+            if tensor.numel():
+                f.write(tensor.view(-1).view(torch.uint8).numpy().tobytes())
+
+
+def read_bundle(path: str):
+    """
+    memory maps a model bundle file, tensors share memory with the mapping. The mapping is copy on write, so changing
+    the tensors, e.g. by fine tuning, doesn't change the file.
+
+    Args:
+        path: bundle file path
+
+    Returns: tuple of (model config, state dict, metadata)
+    """
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a Bonsai model bundle")
+        header_length, = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(header_length).decode("utf-8"))
+        blob_start = _align(len(MAGIC) + 8 + header_length)
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    state_dict = OrderedDict()
+    for name, info in header["tensors"].items():
+        dtype = getattr(torch, info["dtype"])
+        if info["nbytes"] == 0:
+            state_dict[name] = torch.empty(info["shape"], dtype=dtype)
+            continue
+        count = info["nbytes"] // torch.tensor([], dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=blob_start + info["offset"])
+        state_dict[name] = tensor.view(info["shape"])
+    return header["cfg"], state_dict, header["metadata"]
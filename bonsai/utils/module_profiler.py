@@ -0,0 +1,200 @@
+"""
+Per module profiling of Bonsai models. Forward hooks record the wall time, FLOPs and allocated memory of each module
+under its cfg layer name, and open a record_function scope with the same name, so traces recorded with torch.profiler
+show the cfg layer names as well.
+"""
+import time
+from collections import OrderedDict
+from typing import List, TYPE_CHECKING
+import torch
+from torch import nn
+from bonsai.utils.compile_utils import _synchronize
+
+if TYPE_CHECKING:
+    from torch.utils.tensorboard import SummaryWriter
+
+PROFILE_COLUMNS = ["time_ms", "time_percent", "mflops", "allocated_kb", "calls"]
+
+
+def module_flops(module, module_input, output) -> int:
+    """
+    counts the floating point operations of a single module call, two per multiply-accumulate of convolutions and
+    linear layers and one per output element for other modules
+
+    Args:
+        module: a Bonsai module
+        module_input: the module's input tensor, None for modules reading other layers' outputs
+        output: the module's output tensor
+
+    Returns: number of floating point operations
+    """
+    if not isinstance(output, torch.Tensor):
+        return 0
+    conv2d = getattr(module, "conv2d", None)
+    if isinstance(conv2d, nn.Conv2d):
+        kernel_h, kernel_w = conv2d.kernel_size
+        return 2 * output.numel() * conv2d.in_channels // conv2d.groups * kernel_h * kernel_w
+    deconv2d = getattr(module, "deconv2d", None)
+    if isinstance(deconv2d, nn.ConvTranspose2d) and isinstance(module_input, torch.Tensor):
+        kernel_h, kernel_w = deconv2d.kernel_size
+        return 2 * module_input.numel() * deconv2d.out_channels // deconv2d.groups * kernel_h * kernel_w
+    linear = getattr(module, "linear", None)
+    if isinstance(linear, nn.Linear):
+        return 2 * output.numel() * linear.in_features
+    return output.numel()
+
+
+class ModuleProfiler:
+    """
+    records the cost of every module of a BonsaiModel while it's active, as a context manager:
+
+        with ModuleProfiler(model) as profiler:
+            model(x)
+        print(profiler.table())
+
+    Allocated memory is the net memory allocated by the module call on cuda devices, and the size of the module's
+    output on other devices.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to profile
+    """
+
+    def __init__(self, model):
+        self.model = model
+        self._handles = []
+        self._scopes = {}
+        self._start = {}
+        self.records = OrderedDict()
+        self.reset()
+
+    def reset(self):
+        """
+        clears the recorded stats
+        """
+        self.records = OrderedDict(
+            (module.module_cfg["name"], {"type": module.module_cfg["type"], "calls": 0, "time": 0., "flops": 0,
+                                         "allocated": 0})
+            for module in self.model.module_list)
+
+    def __enter__(self):
+        for module in self.model.module_list:
+            self._handles.append(module.register_forward_pre_hook(self._pre_hook))
+            self._handles.append(module.register_forward_hook(self._post_hook))
+        return self
+
+    def __exit__(self, *args):
+        for handle in self._handles:
+            handle.remove()
+        self._handles = []
+
+    @staticmethod
+    def _device(module_input):
+        if isinstance(module_input, torch.Tensor):
+            return module_input.device
+        return torch.device("cpu")
+
+    def _pre_hook(self, module, inputs):
+        name = module.module_cfg["name"]
+        module_input = inputs[0] if inputs else None
+        device = self._device(module_input)
+        scope = torch.autograd.profiler.record_function(name)
+        scope.__enter__()
+        self._scopes[name] = scope
+        _synchronize(device)
+        allocated = 0
+        if device.type == "cuda":
+            allocated = torch.cuda.memory_allocated(device)
+        self._start[name] = (time.perf_counter_ns(), allocated)
+
+    def _post_hook(self, module, inputs, output):
+        name = module.module_cfg["name"]
+        module_input = inputs[0] if inputs else None
+        device = output.device if isinstance(output, torch.Tensor) else self._device(module_input)
+        _synchronize(device)
+        tic, allocated = self._start.pop(name)
+        record = self.records[name]
+        record["time"] += (time.perf_counter_ns() - tic) * 1e-9
+        record["calls"] += 1
+        record["flops"] += module_flops(module, module_input, output)
+        if device.type == "cuda":
+            record["allocated"] += torch.cuda.memory_allocated(device) - allocated
+        elif isinstance(output, torch.Tensor):
+            record["allocated"] += output.numel() * output.element_size()
+        self._scopes.pop(name).__exit__(None, None, None)
+
+    def profile(self, model_input, runs: int = 10, warmup: int = 2) -> List[dict]:
+        """
+        runs the model in inference mode and records the cost of each module, averaged over the runs. The model's
+        training mode is restored afterwards.
+
+        Args:
+            model_input: input batch, already on the model's device
+            runs: number of profiled forward passes
+            warmup: number of forward passes before profiling
+
+        Returns: see summary
+        """
+        was_training = self.model.training
+        self.model.eval()
+        try:
+            with torch.no_grad():
+                for _ in range(warmup):
+                    self.model(model_input)
+                self.reset()
+                with self:
+                    for _ in range(runs):
+                        self.model(model_input)
+        finally:
+            self.model.train(was_training)
+        return self.summary()
+
+    def summary(self, sort_by: str = None) -> List[dict]:
+        """
+        Args:
+            sort_by: column to sort by in descending order, one of PROFILE_COLUMNS, None for model order
+
+        Returns: a row for every module with its name, type and per call averages of the columns in PROFILE_COLUMNS
+        """
+        total_time = sum(record["time"] for record in self.records.values()) or 1.
+        rows = []
+        for name, record in self.records.items():
+            calls = record["calls"] or 1
+            rows.append({"name": name, "type": record["type"],
+                         "time_ms": record["time"] / calls * 1e3,
+                         "time_percent": 100 * record["time"] / total_time,
+                         "mflops": record["flops"] / calls / 1e6,
+                         "allocated_kb": record["allocated"] / calls / 1024,
+                         "calls": record["calls"]})
+        if sort_by is not None:
+            rows.sort(key=lambda row: row[sort_by], reverse=True)
+        return rows
+
+    def table(self, sort_by: str = "time_ms") -> str:
+        """
+        Args:
+            sort_by: column to sort by in descending order, None for model order
+
+        Returns: the summary as a markdown table
+        """
+        lines = ["| name | type | " + " | ".join(PROFILE_COLUMNS) + " |",
+                 "|" + "---|" * (len(PROFILE_COLUMNS) + 2)]
+        for row in self.summary(sort_by):
+            values = [f"{row[column]:.3f}" if isinstance(row[column], float) else str(row[column])
+                      for column in PROFILE_COLUMNS]
+            lines.append(f"| {row['name']} | {row['type']} | " + " | ".join(values) + " |")
+        return "\n".join(lines)
+
+    def log_to_tensorboard(self, writer: "SummaryWriter", step: int = None, prefix: str = "profile"):
+        """
+        logs the time and FLOPs of every module as scalars, so each layer's cost can be followed across pruning
+        iterations, and the table as text
+
+        Args:
+            writer: tensorboard summary writer
+            step: global step to log at, usually the pruning iteration
+            prefix: tag prefix
+        """
+        for row in self.summary():
+            writer.add_scalar(f"{prefix}/{row['name']}/time_ms", row["time_ms"], step)
+            writer.add_scalar(f"{prefix}/{row['name']}/mflops", row["mflops"], step)
+        writer.add_text(prefix, self.table(), step)
@@ -1,67 +1,55 @@
+import json
 from bonsai.config import config
-from typing import List
+from typing import List, TYPE_CHECKING
 import torch
-from torch.utils.tensorboard import SummaryWriter
-from torch.backends import cudnn
-import time
-import tqdm
-import matplotlib.pyplot as plt
-import seaborn as sns
+from bonsai.utils.benchmark import measure_latency, LATENCY_STATS
 
-sns.set()
+if TYPE_CHECKING:
+    from torch.utils.tensorboard import SummaryWriter
 
 
-def speed_testing(bonsai, input_size, iterations=1000, verbose=True):
+def speed_testing(bonsai, input_size, iterations=1000, verbose=True, warmup=10, detailed=False):
     """
-    Test the inference time of a model on a single input
+    Test the inference time of a model on a single input, see bonsai.utils.benchmark for sweeping batch sizes,
+    resolutions and thread counts
 
     Args:
         bonsai: Bonsai containing model of type torch.nn.Module
         input_size: tuple of ints representing the model input size (1xCxHxW for example)
-        iterations: number of iterations to average over
+        iterations: number of timed iterations
         verbose (bool): whether or not to print results
+        warmup: number of untimed iterations before measuring
+        detailed (bool): whether to return the full latency stats instead of the average time
 
-    Returns: average inference time of model given the input
+    Returns: average inference time of model given the input, or the measure_latency results if detailed
 
     """
 
     device = bonsai.device
 
-    # cuDnn configurations
-    cudnn.benchmark = True
-    cudnn.deterministic = True
-
     if verbose:
         print(f"Speed testing using {device}")
     model = bonsai.model.to(device)
     random_input = torch.randn(*input_size).to(device)
 
-    model.eval()
-
-    time_list = []
-    for _ in tqdm.tqdm(range(iterations + 1)):
-        if device.type == "cuda":
-            torch.cuda.synchronize()
-
-        tic = time.time()
-        model(random_input)
-
-        if device.type == "cuda":
-            torch.cuda.synchronize()
-        time_list.append(time.time()-tic)
-
-    # the first iteration time cost much higher, so exclude the first iteration
-    time_list = time_list[1:]
-    average_time = sum(time_list) / iterations
-    fps = 1 / average_time
+    results = measure_latency(model, random_input, device, warmup=warmup, min_iterations=iterations,
+                              max_iterations=iterations)
     if verbose:
         print(f"Done {iterations} iterations inference !")
-        print(f"Average time cost: {average_time}")
-        print(f"Frame Per Second: {fps}")
-    return average_time
+        print(f"Average time cost: {results['mean']}, p50: {results['p50']}, p90: {results['p90']}, "
+              f"p99: {results['p99']}, std: {results['std']}")
+        print(f"Frame Per Second: {1 / results['mean']}")
+    if detailed:
+        return results
+    return results["mean"]
 
 
 def _make_figure(x, y, x_name, y_name):
+    # plotting libraries are slow to import, they are loaded only when figures are made
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    sns.set()
+
     fig, ax = plt.subplots()
     sns.lineplot(x, y, alpha=0.5, ax=ax)
     sns.scatterplot(x, y, ax=ax)
@@ -73,17 +61,27 @@ def _make_figure(x, y, x_name, y_name):
     return fig
 
 
-def log_performance(metrics: List[dict], writer: SummaryWriter):
+def log_performance(metrics: List[dict], writer: "SummaryWriter"):
     """
+    logs every metric against the inference time and FPS of each pruning iteration, and the latency stats of each
+    iteration when they were measured
 
     Args:
-        metrics:
-        writer:
-
-    Returns:
+        metrics: metric dictionaries of every evaluation, each containing avg_time and optionally latency, the results
+            of bonsai.utils.benchmark.measure_latency
+        writer: tensorboard summary writer, nothing is logged if None
 
+    Returns: None
     """
 
+    latency = [metric_dict.pop("latency", None) for metric_dict in metrics]
+    if writer:
+        for i, results in enumerate(latency):
+            if results is not None:
+                for stat in LATENCY_STATS:
+                    writer.add_scalar(f"latency/{stat}", results[stat], i)
+        writer.add_text("latency", json.dumps(latency))
+
     avg_time = [metric_dict.pop("avg_time") for metric_dict in metrics]
     fps = [1 / t for t in avg_time]
     if writer:
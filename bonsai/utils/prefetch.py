@@ -0,0 +1,163 @@
+"""
+Background batch prefetching for the ranking, fine tuning and evaluation engines. A worker thread iterates over the
+user's data loader and keeps a few batches ahead of the engine, already moved to the engine's device and converted to
+its memory format, while the engine measures how long it waits for each batch.
+"""
+import queue
+import threading
+import time
+import warnings
+from contextlib import nullcontext
+from typing import List
+import torch
+from ignite.utils import convert_tensor
+from bonsai.pruning.pruning_engines import _to_channels_last
+
+_END = object()
+
+
+class _WorkerError:
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+def _pin(batch):
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(_pin(x) for x in batch)
+    if isinstance(batch, torch.Tensor) and not batch.is_pinned():
+        return batch.pin_memory()
+    return batch
+
+
+def _record_stream(batch, stream):
+    if isinstance(batch, (list, tuple)):
+        for x in batch:
+            _record_stream(x, stream)
+    elif isinstance(batch, torch.Tensor) and batch.is_cuda:
+        batch.record_stream(stream)
+
+
+class PrefetchLoader:
+    """
+    wraps a data loader, preparing batches on a background thread. Batches are (x, y) pairs as returned by the data
+    loader, moved to device with x converted to channels last if requested, so the engines' batch preparation does
+    nothing. Attributes of the wrapped loader, e.g. dataset and batch_size, are available on the wrapper.
+
+    After every full pass, the time spent waiting for batches is compared to the time spent between them, and a warning
+    is issued if the pipeline is input bound.
+
+    Args:
+        dl: the data loader to wrap
+        device: device to move batches to, None to keep them where they are
+        num_prefetch: number of batches prepared ahead of the engine
+        channels_last: convert 4D inputs to channels last memory format
+        stall_threshold: fraction of time spent waiting for batches above which a warning is issued, None to never warn
+    """
+
+    def __init__(self, dl, device=None, num_prefetch: int = 2, channels_last: bool = False,
+                 stall_threshold: float = 0.2):
+        self.dl = dl
+        self.device = torch.device(device) if device is not None else None
+        self.num_prefetch = max(num_prefetch, 1)
+        self.channels_last = channels_last
+        self.stall_threshold = stall_threshold
+        # time waited for each batch of the last pass, and the time spent between batches
+        self.wait_times: List[float] = []
+        self.compute_time = 0.
+
+    def __len__(self):
+        return len(self.dl)
+
+    def __getattr__(self, item):
+        # only called for attributes missing on the wrapper
+        if item == "dl":
+            raise AttributeError(item)
+        return getattr(self.dl, item)
+
+    def _prepare(self, batch, stream):
+        use_cuda = self.device is not None and self.device.type == "cuda"
+        if use_cuda:
+            batch = _pin(batch)
+        with torch.cuda.stream(stream) if stream is not None else nullcontext():
+            x, y = batch
+            x = convert_tensor(x, device=self.device, non_blocking=use_cuda)
+            y = convert_tensor(y, device=self.device, non_blocking=use_cuda)
+            if self.channels_last:
+                x = _to_channels_last(x)
+        event = None
+        if stream is not None:
+            event = torch.cuda.Event()
+            event.record(stream)
+        return (x, y), event
+
+    @staticmethod
+    def _put(batches: queue.Queue, stop: threading.Event, item) -> bool:
+        """
+        Returns: whether the item was queued, False if the consumer stopped iterating
+        """
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _worker(self, batches: queue.Queue, stop: threading.Event):
+        stream = None
+        if self.device is not None and self.device.type == "cuda":
+            stream = torch.cuda.Stream(self.device)
+        try:
+            for batch in self.dl:
+                if not self._put(batches, stop, self._prepare(batch, stream)):
+                    return
+            self._put(batches, stop, _END)
+        except BaseException as e:
+            self._put(batches, stop, _WorkerError(e))
+
+    def __iter__(self):
+        batches = queue.Queue(maxsize=self.num_prefetch)
+        stop = threading.Event()
+        worker = threading.Thread(target=self._worker, args=(batches, stop), daemon=True)
+        worker.start()
+        self.wait_times = []
+        self.compute_time = 0.
+        try:
+            yielded = None
+            while True:
+                tic = time.perf_counter()
+                if yielded is not None:
+                    self.compute_time += tic - yielded
+                item = batches.get()
+                self.wait_times.append(time.perf_counter() - tic)
+                if item is _END:
+                    self.wait_times.pop()
+                    break
+                if isinstance(item, _WorkerError):
+                    raise item.error
+                batch, event = item
+                if event is not None:
+                    current_stream = torch.cuda.current_stream(self.device)
+                    current_stream.wait_event(event)
+                    _record_stream(batch, current_stream)
+                yielded = time.perf_counter()
+                yield batch
+        finally:
+            stop.set()
+            worker.join()
+        self._check_stall()
+
+    def wait_fraction(self) -> float:
+        """
+        Returns: fraction of the last pass spent waiting for batches
+        """
+        total_wait = sum(self.wait_times)
+        total = total_wait + self.compute_time
+        return total_wait / total if total else 0.
+
+    def _check_stall(self):
+        if self.stall_threshold is not None and self.wait_fraction() > self.stall_threshold:
+            warnings.warn(f"input bound: {100 * self.wait_fraction():.1f}% of the pass was spent waiting for the data "
+                          f"loader ({sum(self.wait_times):.2f}s over {len(self.wait_times)} batches), consider more "
+                          f"workers or a larger prefetch")
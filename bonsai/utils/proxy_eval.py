@@ -0,0 +1,122 @@
+"""
+Proxy evaluation on a fixed subset of the evaluation set. The subset is stratified by class when the dataset exposes its
+targets (as torchvision datasets do with a targets attribute) and sampled uniformly otherwise. Metric estimates on the
+subset come with bootstrap confidence intervals, computed by re-running the metrics on resampled predictions.
+"""
+import random
+from collections import defaultdict
+from typing import Dict, List, Sequence, Tuple
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+
+def stratified_indices(targets: Sequence[int], size: int, seed: int = 0) -> List[int]:
+    """
+    samples indices with every class represented in proportion to its frequency, keeping at least one sample of each
+    class when size allows it
+
+    Args:
+        targets: class of each sample
+        size: number of indices to sample
+        seed: random seed, the same seed always gives the same subset
+
+    Returns: sorted list of sampled indices
+    """
+    by_class = defaultdict(list)
+    for i, target in enumerate(targets):
+        by_class[int(target)].append(i)
+    size = min(size, len(targets))
+
+    # largest remainder allocation of the subset size between classes
+    quotas = {c: size * len(indices) / len(targets) for c, indices in by_class.items()}
+    allocation = {c: int(quota) for c, quota in quotas.items()}
+    if size >= len(by_class):
+        allocation = {c: max(n, 1) for c, n in allocation.items()}
+    remaining = size - sum(allocation.values())
+    # samples given to rare classes are taken from the largest classes
+    while remaining < 0:
+        largest = max(allocation, key=lambda c: allocation[c])
+        allocation[largest] -= 1
+        remaining += 1
+    for c in sorted(quotas, key=lambda c: quotas[c] - int(quotas[c]), reverse=True):
+        if remaining <= 0:
+            break
+        if allocation[c] < len(by_class[c]):
+            allocation[c] += 1
+            remaining -= 1
+
+    rng = random.Random(seed)
+    indices = []
+    for c in sorted(by_class):
+        indices.extend(rng.sample(by_class[c], min(allocation[c], len(by_class[c]))))
+    return sorted(indices)
+
+
+def subset_indices(dataset: Dataset, fraction: float, seed: int = 0) -> List[int]:
+    """
+    Args:
+        dataset: the evaluation dataset
+        fraction: fraction of the dataset to sample, at least one sample is kept
+        seed: random seed
+
+    Returns: sorted indices of a fixed subset, stratified by dataset.targets if the dataset has it
+    """
+    size = max(int(round(fraction * len(dataset))), 1)
+    targets = getattr(dataset, "targets", None)
+    if targets is not None and len(targets) == len(dataset):
+        return stratified_indices(targets, size, seed)
+    return sorted(random.Random(seed).sample(range(len(dataset)), size))
+
+
+def concat_outputs(outputs: list):
+    """
+    concatenates engine outputs of several batches along the batch dimension, keeping their (nested) list structure
+    """
+    first = outputs[0]
+    if isinstance(first, (list, tuple)):
+        return type(first)(concat_outputs([output[i] for output in outputs]) for i in range(len(first)))
+    return torch.cat([output.detach().cpu() for output in outputs])
+
+
+def index_output(output, index: torch.Tensor):
+    """
+    selects samples of every tensor of a (nested) engine output
+    """
+    if isinstance(output, (list, tuple)):
+        return type(output)(index_output(x, index) for x in output)
+    return output[index]
+
+
+def bootstrap_metrics(metrics: Dict[str, object], output, num_samples: int, num_resamples: int = 200,
+                      confidence: float = 0.95, seed: int = 0) -> Dict[str, Tuple[float, float]]:
+    """
+    computes bootstrap confidence intervals of ignite metrics, by updating each metric with resampled predictions.
+    The metrics are reset, they should not be attached to a running engine.
+
+    Args:
+        metrics: metric name to ignite Metric
+        output: the concatenated (prediction, target) engine output of all samples
+        num_samples: number of samples in output
+        num_resamples: number of bootstrap resamples
+        confidence: confidence level of the intervals
+        seed: random seed
+
+    Returns: metric name to (low, high) bounds, for metrics computing a number
+    """
+    generator = torch.Generator().manual_seed(seed)
+    values = defaultdict(list)
+    for _ in range(num_resamples):
+        index = torch.randint(num_samples, (num_samples,), generator=generator)
+        resampled = index_output(output, index)
+        for name, metric in metrics.items():
+            metric.reset()
+            metric.update(metric._output_transform(resampled))
+            value = metric.compute()
+            if isinstance(value, torch.Tensor) and value.numel() == 1:
+                value = value.item()
+            if isinstance(value, (int, float)):
+                values[name].append(value)
+
+    alpha = (1 - confidence) / 2
+    return {name: (float(np.quantile(v, alpha)), float(np.quantile(v, 1 - alpha))) for name, v in values.items()}
@@ -0,0 +1,88 @@
+"""
+Utils for applying a Bonsai pruning plan, see bonsai.main.Bonsai.export_pruning_plan, to the original pytorch model the
+Bonsai model was parsed from. The original model's layers are sliced in place, so it keeps its own class and forward.
+"""
+from itertools import chain
+from typing import Dict, List, Optional
+import torch
+from torch import nn
+
+
+def _slice_parameter(parameter: Optional[torch.Tensor], dim: int, indices: Optional[List[int]]):
+    if parameter is None or indices is None:
+        return parameter
+    index = torch.tensor(indices, dtype=torch.long, device=parameter.device)
+    sliced = parameter.data.index_select(dim, index).clone()
+    if isinstance(parameter, nn.Parameter):
+        return nn.Parameter(sliced, requires_grad=parameter.requires_grad)
+    return sliced
+
+
+def prune_layer(layer: nn.Module, kept_in: Optional[List[int]], kept_out: Optional[List[int]]):
+    """
+    slices a single layer in place, keeping the given input and output channels / features
+
+    Args:
+        layer: nn.Conv2d, nn.ConvTranspose2d, nn.BatchNorm2d or nn.Linear, layers without weights are left as is
+        kept_in: indices of the input channels / features to keep, None to keep all
+        kept_out: indices of the output channels / features to keep, None to keep all
+
+    Returns: None
+    """
+    if isinstance(layer, (nn.Conv2d, nn.ConvTranspose2d)):
+        in_dim, out_dim = (0, 1) if isinstance(layer, nn.ConvTranspose2d) else (1, 0)
+        if layer.groups != 1:
+            # depthwise convolutions have a single input channel per group, which follow the kept output channels
+            if layer.groups != layer.in_channels or layer.in_channels != layer.out_channels:
+                raise ValueError(f"can't prune grouped convolution {layer}")
+            kept_in = None
+            if kept_out is not None:
+                layer.groups = len(kept_out)
+                layer.in_channels = len(kept_out)
+        layer.weight = _slice_parameter(layer.weight, in_dim, kept_in)
+        layer.weight = _slice_parameter(layer.weight, out_dim, kept_out)
+        layer.bias = _slice_parameter(layer.bias, 0, kept_out)
+        if kept_in is not None:
+            layer.in_channels = len(kept_in)
+        if kept_out is not None:
+            layer.out_channels = len(kept_out)
+
+    elif isinstance(layer, nn.BatchNorm2d):
+        layer.weight = _slice_parameter(layer.weight, 0, kept_out)
+        layer.bias = _slice_parameter(layer.bias, 0, kept_out)
+        layer.running_mean = _slice_parameter(layer.running_mean, 0, kept_out)
+        layer.running_var = _slice_parameter(layer.running_var, 0, kept_out)
+        if kept_out is not None:
+            layer.num_features = len(kept_out)
+
+    elif isinstance(layer, nn.Linear):
+        layer.weight = _slice_parameter(layer.weight, 1, kept_in)
+        layer.weight = _slice_parameter(layer.weight, 0, kept_out)
+        layer.bias = _slice_parameter(layer.bias, 0, kept_out)
+        if kept_in is not None:
+            layer.in_features = len(kept_in)
+        if kept_out is not None:
+            layer.out_features = len(kept_out)
+
+    elif any(True for _ in chain(layer.parameters(), layer.buffers())):
+        raise ValueError(f"pruning {type(layer).__name__} layers isn't supported")
+
+
+def apply_pruning_plan(model: nn.Module, plan: Dict[str, dict]) -> nn.Module:
+    """
+    slices the layers of a pytorch model in place according to a pruning plan exported by Bonsai. The model should be
+    the one the pruned Bonsai model was parsed from, with its original (unpruned) layer sizes.
+
+    Args:
+        model: the original pytorch model
+        plan: dictionary with module names as keys and dictionaries holding the kept "in" and "out" indices as values
+
+    Returns: the pruned model
+    """
+    named_modules = dict(model.named_modules())
+    missing = [name for name in plan if name not in named_modules]
+    if missing:
+        raise ValueError(f"modules {missing} of the pruning plan aren't in the model")
+    for name, kept in plan.items():
+        prune_layer(named_modules[name], kept["in"], kept["out"])
+    return model
@@ -0,0 +1,73 @@
+"""
+Utils for post-pruning int8 static quantization of Bonsai models, using pytorch eager mode quantization.
+"""
+import torch
+from torch import nn
+from torch.quantization import QuantStub, DeQuantStub, get_default_qconfig, fuse_modules, prepare, convert
+
+
+def fuse_bonsai_modules(model):
+    """
+    fuses the conv2d / linear layers of each bonsai module with its batch normalization and ReLU activation, so they
+    are quantized as a single int8 operation. the fused out layers are replaced by nn.Identity by pytorch.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to fuse, should be in eval mode
+
+    Returns: None
+    """
+    for module in model.module_list:
+        modules_to_fuse = []
+        if isinstance(getattr(module, "conv2d", None), nn.Conv2d):
+            modules_to_fuse.append("conv2d")
+            if isinstance(module.bn, nn.BatchNorm2d):
+                modules_to_fuse.append("bn")
+        elif isinstance(getattr(module, "linear", None), nn.Linear) and module.bn is None:
+            modules_to_fuse.append("linear")
+        else:
+            continue
+
+        if type(module.f) == nn.ReLU:
+            modules_to_fuse.append("f")
+
+        if len(modules_to_fuse) > 1:
+            fuse_modules(module, [modules_to_fuse], inplace=True)
+
+
+def prepare_static_quantization(model, backend: str = "fbgemm"):
+    """
+    fuses the model's modules, adds quant / dequant stubs around the model and inserts observers for calibration.
+    the model is changed in place.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the model to quantize
+        backend: quantized engine to use, 'fbgemm' (or 'x86' on newer pytorch versions) for x86 CPUs, 'qnnpack' for ARM
+
+    Returns: None
+    """
+    if backend not in torch.backends.quantized.supported_engines:
+        raise ValueError(f"quantization backend '{backend}' is not supported, "
+                         f"choose one of {torch.backends.quantized.supported_engines}")
+    torch.backends.quantized.engine = backend
+
+    model.cpu()
+    model.eval()
+    fuse_bonsai_modules(model)
+
+    model.quant = QuantStub()
+    model.dequant = DeQuantStub()
+    model.qconfig = get_default_qconfig(backend)
+    prepare(model, inplace=True)
+
+
+def convert_static_quantization(model):
+    """
+    converts a calibrated model (see prepare_static_quantization) to int8, in place.
+
+    Args:
+        model (bonsai.modules.bonsai_model.BonsaiModel): the calibrated model
+
+    Returns: None
+    """
+    model.eval()
+    convert(model, inplace=True)
@@ -0,0 +1,329 @@
+"""
+Sweeps over pruning configurations. A sweep is a yaml config file with a sweep section, see config_default.yaml, whose
+grid is expanded into trials. Every trial runs Bonsai.run_pruning in its own process with the config file and the
+trial's parameters applied, and as many trials run at once as the cpu and memory budget allows. The metrics, latency and
+model size of every evaluated pruning iteration are recorded in a SQLite database, see bonsai.utils.sweep_store.
+
+Trials with the same prefix, i.e. the same model, weights, data, pruner and settings affecting ranking, rank the same
+unpruned model in their first iteration. The first trial of every prefix saves its ranks and the others load them.
+Trials pruning randomly initialized models, without a weights file, have no prefix and rank their own models.
+
+Run from the command line with:
+
+    bonsai sweep sweep.yaml
+"""
+import hashlib
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import traceback
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, List, Optional
+import yaml
+from bonsai.config import config
+from bonsai.utils.sweep_store import SweepStore
+
+# parameters of the Bonsai object rather than config keys
+BONSAI_PARAMS = ("pruner", "normalize")
+# config sections and keys only used after the first ranking, they don't change a trial's prefix
+# seconds between checks for the rank caches of running trials, see run_sweep
+RANK_CACHE_POLL_INTERVAL = 1.
+RANK_INDEPENDENT_PARAMS = ("pruning.prune_percent", "pruning.num_iterations", "pruning.finetune_epochs",
+                           "pruning.patience", "pruning.early_stopping", "pruning.out_path", "pruning.bundle",
+                           "optimizer", "logging", "evaluate", "quantization", "sparsity", "proxy_eval",
+                           "accuracy_budget", "profiling", "telemetry", "sensitivity", "exploration", "sweep")
+
+
+def expand_grid(grid: Dict[str, list]) -> List[dict]:
+    """
+    Args:
+        grid: parameter name to list of values, single values are swept as a single value list
+
+    Returns: parameters of every trial, one for every combination of the values
+    """
+    names = list(grid)
+    values = [value if isinstance(value, list) else [value] for value in grid.values()]
+    return [dict(zip(names, combination)) for combination in itertools.product(*values)]
+
+
+def available_memory() -> Optional[int]:
+    """
+    Returns: available physical memory in bytes, None where the platform doesn't report it
+    """
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+def trial_budget(max_parallel: int = None, cpus_per_trial: int = 1, memory_per_trial: int = None) -> int:
+    """
+    Args:
+        max_parallel: most trials running at once, None for no limit
+        cpus_per_trial: cpu threads of every trial
+        memory_per_trial: bytes of memory needed by a trial, None to only budget cpus
+
+    Returns: number of trials to run at once, at least one
+    """
+    workers = max((os.cpu_count() or 1) // max(cpus_per_trial, 1), 1)
+    memory = available_memory()
+    if memory_per_trial and memory:
+        workers = min(workers, max(memory // memory_per_trial, 1))
+    if max_parallel:
+        workers = min(workers, max_parallel)
+    return workers
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _rank_independent(name: str) -> bool:
+    return any(name == param or name.startswith(param + ".") for param in RANK_INDEPENDENT_PARAMS)
+
+
+def prefix_key(settings: dict, params: dict, base_config: dict = None) -> Optional[str]:
+    """
+    hashes everything the first iteration's ranks depend on
+
+    Args:
+        settings: the sweep config section
+        params: the trial's parameters
+        base_config: the other sections of the sweep config file, applied to every trial
+
+    Returns: hex digest shared by trials ranking the same unpruned model the same way, None without a weights file,
+    as every trial initializes its model with different random weights
+    """
+    if not settings.get("weights"):
+        return None
+    ranking_config = {f"{section}.{key}": value for section, values in (base_config or {}).items()
+                      if isinstance(values, dict) for key, value in values.items()}
+    ranking_config.update({name: value for name, value in params.items() if name not in BONSAI_PARAMS})
+    ranking_config = {name: value for name, value in ranking_config.items() if not _rank_independent(name)}
+    key = {"model": _file_digest(settings["model"]),
+           "weights": _file_digest(settings["weights"]),
+           "data": settings["data"], "data_kwargs": settings.get("data_kwargs") or {},
+           "pruner": params.get("pruner", settings["pruner"]),
+           "normalize": params.get("normalize", settings["normalize"]),
+           "config": ranking_config}
+    return hashlib.sha1(json.dumps(key, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def rank_cache_path(settings: dict, prefix: str) -> str:
+    """
+    Returns: the file the first iteration ranks of a prefix are saved to
+    """
+    return os.path.join(settings["out_dir"], "rank_cache", f"{prefix}.pt")
+
+
+def apply_params(params: dict):
+    """
+    sets the trial's dotted config keys, e.g. pruning.prune_percent, in the global config
+    """
+    for name, value in params.items():
+        if name in BONSAI_PARAMS:
+            continue
+        *sections, key = name.split(".")
+        if not sections:
+            raise ValueError(f"sweep parameter {name} isn't a dotted config key")
+        view = config[sections[0]]
+        for section in sections[1:]:
+            view = view[section]
+        view[key] = value
+
+
+def load_data(entry: str, **kwargs):
+    """
+    calls the data function of a sweep
+
+    Args:
+        entry: "module:function", the module is imported from the working directory or the python path
+        **kwargs: keyword arguments of the function
+
+    Returns: (train_dl, val_dl, test_dl, criterion, metrics), metrics being a dict of extra evaluation metrics
+    """
+    if os.getcwd() not in sys.path:
+        sys.path.insert(0, os.getcwd())
+    module_name, function_name = entry.split(":")
+    data = getattr(importlib.import_module(module_name), function_name)(**kwargs)
+    if len(data) == 4:
+        data = (*data, {})
+    return data
+
+
+def _iteration_recorder(store: SweepStore, trial_id: int, bonsai):
+    # evaluations only time the model when evaluate.eval_speed is set, appending to metrics_list
+    metrics_count = [0]
+
+    def start(engine):
+        if engine.state.phase_record["phase"] == "eval":
+            metrics_count[0] = len(bonsai.metrics_list)
+
+    def record(engine):
+        phase_record = engine.state.phase_record
+        if phase_record["phase"] != "eval":
+            return
+        model = bonsai.model
+        parameters = list(model.parameters())
+        timed = len(bonsai.metrics_list) > metrics_count[0]
+        latency = bonsai.metrics_list[-1].get("avg_time") if timed else None
+        store.record_iteration(trial_id, phase_record["iteration"], bonsai.last_metrics,
+                               latency_ms=latency * 1e3 if latency is not None else None,
+                               num_parameters=sum(p.numel() for p in parameters),
+                               model_size_mb=sum(p.numel() * p.element_size() for p in parameters) / 2 ** 20,
+                               prunable_filters=model.total_prunable_filters())
+    return start, record
+
+
+def run_trial(config_path: str, trial_id: int, params: dict, prefix: Optional[str]) -> int:
+    """
+    runs a single trial, meant to run in its own process as it changes the global config. Errors are recorded in the
+    database instead of being raised.
+
+    Args:
+        config_path: the sweep config file
+        trial_id: id of the trial in the database
+        params: the trial's parameters
+        prefix: prefix key of the trial, None to not share ranks
+
+    Returns: trial_id
+    """
+    import torch
+    from bonsai import Bonsai
+    from bonsai.pruning.exploration import pruner_class
+    from bonsai.utils.telemetry import PhaseEvents
+
+    config.set_file(config_path)
+    apply_params(params)
+    settings = config["sweep"].get()
+    out_path = os.path.join(settings["out_dir"], f"trial_{trial_id}")
+    config["pruning"]["out_path"] = out_path
+    config["logging"]["logdir"] = os.path.join(out_path, "runs")
+    torch.set_num_threads(settings["cpus_per_trial"])
+
+    store = SweepStore(settings["database"])
+    store.start_trial(trial_id, out_path)
+    try:
+        train_dl, val_dl, test_dl, criterion, metrics = load_data(settings["data"], **(settings["data_kwargs"] or {}))
+        pruner = pruner_class(params.get("pruner", settings["pruner"]), None)
+        bonsai = Bonsai(settings["model"], pruner, normalize=params.get("normalize", settings["normalize"]))
+        if settings["weights"]:
+            bonsai.model.load_state_dict(torch.load(settings["weights"], map_location="cpu"))
+        if prefix is not None:
+            bonsai.rank_cache = rank_cache_path(settings, prefix)
+        for name, metric in metrics.items():
+            bonsai.attach_metric_to_eval(name, metric)
+        start_eval, record_eval = _iteration_recorder(store, trial_id, bonsai)
+        bonsai.telemetry.engine.add_event_handler(PhaseEvents.PHASE_STARTED, start_eval)
+        bonsai.telemetry.engine.add_event_handler(PhaseEvents.PHASE_COMPLETED, record_eval)
+        bonsai.run_pruning(train_dl, val_dl, test_dl, criterion)
+        store.finish_trial(trial_id)
+    except Exception:
+        store.finish_trial(trial_id, traceback.format_exc())
+    finally:
+        store.close()
+    return trial_id
+
+
+def plan_sweep(config_path: str, name: str = None) -> dict:
+    """
+    reads a sweep config file and expands its grid, without running or recording anything
+
+    Returns: dictionary with the sweep name, its settings, the parameters and prefix of every trial and the number
+    of trials run at once
+    """
+    config.set_file(config_path)
+    settings = config["sweep"].get()
+    with open(config_path) as f:
+        base_config = {section: values for section, values in (yaml.safe_load(f) or {}).items() if section != "sweep"}
+    trials = []
+    for params in expand_grid(settings["grid"] or {}):
+        prefix = prefix_key(settings, params, base_config) if settings["cache_ranks"] else None
+        trials.append({"params": params, "prefix": prefix})
+    return {"name": name or os.path.splitext(os.path.basename(config_path))[0], "settings": settings,
+            "trials": trials, "workers": trial_budget(settings["max_parallel"], settings["cpus_per_trial"],
+                                                      settings["memory_per_trial"])}
+
+
+def run_sweep(config_path: str, name: str = None) -> List[int]:
+    """
+    runs every trial of a sweep config file, skipping trials already completed by an earlier run of the same sweep
+    unless sweep.rerun is set. Trials run in spawned processes, and trials sharing a prefix wait until the first one of
+    their prefix saved its ranks, which they load, or until it ended without saving them.
+
+    Args:
+        config_path: yaml config file with a sweep section
+        name: sweep name in the database, the config file name by default
+
+    Returns: ids of the trials run
+    """
+    plan = plan_sweep(config_path, name)
+    settings = plan["settings"]
+    os.makedirs(settings["out_dir"], exist_ok=True)
+
+    pending = []
+    with SweepStore(settings["database"]) as store:
+        for trial in plan["trials"]:
+            previous = store.find_trial(plan["name"], trial["params"])
+            if previous is not None and previous["status"] == "done" and not settings["rerun"]:
+                print(f"Skipping completed trial {previous['id']}: {trial['params']}")
+                continue
+            pending.append((store.add_trial(plan["name"], trial["params"], trial["prefix"]), trial["params"],
+                            trial["prefix"]))
+
+    # the first trial of every prefix ranks the model, the rest of the prefix is submitted once its ranks are saved
+    first, waiting = [], defaultdict(list)
+    for trial in pending:
+        prefix = trial[2]
+        if prefix is None or os.path.exists(rank_cache_path(settings, prefix)):
+            first.append(trial)
+        elif prefix not in waiting:
+            first.append(trial)
+            waiting[prefix] = []
+        else:
+            waiting[prefix].append(trial)
+
+    print(f"Running {len(pending)} trials, {plan['workers']} at a time")
+    with ProcessPoolExecutor(plan["workers"], mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = {executor.submit(run_trial, config_path, *trial): trial for trial in first}
+        while futures:
+            done, _ = wait(futures, timeout=RANK_CACHE_POLL_INTERVAL if waiting else None,
+                           return_when=FIRST_COMPLETED)
+            ready = [prefix for prefix in waiting if os.path.exists(rank_cache_path(settings, prefix))]
+            for future in done:
+                trial = futures.pop(future)
+                print(f"Finished trial {future.result()}")
+                # followers of a trial that ended without saving its ranks rank the model themselves
+                if trial[2] in waiting:
+                    ready.append(trial[2])
+            for prefix in set(ready):
+                for follower in waiting.pop(prefix):
+                    futures[executor.submit(run_trial, config_path, *follower)] = follower
+    return [trial[0] for trial in pending]
+
+
+def summarize_sweep(database: str, name: str) -> str:
+    """
+    Returns: a markdown table with the status, parameters and last recorded iteration of every trial of a sweep
+    """
+    lines = ["| trial | status | params | iteration | metrics | latency_ms | model_size_mb |",
+             "|---|---|---|---|---|---|---|"]
+    with SweepStore(database) as store:
+        for trial in store.trials(name):
+            iterations = store.iterations(trial["id"])
+            last = iterations[-1] if iterations else {}
+            metrics = ", ".join(f"{key}: {value:.4f}" for key, value in last.get("metrics", {}).items())
+            latency = last.get("latency_ms")
+            size = last.get("model_size_mb")
+            lines.append(f"| {trial['id']} | {trial['status']} | {json.dumps(trial['params'])} | "
+                         f"{last.get('iteration', '')} | {metrics} | "
+                         f"{'' if latency is None else f'{latency:.3f}'} | {'' if size is None else f'{size:.2f}'} |")
+    return "\n".join(lines)
@@ -0,0 +1,127 @@
+"""
+Local SQLite store for the results of pruning sweeps. Every trial is a row of the trials table, holding its parameters
+as JSON, and every evaluated pruning iteration of a trial is a row of the iterations table, holding its metrics,
+latency and model size. Trials run in separate processes, each opening its own connection to the database.
+"""
+import json
+import sqlite3
+import time
+from typing import List, Optional
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trials (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sweep TEXT NOT NULL,
+    params TEXT NOT NULL,
+    prefix TEXT,
+    status TEXT NOT NULL,
+    out_path TEXT,
+    error TEXT,
+    started REAL,
+    finished REAL
+);
+CREATE TABLE IF NOT EXISTS iterations (
+    trial_id INTEGER NOT NULL REFERENCES trials(id),
+    iteration INTEGER NOT NULL,
+    metrics TEXT NOT NULL,
+    latency_ms REAL,
+    num_parameters INTEGER,
+    model_size_mb REAL,
+    prunable_filters INTEGER,
+    recorded REAL,
+    PRIMARY KEY (trial_id, iteration)
+);
+"""
+
+
+def params_key(params: dict) -> str:
+    """
+    Returns: canonical JSON of trial parameters, equal parameters always give the same string
+    """
+    return json.dumps(params, sort_keys=True)
+
+
+class SweepStore:
+    """
+    SQLite database of sweep trials and their pruning iterations
+
+    Args:
+        path: database file, created with its tables if missing
+        timeout: seconds to wait for a lock held by another trial's connection
+    """
+
+    def __init__(self, path: str, timeout: float = 60.):
+        self.path = path
+        self.connection = sqlite3.connect(path, timeout=timeout)
+        self.connection.row_factory = sqlite3.Row
+        # lets trials write while others read
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.executescript(SCHEMA)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def add_trial(self, sweep: str, params: dict, prefix: str = None) -> int:
+        """
+        Returns: id of the new pending trial
+        """
+        with self.connection:
+            cursor = self.connection.execute(
+                "INSERT INTO trials (sweep, params, prefix, status) VALUES (?, ?, ?, 'pending')",
+                (sweep, params_key(params), prefix))
+        return cursor.lastrowid
+
+    def find_trial(self, sweep: str, params: dict) -> Optional[sqlite3.Row]:
+        """
+        Returns: the latest trial of the sweep with the given parameters, None if there isn't one
+        """
+        return self.connection.execute("SELECT * FROM trials WHERE sweep = ? AND params = ? ORDER BY id DESC LIMIT 1",
+                                       (sweep, params_key(params))).fetchone()
+
+    def start_trial(self, trial_id: int, out_path: str):
+        with self.connection:
+            self.connection.execute("UPDATE trials SET status = 'running', out_path = ?, started = ? WHERE id = ?",
+                                    (out_path, time.time(), trial_id))
+
+    def finish_trial(self, trial_id: int, error: str = None):
+        """
+        marks a trial as done, or as failed if an error is given
+        """
+        with self.connection:
+            self.connection.execute("UPDATE trials SET status = ?, error = ?, finished = ? WHERE id = ?",
+                                    ("failed" if error else "done", error, time.time(), trial_id))
+
+    def record_iteration(self, trial_id: int, iteration: int, metrics: dict, latency_ms: float = None,
+                         num_parameters: int = None, model_size_mb: float = None, prunable_filters: int = None):
+        """
+        records an evaluated pruning iteration, replacing an earlier record of the same iteration
+        """
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO iterations VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                    (trial_id, iteration, json.dumps(metrics), latency_ms, num_parameters,
+                                     model_size_mb, prunable_filters, time.time()))
+
+    def trials(self, sweep: str = None) -> List[dict]:
+        """
+        Returns: all trials, or the trials of a single sweep, with their parameters decoded
+        """
+        if sweep is None:
+            rows = self.connection.execute("SELECT * FROM trials ORDER BY id").fetchall()
+        else:
+            rows = self.connection.execute("SELECT * FROM trials WHERE sweep = ? ORDER BY id", (sweep,)).fetchall()
+        return [dict(row, params=json.loads(row["params"])) for row in rows]
+
+    def iterations(self, trial_id: int) -> List[dict]:
+        """
+        Returns: the recorded iterations of a trial in order, with their metrics decoded
+        """
+        rows = self.connection.execute("SELECT * FROM iterations WHERE trial_id = ? ORDER BY iteration",
+                                       (trial_id,)).fetchall()
+        return [dict(row, metrics=json.loads(row["metrics"])) for row in rows]
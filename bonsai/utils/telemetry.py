@@ -0,0 +1,161 @@
+"""
+Phase level telemetry for the pruning pipeline. Every ranking, pruning, fine tuning and evaluation phase records its
+wall time, CPU time, peak memory and, for phases running an ignite engine, the number of samples and how the time splits
+between waiting for the data loader and computing. Records are fired as ignite events, appended to a JSONL file and
+logged to tensorboard.
+"""
+import json
+import sys
+import time
+from contextlib import contextmanager
+from enum import Enum
+from typing import List, TYPE_CHECKING
+import torch
+from ignite.engine import Engine, Events, State
+
+try:
+    from ignite.engine.events import EventEnum
+except ImportError:
+    # older ignite versions register plain enums
+    EventEnum = Enum
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+if TYPE_CHECKING:
+    from torch.utils.tensorboard import SummaryWriter
+
+
+class PhaseEvents(EventEnum):
+    """
+    events fired on PipelineTelemetry.engine, the phase record is available as engine.state.phase_record
+    """
+    PHASE_STARTED = "phase_started"
+    PHASE_COMPLETED = "phase_completed"
+
+
+def peak_rss_mb() -> float:
+    """
+    Returns: peak resident set size of the process so far in MB, 0 on platforms without the resource module
+    """
+    if resource is None:
+        return 0.
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+
+
+def _batch_size(batch) -> int:
+    if isinstance(batch, (list, tuple)) and batch:
+        batch = batch[0]
+    if isinstance(batch, torch.Tensor):
+        return batch.size(0) if batch.dim() else 1
+    return 0
+
+
+class _PhaseRecorder:
+    """
+    accumulates the data loader wait time, compute time and samples of the engines attached to a single phase
+    """
+
+    def __init__(self):
+        self.data_wait = 0.
+        self.compute = 0.
+        self.samples = 0
+        self._mark = None
+
+    def attach(self, engine: Engine):
+        engine.add_event_handler(Events.EPOCH_STARTED, self._epoch_started)
+        engine.add_event_handler(Events.ITERATION_STARTED, self._iteration_started)
+        engine.add_event_handler(Events.ITERATION_COMPLETED, self._iteration_completed)
+
+    def _epoch_started(self, engine):
+        self._mark = time.perf_counter()
+
+    def _iteration_started(self, engine):
+        now = time.perf_counter()
+        if self._mark is not None:
+            self.data_wait += now - self._mark
+        self._mark = now
+
+    def _iteration_completed(self, engine):
+        now = time.perf_counter()
+        self.compute += now - self._mark
+        self.samples += _batch_size(getattr(engine.state, "batch", None))
+        self._mark = now
+
+
+class PipelineTelemetry:
+    """
+    records the stats of every pipeline phase. Handlers for PhaseEvents can be attached to the engine attribute:
+
+        bonsai.telemetry.engine.add_event_handler(PhaseEvents.PHASE_COMPLETED,
+                                                  lambda engine: print(engine.state.phase_record))
+
+    Args:
+        writer: tensorboard summary writer, None for no tensorboard logging
+        jsonl_path: file to append a JSON line per phase to, None for no file
+    """
+
+    def __init__(self, writer: "SummaryWriter" = None, jsonl_path: str = None):
+        self.writer = writer
+        self.jsonl_path = jsonl_path
+        self.records: List[dict] = []
+        self.engine = Engine(lambda engine, batch: None)
+        self.engine.register_events(*PhaseEvents)
+        self.engine.state = State()
+        self._recorder = None
+
+    def attach(self, engine: Engine):
+        """
+        measures the data loader wait time, compute time and samples of an engine as part of the running phase, does
+        nothing outside of a phase
+        """
+        if self._recorder is not None:
+            self._recorder.attach(engine)
+
+    def _fire(self, event: PhaseEvents, record: dict):
+        self.engine.state.phase_record = record
+        self.engine._fire_event(event)
+
+    @contextmanager
+    def phase(self, name: str, iteration: int):
+        """
+        context manager recording a single phase, engines attached while it's active are included in its record
+
+        Args:
+            name: phase name, e.g. rank, prune, finetune or eval
+            iteration: pruning iteration the phase belongs to, 0 for the evaluation before pruning
+        """
+        recorder = self._recorder = _PhaseRecorder()
+        self._fire(PhaseEvents.PHASE_STARTED, {"phase": name, "iteration": iteration})
+        cuda = torch.cuda.is_available()
+        if cuda:
+            torch.cuda.reset_peak_memory_stats()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        try:
+            yield recorder
+        finally:
+            self._recorder = None
+        wall_time = time.perf_counter() - wall_start
+        record = {"phase": name, "iteration": iteration, "wall_time": wall_time,
+                  "cpu_time": time.process_time() - cpu_start, "peak_rss_mb": peak_rss_mb(),
+                  "samples": recorder.samples, "samples_per_sec": recorder.samples / wall_time if wall_time else 0.,
+                  "data_wait_time": recorder.data_wait, "compute_time": recorder.compute,
+                  "other_time": max(wall_time - recorder.data_wait - recorder.compute, 0.)}
+        if cuda:
+            record["cuda_peak_mb"] = torch.cuda.max_memory_allocated() / 2 ** 20
+        self._emit(record)
+
+    def _emit(self, record: dict):
+        self.records.append(record)
+        if self.jsonl_path:
+            with open(self.jsonl_path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        if self.writer:
+            for key, value in record.items():
+                if key not in ("phase", "iteration"):
+                    self.writer.add_scalar(f"telemetry/{record['phase']}/{key}", value, record["iteration"])
+        self._fire(PhaseEvents.PHASE_COMPLETED, record)
@@ -20,7 +20,7 @@ install_requires = ["confuse",
                     "pyyaml",
                     "seaborn",
                     "tensorboard",
-                    "torch>=1.1.0",
+                    "torch>=1.11.0",
                     "tqdm"]
 
 tests_require = ["coverage",
@@ -32,6 +32,7 @@ setup(
     name='pytorch-bonsai',
     version='0.0.1',
     packages=find_packages(exclude=('tests', 'tests.*',)),
+    package_data={"bonsai": ["config_default.yaml"]},
     url='https://github.com/ItamarWilf/pytorch-bonsai',
     license='MIT ',
     author='Itamar Wilf',
@@ -39,7 +40,9 @@ setup(
     description='Basic pruning for Pytorch neural netwroks',
     long_description=readme,
     long_description_content_type="text/markdown",
-    zip_safe=True,
+    zip_safe=False,
+    python_requires=">=3.7",
+    entry_points={"console_scripts": ["bonsai=bonsai.cli:main"]},
     install_requires=install_requires,
     tests_require=tests_require
 )
@@ -33,6 +33,15 @@ def out_path(tmpdir):
     yield
 
 
+@pytest.fixture
+def accuracy_budget():
+    config["accuracy_budget"]["enabled"] = True
+    yield config["accuracy_budget"]
+    config["accuracy_budget"]["enabled"] = False
+    config["accuracy_budget"]["max_drop"] = 0.05
+    config["accuracy_budget"]["bisect_steps"] = 2
+
+
 @pytest.fixture()
 def train_transform():
     transform_train = transforms.Compose([
@@ -148,6 +157,20 @@ class TestFullPrune:
         resnet18_new_bn_with_activation_l2_prunner.run_pruning(train_dl=train_dl, val_dl=val_dl, test_dl=test_dl,
                                                                criterion=criterion, prune_percent=0.1, iterations=8)
 
+    def test_run_pruning_accuracy_budget_rollback(self, fcn_vgg16_with_weight_l2_prunner, train_dl, val_dl, test_dl,
+                                                  criterion, logdir, out_path, accuracy_budget):
+        # every step crosses the budget, so the first step and its bisection are rolled back
+        accuracy_budget["max_drop"] = -1e9
+        accuracy_budget["bisect_steps"] = 1
+        original_model = fcn_vgg16_with_weight_l2_prunner.model
+        fcn_vgg16_with_weight_l2_prunner.run_pruning(train_dl=train_dl, val_dl=val_dl, test_dl=test_dl,
+                                                     criterion=criterion, prune_percent=0.1)
+        history = fcn_vgg16_with_weight_l2_prunner.budget_history
+        assert [step["accepted"] for step in history] == [False, False]
+        assert history[1]["num_filters"] == history[0]["num_filters"] // 2
+        assert fcn_vgg16_with_weight_l2_prunner.best_iteration == 0
+        assert fcn_vgg16_with_weight_l2_prunner.model is original_model
+
 
 class TestConfigurationFileParser:
 
@@ -0,0 +1,48 @@
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# seconds importing bonsai and building a model may take once torch is imported, well above the time it takes with
+# lazy imports and below the time it took with the heavy dependencies imported eagerly
+IMPORT_TIME_BUDGET = 1.0
+HEAVY_MODULES = ["matplotlib", "seaborn", "torch.utils.tensorboard", "ignite", "confuse", "bonsai.main",
+                 "bonsai.modules.bonsai_parser"]
+
+
+def _run_in_subprocess(code, cwd):
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    output = subprocess.check_output([sys.executable, "-c", code], cwd=str(cwd), env=env)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def test_building_model_skips_heavy_imports(tmp_path):
+    code = "import json, sys\n" \
+           "import bonsai\n" \
+           "from bonsai.modules.bonsai_model import BonsaiModel\n" \
+           f"BonsaiModel({os.path.join(REPO_ROOT, 'tests/example_models_for_tests/configs/resnet18.cfg')!r})\n" \
+           f"print(json.dumps([m for m in {HEAVY_MODULES!r} if m in sys.modules]))\n"
+    assert _run_in_subprocess(code, tmp_path) == []
+    # nothing is written to the working directory at import
+    assert os.listdir(str(tmp_path)) == []
+
+
+def test_bonsai_loaded_on_access(tmp_path):
+    code = "import json, sys\n" \
+           "from bonsai import Bonsai\n" \
+           "from bonsai.config import config\n" \
+           "print(json.dumps([Bonsai.__module__, config['pruning']['bundle'].get()]))\n"
+    assert _run_in_subprocess(code, tmp_path) == ["bonsai.main", True]
+
+
+def test_import_time(tmp_path):
+    code = "import json, time\n" \
+           "import torch\n" \
+           "start = time.perf_counter()\n" \
+           "import bonsai\n" \
+           "from bonsai.modules.bonsai_model import BonsaiModel\n" \
+           f"BonsaiModel({os.path.join(REPO_ROOT, 'tests/example_models_for_tests/configs/resnet18.cfg')!r})\n" \
+           "print(json.dumps(time.perf_counter() - start))\n"
+    # torch is imported first, its import time isn't bonsai's
+    assert _run_in_subprocess(code, tmp_path) < IMPORT_TIME_BUDGET
@@ -104,3 +104,49 @@ class TestResnet18:
         model_output = resnet18(model_input)
         assert model_output[0].size() == (1, 10)
 
+
+class TestActivationCheckpointing:
+
+    @pytest.fixture()
+    def unet(self):
+        cfg_path = "tests/example_models_for_tests/configs/U-NET.cfg"
+        model = BonsaiModel(cfg_path, None)
+        yield model
+
+    def test_segments_cover_model(self, unet):
+        segments = unet.plan_checkpoint_segments(4, 64, 64)
+        assert len(segments) == 4
+        assert segments[0][0] == 0
+        assert segments[-1][1] == len(unet.module_list)
+        for (_, end), (start, _) in zip(segments[:-1], segments[1:]):
+            assert end == start
+
+    def test_checkpointing_keeps_gradients(self, unet):
+        model_input = torch.rand(2, 4, 64, 64)
+        unet.train()
+        unet(model_input)[0].sum().backward()
+        grads = [p.grad.clone() for p in unet.parameters()]
+        unet.zero_grad()
+
+        unet.enable_checkpointing(4, 64, 64)
+        unet(model_input)[0].sum().backward()
+        for grad, p in zip(grads, unet.parameters()):
+            assert torch.allclose(grad, p.grad, atol=1e-5)
+
+
+class TestEmptyInit:
+
+    def test_empty_init_matches_loaded_model(self):
+        cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+        model = BonsaiModel(cfg_path, None)
+        empty_model = BonsaiModel(cfg_path, None, empty_init=True)
+        # older pytorch versions can't use torch.device as a context manager and build the model on the cpu
+        if hasattr(torch.device, "__enter__"):
+            assert all(p.is_meta for p in empty_model.parameters())
+
+        empty_model.materialize()
+        empty_model.load_state_dict(model.state_dict())
+        model.eval()
+        empty_model.eval()
+        model_input = torch.rand(1, 3, 32, 32)
+        assert torch.equal(model(model_input)[0], empty_model(model_input)[0])
@@ -0,0 +1,89 @@
+import pytest
+import torch
+from torch import nn
+from torchvision.models import resnet18, resnet50
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.modules.bonsai_parser import bonsai_parser, find_real_ancestors
+from u_net import UNet
+
+
+@pytest.fixture()
+def unet():
+    yield UNet(4, 4)
+
+
+class TestBonsaiParser:
+
+    def test_unet_routes(self, unet):
+        parsed_model = bonsai_parser(unet, torch.rand(1, 4, 64, 64))
+        type_names = [module.type_name for module in parsed_model.modules]
+        assert type_names.count("route") == 4
+        assert "residual_add" not in type_names
+
+        for i, module in enumerate(parsed_model.modules):
+            if module.type_name == "route":
+                layers = eval(module.params["layers"])
+                # concatenation order is kept - skip connection first, then the upsampled deconv right before the route
+                assert layers[1] == -1
+                assert parsed_model.modules[i - 1].type_name == "prunable_deconv2d"
+                assert layers[0] < layers[1]
+
+    def test_unet_fx_and_jit_agree(self, unet):
+        model_in = torch.rand(1, 4, 64, 64)
+        assert str(bonsai_parser(unet, model_in, method="fx")) == str(bonsai_parser(unet, model_in, method="jit"))
+
+    def test_resnet50_residual_adds(self):
+        parsed_model = bonsai_parser(resnet50(), torch.rand(1, 3, 224, 224))
+        type_names = [module.type_name for module in parsed_model.modules]
+        assert type_names.count("residual_add") == 16
+        # downsampling convolutions read the block input
+        assert type_names.count("route") == 4
+        assert "batchnorm2d" not in type_names
+        for i, module in enumerate(parsed_model.modules):
+            if module.type_name == "residual_add":
+                layers = eval(module.params["layers"])
+                assert len(layers) == 2
+                assert all(layer < 0 for layer in layers)
+
+    def test_long_intermediate_chain(self):
+        # deeper than the recursion limit
+        predecessors = {f"node_{i}": [f"node_{i - 1}"] for i in range(1, 20000)}
+        predecessors["node_0"] = ["conv"]
+        predecessors["add"] = ["node_19999", "conv"]
+        real_ancestors = find_real_ancestors(predecessors["add"], predecessors, {"conv", "add"})
+        assert real_ancestors == ["conv", "conv"]
+
+    def test_route_layers_point_at_shifted_layers(self):
+        parsed_model = bonsai_parser(resnet50(), torch.rand(1, 3, 224, 224))
+        for i, module in enumerate(parsed_model.modules):
+            if module.type_name == "residual_add":
+                # the add follows its last executed input
+                assert -1 in eval(module.params["layers"])
+
+
+class TestFromTorchModule:
+
+    def test_unet_weights(self, unet):
+        model_in = torch.rand(1, 4, 64, 64)
+        model = BonsaiModel.from_torch_module(unet, model_in)
+        assert torch.allclose(model(model_in)[0], unet(model_in), atol=1e-5)
+
+    def test_resnet18_weights(self):
+        resnet = resnet18()
+        resnet.eval()
+        model_in = torch.rand(2, 3, 64, 64)
+        model = BonsaiModel.from_torch_module(resnet, model_in)
+        model.eval()
+        assert torch.allclose(model(model_in)[0], resnet(model_in), atol=1e-4)
+
+    def test_unsupported_ops_fail_parity(self):
+        class Scaled(nn.Module):
+            def __init__(self):
+                super(Scaled, self).__init__()
+                self.conv = nn.Conv2d(3, 8, 3)
+
+            def forward(self, x):
+                return self.conv(x) * 2
+
+        with pytest.raises(ValueError):
+            BonsaiModel.from_torch_module(Scaled(), torch.rand(1, 3, 16, 16))
@@ -0,0 +1,48 @@
+import pytest
+import torch
+from bonsai.modules.bonsai_model import BonsaiModel
+
+
+@pytest.fixture()
+def fcn_vgg16():
+    cfg_path = "tests/example_models_for_tests/configs/FCN-VGG16.cfg"
+    yield BonsaiModel(cfg_path, None)
+
+
+@pytest.fixture()
+def resnet18():
+    cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+    yield BonsaiModel(cfg_path, None)
+
+
+class TestMemoryPlanner:
+
+    def test_skip_connection_live_range(self, resnet18):
+        live_ranges = resnet18.memory_planner().live_ranges()
+        for i, module_references in enumerate(resnet18.layer_references()):
+            for layer in module_references:
+                assert live_ranges[layer][1] >= i
+
+    def test_unread_outputs_not_kept(self, resnet18):
+        counter = resnet18.output_manager.init_counter
+        names = [module.module_cfg["name"] for module in resnet18.module_list]
+        referenced = {layer for module_references in resnet18.layer_references() for layer in module_references}
+        for i, name in enumerate(names):
+            assert (counter[name] > 0) == (i in referenced)
+
+    def test_peak_memory_estimate(self, fcn_vgg16):
+        inference = fcn_vgg16.estimate_peak_memory(4)
+        training = fcn_vgg16.estimate_peak_memory(4, training=True)
+        assert 0 < inference < training
+        assert fcn_vgg16.estimate_peak_memory(8) == 2 * inference
+        assert fcn_vgg16.estimate_peak_memory(4, dtype=torch.float16) == inference // 2
+
+    def test_inplace_activations_keep_output(self, resnet18):
+        resnet18.eval()
+        model_input = torch.rand(2, 3, 32, 32)
+        with torch.no_grad():
+            expected = resnet18(model_input)[0]
+            peak = resnet18.estimate_peak_memory(2, training=True)
+            assert resnet18.enable_inplace_activations()
+            assert resnet18.estimate_peak_memory(2, training=True) < peak
+            assert torch.allclose(resnet18(model_input)[0], expected)
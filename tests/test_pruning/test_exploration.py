@@ -0,0 +1,68 @@
+import json
+import os
+import pytest
+import torch
+from torch import nn
+from bonsai import Bonsai
+from bonsai.config import config
+from bonsai.pruning import WeightL2Prunner
+from bonsai.pruning.exploration import candidate_grid, merge_caps, recalibrate_batch_norm, best_candidate
+from bonsai.utils.engine_hooks import BonsaiLoss
+
+
+@pytest.fixture()
+def out_path(tmpdir):
+    config["pruning"]["out_path"] = str(tmpdir)
+    yield str(tmpdir)
+
+
+@pytest.fixture()
+def batches():
+    torch.manual_seed(0)
+    yield [(torch.rand(4, 3, 32, 32), torch.randint(10, (4,))) for _ in range(2)]
+
+
+class TestExploration:
+
+    def test_candidate_grid(self):
+        grid = candidate_grid([None, "ActivationL2Prunner"], [False, True], [None])
+        assert len(grid) == 4
+        assert grid[1] == {"pruner": None, "normalize": True, "cap": None}
+
+    def test_merge_caps(self):
+        assert merge_caps({1: 0.25}, [1, 3], None) == {1: 0.25}
+        assert merge_caps({1: 0.25}, [1, 3], 0.5) == {1: 0.25, 3: 0.5}
+
+    def test_best_candidate(self):
+        scores = [{"loss": 2., "acc": 0.5}, {"loss": 1., "acc": 0.4}]
+        assert best_candidate(scores) == 1
+        assert best_candidate(scores, "acc", higher_is_better=True) == 0
+
+    def test_recalibrate_batch_norm(self):
+        model = nn.Sequential(nn.Conv2d(3, 4, 1), nn.BatchNorm2d(4))
+        model.eval()
+        calibration = [(torch.rand(8, 3, 4, 4) + i, None) for i in range(2)]
+        recalibrate_batch_norm(model, calibration)
+        with torch.no_grad():
+            # a cumulative average of the batch means, which have equal sizes
+            expected = torch.stack([model[0](x).mean(dim=(0, 2, 3)) for x, _ in calibration]).mean(dim=0)
+        assert torch.allclose(model[1].running_mean, expected, atol=1e-5)
+        assert model[1].momentum == 0.1
+        assert not model.training
+
+    def test_explore_keeps_best_candidate(self, batches, out_path):
+        bonsai = Bonsai("tests/example_models_for_tests/configs/VGG19.cfg", WeightL2Prunner)
+        bonsai._metrics["loss"] = BonsaiLoss(nn.CrossEntropyLoss())
+        total_filters = bonsai.model.total_prunable_filters()
+        bonsai._explore(batches, batches, None, 64, 1)
+
+        candidates = bonsai.exploration[1]
+        assert 1 <= len(candidates) <= 4
+        chosen = [candidate for candidate in candidates if candidate["chosen"]]
+        assert len(chosen) == 1
+        assert chosen[0]["loss"] == min(candidate["loss"] for candidate in candidates)
+        assert bonsai.model.total_prunable_filters() == chosen[0]["num_filters"] < total_filters
+        assert isinstance(bonsai.prunner, WeightL2Prunner)
+        with open(os.path.join(out_path, "pruning_iteration_1_exploration.json")) as f:
+            assert json.load(f) == candidates
+        bonsai.wait_for_checkpoints()
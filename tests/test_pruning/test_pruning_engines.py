@@ -0,0 +1,60 @@
+import pytest
+import torch
+from torch import nn
+from ignite.engine import Events
+from torch.utils.data import DataLoader, TensorDataset
+from bonsai import Bonsai
+from bonsai.pruning import ActivationL2Prunner
+from bonsai.pruning.pruning_engines import create_supervised_trainer, create_supervised_evaluator, \
+    create_supervised_ranker
+
+
+@pytest.fixture()
+def vgg19():
+    cfg_path = "tests/example_models_for_tests/configs/VGG19.cfg"
+    bonsai = Bonsai(cfg_path, ActivationL2Prunner)
+    yield bonsai
+
+
+@pytest.fixture()
+def random_dl():
+    dataset = TensorDataset(torch.rand(8, 3, 32, 32), torch.randint(0, 10, (8,)))
+    yield DataLoader(dataset, batch_size=4)
+
+
+class TestChannelsLastAutocast:
+
+    def test_trainer(self, vgg19, random_dl):
+        optimizer = torch.optim.SGD(vgg19.model.parameters(), lr=0.01)
+        trainer = create_supervised_trainer(vgg19.model, optimizer, nn.CrossEntropyLoss(), device="cpu",
+                                            channels_last=True, autocast_dtype=torch.bfloat16)
+        trainer.run(random_dl, max_epochs=1)
+        assert vgg19.model.module_list[0].conv2d.weight.is_contiguous(memory_format=torch.channels_last)
+        assert vgg19.model.module_list[0].conv2d.weight.dtype == torch.float32
+
+    def test_evaluator_outputs_fp32(self, vgg19, random_dl):
+        evaluator = create_supervised_evaluator(vgg19.model, device="cpu", channels_last=True,
+                                                autocast_dtype=torch.bfloat16)
+        evaluator.run(random_dl, max_epochs=1)
+        y_pred, _ = evaluator.state.output
+        assert y_pred[0].dtype == torch.float32
+
+    def test_ranker_accumulates_fp32(self, vgg19, random_dl):
+        def rank(bonsai, **kwargs):
+            bonsai.model.to_rank = True
+            bonsai.prunner.set_up()
+            ranker = create_supervised_ranker(bonsai.model, bonsai.prunner, nn.CrossEntropyLoss(), device="cpu",
+                                              **kwargs)
+            ranker.add_event_handler(Events.ITERATION_COMPLETED, bonsai.prunner.compute_model_ranks)
+            ranker.run(random_dl, max_epochs=1)
+            return [module.ranking for _, module in bonsai.prunner._prunable_modules_iterator()]
+
+        fp32_bonsai = Bonsai("tests/example_models_for_tests/configs/VGG19.cfg", ActivationL2Prunner)
+        fp32_bonsai.model.load_state_dict(vgg19.model.state_dict())
+        expected = rank(fp32_bonsai)
+        ranks = rank(vgg19, channels_last=True, autocast_dtype=torch.bfloat16)
+        for ranking, expected_ranking in zip(ranks, expected):
+            assert ranking.dtype == torch.float32
+            assert torch.isfinite(ranking).all() and ranking.abs().sum() > 0
+            # bf16 rounds every activation, accumulating in fp32 keeps the sums close to the fp32 ranks
+            assert torch.allclose(ranking, expected_ranking, rtol=0.1, atol=1e-3 * expected_ranking.abs().max().item())
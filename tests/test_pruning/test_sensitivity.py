@@ -0,0 +1,57 @@
+import pytest
+import torch
+from torch import nn
+from bonsai import Bonsai
+from bonsai.pruning import WeightL2Prunner
+from bonsai.pruning.sensitivity import sensitivity_scan, layer_caps_from_sensitivity, layer_groups
+
+
+@pytest.fixture()
+def ranked_bonsai():
+    bonsai = Bonsai("tests/example_models_for_tests/configs/VGG19.cfg", WeightL2Prunner)
+    bonsai._rank(None, None, 1)
+    yield bonsai
+
+
+@pytest.fixture()
+def batches():
+    torch.manual_seed(0)
+    yield [(torch.rand(4, 3, 32, 32), torch.randint(10, (4,))) for _ in range(2)]
+
+
+class TestSensitivity:
+
+    def test_scan_curves(self, ranked_bonsai, batches):
+        to_rank = ranked_bonsai.model.to_rank
+        scan = sensitivity_scan(ranked_bonsai, batches, nn.CrossEntropyLoss(), ratios=(0.25, 1.))
+        groups = layer_groups(ranked_bonsai.model)
+        assert sorted(scan["curves"]) == sorted(groups)
+        for group, curve in scan["curves"].items():
+            assert [point["ratio"] for point in curve] == [0.25, 1.]
+            assert curve[1]["num_pruned"] == len(ranked_bonsai.model.module_list[group].ranking)
+        # the scan turns ranking off while evaluating and restores it
+        assert ranked_bonsai.model.to_rank == to_rank
+
+    def test_workers_match_main_process(self, ranked_bonsai, batches):
+        sequential = sensitivity_scan(ranked_bonsai, batches, nn.CrossEntropyLoss(), ratios=(0.5,))
+        parallel = sensitivity_scan(ranked_bonsai, batches, nn.CrossEntropyLoss(), ratios=(0.5,), num_workers=2)
+        for group, curve in sequential["curves"].items():
+            assert parallel["curves"][group][0]["loss"] == pytest.approx(curve[0]["loss"], rel=1e-4)
+
+    def test_layer_caps(self):
+        scan = {"baseline": {"loss": 1.},
+                "groups": {0: [0], 2: [2, 5]},
+                "curves": {0: [{"ratio": 0.5, "loss": 1.3}, {"ratio": 0.25, "loss": 1.01}],
+                           2: [{"ratio": 0.25, "loss": 1.5}]}}
+        assert layer_caps_from_sensitivity(scan, max_drop=0.05) == {0: 0.25, 2: 0., 5: 0.}
+
+    def test_pruning_plan_respects_caps(self, ranked_bonsai):
+        prunner = ranked_bonsai.prunner
+        first, second = [i for i, _ in prunner._prunable_modules_iterator()][:2]
+        # make the first layer the least important one by far
+        prunner._get_bonsai().model.module_list[first].ranking.zero_()
+        prunner.layer_caps = {first: 0.25}
+        plan = prunner.get_prunning_plan(32)
+        first_size = len(ranked_bonsai.model.module_list[first].ranking)
+        assert len(plan[first]) == int(0.25 * first_size)
+        assert sum(len(filters) for filters in plan.values()) >= 32
@@ -0,0 +1,42 @@
+import pytest
+import torch
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.pruning.sparsity import compute_linear_sparsity_masks, apply_sparsity_masks, \
+    convert_linear_layers_to_sparse, weight_sparsity, sparse_linear_crossover, SparseLinear
+
+
+@pytest.fixture()
+def vgg19():
+    cfg_path = "tests/example_models_for_tests/configs/VGG19.cfg"
+    model = BonsaiModel(cfg_path, None)
+    model.eval()
+    yield model
+
+
+class TestLinearSparsity:
+
+    def test_masks_only_prunable_linear_layers(self, vgg19):
+        masks = compute_linear_sparsity_masks(vgg19, 0.9)
+        assert sorted(masks.keys()) == [23, 25]
+
+    def test_apply_masks(self, vgg19):
+        masks = compute_linear_sparsity_masks(vgg19, 0.9)
+        apply_sparsity_masks(vgg19, masks)
+        for i in masks.keys():
+            assert weight_sparsity(vgg19.module_list[i].linear.weight) >= 0.9
+
+    def test_sparse_conversion_keeps_output(self, vgg19):
+        apply_sparsity_masks(vgg19, compute_linear_sparsity_masks(vgg19, 0.9))
+        model_input = torch.rand(2, 3, 32, 32)
+        with torch.no_grad():
+            dense_output = vgg19(model_input)[0]
+            converted = convert_linear_layers_to_sparse(vgg19, min_sparsity=0.9)
+            sparse_output = vgg19(model_input)[0]
+        assert converted == [23, 25]
+        assert isinstance(vgg19.module_list[23].linear, SparseLinear)
+        assert torch.allclose(dense_output, sparse_output, atol=1e-5)
+
+    def test_sparse_linear_crossover(self):
+        results = sparse_linear_crossover(256, 128, sparsities=(0.5, 0.99), iterations=3, warmup=1)
+        assert set(results["sparse_times"].keys()) == {0.5, 0.99}
+        assert results["crossover"] in [None, 0.5, 0.99]
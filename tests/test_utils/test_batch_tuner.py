@@ -0,0 +1,67 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.utils.batch_tuner import find_batch_size, rebatch_loader, estimate_step_memory
+
+
+@pytest.fixture()
+def resnet18():
+    cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+    yield BonsaiModel(cfg_path, None)
+
+
+class TestBatchTuner:
+
+    def test_rebatch_keeps_dataset(self):
+        dataset = TensorDataset(torch.rand(10, 3, 32, 32), torch.randint(0, 10, (10,)))
+        dl = rebatch_loader(DataLoader(dataset, batch_size=2, shuffle=True), 5)
+        assert dl.batch_size == 5
+        assert len(dl) == 2
+        assert sum(len(y) for _, y in dl) == 10
+
+    def test_rebatch_keeps_loader_settings(self):
+        dataset = TensorDataset(torch.rand(10, 3, 32, 32), torch.randint(0, 10, (10,)))
+        generator = torch.Generator().manual_seed(0)
+        original = DataLoader(dataset, batch_size=2, shuffle=True, num_workers=1, persistent_workers=True,
+                              prefetch_factor=4, generator=generator)
+        dl = rebatch_loader(original, 5)
+        assert dl.generator is generator
+        assert dl.persistent_workers
+        assert dl.prefetch_factor == 4
+        assert dl.multiprocessing_context is original.multiprocessing_context
+
+    def test_memory_cap_filters_candidates(self, resnet18):
+        sample = torch.rand(3, 32, 32)
+        memory_cap = estimate_step_memory(resnet18, 4, False, 32, 32)
+        assert find_batch_size(resnet18, sample, "cpu", False, [2, 4, 8], memory_cap, iterations=1) in (2, 4)
+        assert find_batch_size(resnet18, sample, "cpu", False, [8], memory_cap, iterations=1) is None
+
+    def test_training_probe_restores_state(self, resnet18):
+        state_dict = {k: v.clone() for k, v in resnet18.state_dict().items()}
+        find_batch_size(resnet18, torch.rand(3, 32, 32), "cpu", True, [2, 4], iterations=1)
+        for k, v in resnet18.state_dict().items():
+            assert torch.equal(v, state_dict[k])
+        assert all(p.grad is None or not p.grad.any() for p in resnet18.parameters())
+
+    def test_bonsai_probe_cached_and_kept_out_of_ranks(self, monkeypatch):
+        import bonsai.main
+        from bonsai import Bonsai
+        from bonsai.pruning import ActivationL2Prunner
+
+        probes = []
+
+        def probe(model, sample_input, device, training, **kwargs):
+            probes.append(model.to_rank)
+            return find_batch_size(model, sample_input, device, training, [2], iterations=1)
+
+        monkeypatch.setattr(bonsai.main, "find_batch_size", probe)
+        bonsai_obj = Bonsai("tests/example_models_for_tests/configs/VGG19.cfg", ActivationL2Prunner)
+        bonsai_obj.device = torch.device("cpu")
+        bonsai_obj.model.to_rank = True
+        dl = DataLoader(TensorDataset(torch.rand(4, 3, 32, 32), torch.randint(0, 10, (4,))), batch_size=1)
+        assert bonsai_obj._auto_batch(dl, "eval", 1).batch_size == 2
+        assert bonsai_obj._auto_batch(dl, "eval", 1).batch_size == 2
+        assert probes == [False]
+        assert bonsai_obj.model.to_rank
+        assert all(module.activation is None for _, module in bonsai_obj.prunner._prunable_modules_iterator())
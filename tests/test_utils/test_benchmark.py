@@ -0,0 +1,36 @@
+import json
+import torch
+from bonsai.utils.benchmark import latency_stats, measure_latency, benchmark_sweep, write_benchmark_json
+
+
+class TestBenchmark:
+
+    def test_latency_stats(self):
+        stats = latency_stats([float(i) for i in range(1, 101)])
+        assert stats["mean"] == 50.5
+        assert stats["p50"] == 50.5
+        assert 90 <= stats["p90"] <= 91
+        assert 99 <= stats["p99"] <= 100
+        assert stats["std"] > 0
+
+    def test_iteration_bounds(self):
+        model = torch.nn.Linear(8, 8)
+        model.train()
+        results = measure_latency(model, torch.rand(4, 8), "cpu", warmup=1, min_iterations=5, max_iterations=5)
+        assert results["iterations"] == 5
+        assert model.training
+        results = measure_latency(model, torch.rand(4, 8), "cpu", warmup=0, min_iterations=3, max_iterations=50,
+                                  max_time=0., precision=0)
+        assert results["iterations"] == 3
+
+    def test_sweep(self, tmp_path):
+        model = torch.nn.Conv2d(3, 4, 3)
+        threads = torch.get_num_threads()
+        results = benchmark_sweep(model, (3, 16, 16), "cpu", batch_sizes=[1, 2], resolutions=[(16, 16), (8, 12)],
+                                  num_threads=[1], warmup=1, min_iterations=2, max_iterations=2)
+        assert torch.get_num_threads() == threads
+        assert [(r["batch_size"], r["height"], r["width"]) for r in results] == \
+            [(1, 16, 16), (1, 8, 12), (2, 16, 16), (2, 8, 12)]
+        write_benchmark_json(results, str(tmp_path / "latency.json"))
+        with open(str(tmp_path / "latency.json")) as f:
+            assert json.load(f) == results
@@ -0,0 +1,51 @@
+import pytest
+import torch
+from bonsai.modules.model_cfg_parser import basic_model_cfg_parsing, pruned_model_cfg, write_pruned_config
+from bonsai.utils import checkpoint_writer
+from bonsai.utils.checkpoint_writer import AsyncCheckpointWriter, snapshot_state_dict
+
+
+class TestCheckpointWriter:
+
+    def test_snapshot_taken_on_submit(self, tmp_path):
+        model = torch.nn.Linear(4, 2)
+        expected = {k: v.clone() for k, v in model.state_dict().items()}
+        writer = AsyncCheckpointWriter()
+        writer.save_model(model, str(tmp_path / "weights.pth"))
+        with torch.no_grad():
+            model.weight.add_(1)
+        writer.close()
+        saved = torch.load(str(tmp_path / "weights.pth"))
+        for k, v in expected.items():
+            assert torch.equal(saved[k], v)
+
+    def test_files_written_from_one_snapshot(self, tmp_path, monkeypatch):
+        snapshots = []
+
+        def counting_snapshot(model):
+            snapshots.append(model)
+            return snapshot_state_dict(model)
+        monkeypatch.setattr(checkpoint_writer, "snapshot_state_dict", counting_snapshot)
+
+        model = torch.nn.Linear(4, 2)
+        writer = AsyncCheckpointWriter()
+        writer.save_model_files(model, [(str(tmp_path / "a.pth"), torch.save), (str(tmp_path / "b.pth"), torch.save)])
+        writer.close()
+        assert len(snapshots) == 1
+        assert torch.equal(torch.load(str(tmp_path / "a.pth"))["weight"], torch.load(str(tmp_path / "b.pth"))["weight"])
+
+    def test_errors_raised_on_wait(self):
+        def fail():
+            raise IOError("disk full")
+
+        writer = AsyncCheckpointWriter()
+        writer.submit(fail)
+        with pytest.raises(IOError):
+            writer.wait()
+        writer.close()
+
+    def test_pruned_cfg_matches_written_cfg(self, tmp_path):
+        full_cfg = basic_model_cfg_parsing("tests/example_models_for_tests/configs/resnet18.cfg")
+        pruning_targets = {0: [0, 1, 2], 3: [4, 5]}
+        write_pruned_config(full_cfg, str(tmp_path / "pruned.cfg"), pruning_targets)
+        assert pruned_model_cfg(full_cfg, pruning_targets) == basic_model_cfg_parsing(str(tmp_path / "pruned.cfg"))
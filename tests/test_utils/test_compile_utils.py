@@ -0,0 +1,37 @@
+import pytest
+import torch
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.utils.compile_utils import compile_if_profitable, time_forward
+
+
+@pytest.fixture()
+def vgg16():
+    cfg_path = "tests/example_models_for_tests/configs/FCN-VGG16.cfg"
+    model = BonsaiModel(cfg_path, None)
+    yield model
+
+
+def test_time_forward(vgg16):
+    assert time_forward(vgg16, torch.rand(1, 3, 32, 32), "cpu", iterations=2) > 0
+
+
+def test_skip_compilation_when_not_profitable(vgg16):
+    previous_stats = {"speedup": 1.1, "compile_time": 1e6}
+    compiled_model, stats = compile_if_profitable(vgg16, torch.rand(1, 3, 32, 32), "cpu", remaining_steps=10,
+                                                  previous_stats=previous_stats)
+    assert compiled_model is None
+    assert not stats["compiled"]
+    assert stats["compiled_time"] is None
+    # the next iteration skips compilation as well
+    assert (stats["compile_time"], stats["speedup"]) == (1e6, 1.1)
+    compiled_model, stats = compile_if_profitable(vgg16, torch.rand(1, 3, 32, 32), "cpu", remaining_steps=10,
+                                                  previous_stats=stats)
+    assert compiled_model is None
+
+
+def test_skip_compilation_without_speedup(vgg16):
+    previous_stats = {"speedup": 0.9, "compile_time": 0.}
+    compiled_model, stats = compile_if_profitable(vgg16, torch.rand(1, 3, 32, 32), "cpu", remaining_steps=10 ** 9,
+                                                  previous_stats=previous_stats)
+    assert compiled_model is None
+    assert stats["speedup"] == 0.9
@@ -0,0 +1,53 @@
+import torch
+from torch.utils.data import DataLoader, Dataset
+from bonsai.utils.dataset_cache import TensorCacheDataset, cached_loader
+
+
+class CountingDataset(Dataset):
+
+    def __init__(self, size=10):
+        self.data = torch.rand(size, 3, 4, 4)
+        self.reads = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, item):
+        self.reads += 1
+        return self.data[item] * 2, item % 3
+
+
+class TestDatasetCache:
+
+    def test_cache_matches_dataset(self):
+        dataset = CountingDataset()
+        cache = TensorCacheDataset(dataset, batch_size=4)
+        reads = dataset.reads
+        x, y = cache[3]
+        assert torch.equal(x, dataset.data[3] * 2) and y == 0
+        x, y = cache[[2, 5]]
+        assert torch.equal(x, dataset.data[[2, 5]] * 2)
+        assert dataset.reads == reads
+        assert cache.inputs.is_shared()
+
+    def test_loader_reads_views(self):
+        dataset = CountingDataset()
+        cache = TensorCacheDataset(dataset)
+        reads = dataset.reads
+        dl = cached_loader(DataLoader(dataset, batch_size=4), cache)
+        batches = list(dl)
+        assert dataset.reads == reads
+        assert [len(y) for _, y in batches] == [4, 4, 2]
+        assert batches[1][0].data_ptr() == cache.inputs[4].data_ptr()
+        assert torch.equal(torch.cat([y for _, y in batches]), torch.arange(10) % 3)
+
+    def test_shuffled_loader(self):
+        dataset = CountingDataset()
+        dl = cached_loader(DataLoader(dataset, batch_size=3, shuffle=True), TensorCacheDataset(dataset))
+        assert sorted(torch.cat([y for _, y in dl]).tolist()) == sorted(i % 3 for i in range(10))
+
+    def test_memory_mapped_cache(self, tmp_path):
+        dataset = CountingDataset()
+        cache = TensorCacheDataset(dataset, memory_limit=0, cache_dir=str(tmp_path))
+        assert torch.equal(cache.inputs, dataset.data * 2)
+        assert len(list(tmp_path.iterdir())) == 0
@@ -0,0 +1,46 @@
+import pytest
+import torch
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.utils.model_bundle import read_bundle, write_bundle, ALIGNMENT
+
+
+@pytest.fixture()
+def resnet18():
+    cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+    yield BonsaiModel(cfg_path, None)
+
+
+class TestModelBundle:
+
+    def test_round_trip(self, resnet18, tmp_path):
+        bundle_path = str(tmp_path / "resnet18.bonsai")
+        resnet18.kept_channels[0]["out"] = [0, 2, 5]
+        resnet18.save_bundle(bundle_path)
+        loaded = BonsaiModel.from_bundle(bundle_path)
+
+        for k, v in resnet18.state_dict().items():
+            assert torch.equal(loaded.state_dict()[k], v)
+        assert loaded.kept_channels[0]["out"] == [0, 2, 5]
+
+        resnet18.eval()
+        loaded.eval()
+        model_input = torch.rand(2, 3, 32, 32)
+        with torch.no_grad():
+            assert torch.allclose(loaded(model_input)[0], resnet18(model_input)[0])
+
+    def test_tensors_aligned(self, tmp_path):
+        bundle_path = str(tmp_path / "tensors.bonsai")
+        state_dict = {"a": torch.rand(3), "b": torch.arange(5), "c": torch.zeros(0), "d": torch.rand(2, 7).t()}
+        write_bundle(bundle_path, [{"type": "net"}], state_dict)
+        model_cfg, loaded, _ = read_bundle(bundle_path)
+        assert model_cfg == [{"type": "net"}]
+        for k, v in state_dict.items():
+            assert torch.equal(loaded[k], v)
+            if v.numel():
+                assert loaded[k].data_ptr() % ALIGNMENT == 0
+
+    def test_not_a_bundle(self, tmp_path):
+        path = tmp_path / "model.cfg"
+        path.write_text("[net]\n")
+        with pytest.raises(ValueError):
+            read_bundle(str(path))
@@ -0,0 +1,35 @@
+import pytest
+import torch
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.utils.module_profiler import ModuleProfiler
+
+
+@pytest.fixture()
+def resnet18():
+    cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+    yield BonsaiModel(cfg_path, None)
+
+
+class TestModuleProfiler:
+
+    def test_profile_rows(self, resnet18):
+        profiler = ModuleProfiler(resnet18)
+        rows = profiler.profile(torch.rand(2, 3, 32, 32), runs=3, warmup=1)
+        assert [row["name"] for row in rows] == [module.module_cfg["name"] for module in resnet18.module_list]
+        assert all(row["calls"] == 3 for row in rows)
+        assert sum(row["time_percent"] for row in rows) == pytest.approx(100)
+        # first layer is a 3x3 convolution from 3 to 64 channels on a 32x32 input
+        assert rows[0]["mflops"] == pytest.approx(2 * 2 * 64 * 32 * 32 * 3 * 3 * 3 / 1e6)
+
+    def test_hooks_removed(self, resnet18):
+        profiler = ModuleProfiler(resnet18)
+        profiler.profile(torch.rand(1, 3, 32, 32), runs=1, warmup=0)
+        resnet18(torch.rand(1, 3, 32, 32))
+        assert all(row["calls"] == 1 for row in profiler.summary())
+
+    def test_table_sorted(self, resnet18):
+        profiler = ModuleProfiler(resnet18)
+        profiler.profile(torch.rand(1, 3, 32, 32), runs=1, warmup=0)
+        rows = profiler.summary("mflops")
+        assert all(a["mflops"] >= b["mflops"] for a, b in zip(rows, rows[1:]))
+        assert len(profiler.table().splitlines()) == len(rows) + 2
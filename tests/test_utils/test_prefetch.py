@@ -0,0 +1,63 @@
+import time
+import warnings
+import pytest
+import torch
+from torch.utils.data import DataLoader, Dataset, TensorDataset
+from bonsai.utils.prefetch import PrefetchLoader
+
+
+class SlowDataset(Dataset):
+
+    def __len__(self):
+        return 8
+
+    def __getitem__(self, item):
+        time.sleep(0.01)
+        return torch.rand(3, 4, 4), item
+
+
+class FailingDataset(SlowDataset):
+
+    def __getitem__(self, item):
+        if item == 5:
+            raise IndexError("bad sample")
+        return torch.rand(3, 4, 4), item
+
+
+class TestPrefetchLoader:
+
+    def test_same_batches(self):
+        dataset = TensorDataset(torch.rand(10, 3, 4, 4), torch.arange(10))
+        dl = PrefetchLoader(DataLoader(dataset, batch_size=3), channels_last=True)
+        assert len(dl) == 4
+        assert dl.dataset is dataset
+        batches = list(dl)
+        assert torch.equal(torch.cat([y for _, y in batches]), torch.arange(10))
+        assert all(x.is_contiguous(memory_format=torch.channels_last) for x, _ in batches)
+        # a second pass starts over
+        assert len(list(dl)) == 4
+
+    def test_stall_warning(self):
+        dl = PrefetchLoader(DataLoader(SlowDataset(), batch_size=2), stall_threshold=0.2)
+        with pytest.warns(UserWarning, match="input bound"):
+            list(dl)
+        assert len(dl.wait_times) == 4
+        assert dl.wait_fraction() > 0.2
+
+    def test_no_warning_when_compute_bound(self):
+        dl = PrefetchLoader(DataLoader(SlowDataset(), batch_size=2), stall_threshold=0.9)
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            for _ in dl:
+                time.sleep(0.1)
+
+    def test_worker_error_raised(self):
+        dl = PrefetchLoader(DataLoader(FailingDataset(), batch_size=2))
+        with pytest.raises(IndexError):
+            list(dl)
+
+    def test_early_stop(self):
+        dl = PrefetchLoader(DataLoader(SlowDataset(), batch_size=1), num_prefetch=1)
+        for i, _ in enumerate(dl):
+            if i == 1:
+                break
@@ -0,0 +1,37 @@
+from collections import Counter
+import torch
+from ignite.metrics import Accuracy
+from torch.utils.data import TensorDataset
+from bonsai.utils.proxy_eval import stratified_indices, subset_indices, concat_outputs, bootstrap_metrics
+
+
+class TestProxyEval:
+
+    def test_stratified_proportions(self):
+        targets = [0] * 700 + [1] * 200 + [2] * 90 + [3] * 10
+        indices = stratified_indices(targets, 100, seed=1)
+        assert len(indices) == 100
+        assert Counter(targets[i] for i in indices) == {0: 70, 1: 20, 2: 9, 3: 1}
+        assert indices == stratified_indices(targets, 100, seed=1)
+
+    def test_rare_classes_kept(self):
+        targets = [0] * 98 + [1, 2]
+        indices = stratified_indices(targets, 10)
+        assert len(indices) == 10
+        assert {targets[i] for i in indices} == {0, 1, 2}
+
+    def test_uniform_without_targets(self):
+        dataset = TensorDataset(torch.rand(50, 2), torch.arange(50))
+        indices = subset_indices(dataset, 0.2, seed=3)
+        assert len(indices) == 10 and indices == sorted(set(indices))
+
+    def test_bootstrap_interval(self):
+        torch.manual_seed(0)
+        y = torch.randint(0, 3, (400,))
+        y_pred = torch.nn.functional.one_hot(y, 3).float()
+        y_pred[:100] = y_pred[:100].roll(1, dims=1)
+        output = concat_outputs([(y_pred[:200], y[:200]), (y_pred[200:], y[200:])])
+        intervals = bootstrap_metrics({"accuracy": Accuracy()}, output, 400, num_resamples=100)
+        low, high = intervals["accuracy"]
+        assert low < 0.75 < high
+        assert high - low < 0.2
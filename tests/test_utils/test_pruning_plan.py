@@ -0,0 +1,71 @@
+import os
+import pytest
+import torch
+from torch import nn
+from bonsai import Bonsai
+from bonsai.config import config
+from bonsai.modules.bonsai_model import BonsaiModel
+from bonsai.modules.bonsai_parser import bonsai_parser
+from bonsai.pruning import WeightL2Prunner
+from bonsai.utils.pruning_plan_utils import apply_pruning_plan
+
+
+@pytest.fixture()
+def out_path(tmpdir):
+    config["pruning"]["out_path"] = str(tmpdir)
+    yield str(tmpdir)
+
+
+@pytest.fixture()
+def original_model():
+    model = nn.Sequential(nn.Conv2d(3, 8, 3, padding=1), nn.BatchNorm2d(8), nn.ReLU(),
+                          nn.Conv2d(8, 16, 3, padding=1), nn.BatchNorm2d(16), nn.ReLU(),
+                          nn.AdaptiveAvgPool2d(1), nn.Flatten(), nn.Linear(16, 10))
+    model.eval()
+    yield model
+
+
+class TestPruningPlan:
+
+    def test_apply_pruning_plan(self, original_model, out_path):
+        model_in = torch.rand(2, 3, 16, 16)
+        cfg_path = os.path.join(out_path, "model.cfg")
+        bonsai_parser(original_model, model_in).save_cfg(cfg_path)
+        bonsai = Bonsai(cfg_path, WeightL2Prunner)
+        bonsai.model = BonsaiModel.from_torch_module(original_model, model_in, bonsai)
+
+        for iteration in range(1, 3):
+            bonsai._rank(None, None, iteration)
+            bonsai._prune_model(4, iteration)
+
+        plan = bonsai.export_pruning_plan()
+        assert len(plan["0"]["out"]) + len(plan["3"]["out"]) == 16
+        assert plan["1"]["out"] == plan["0"]["out"]
+        assert plan["8"]["out"] is None
+
+        apply_pruning_plan(original_model, plan)
+        bonsai.model.eval()
+        assert torch.allclose(original_model(model_in), bonsai.model(model_in)[0], atol=1e-5)
+
+    def test_nested_module_names(self, out_path):
+        # names such as 0.10 must not be read back from the config as numbers
+        layers = []
+        for in_channels, out_channels in [(3, 8), (8, 8), (8, 8), (8, 8), (8, 8), (8, 16)]:
+            layers += [nn.Conv2d(in_channels, out_channels, 3, padding=1), nn.ReLU()]
+        original_model = nn.Sequential(nn.Sequential(*layers), nn.AdaptiveAvgPool2d(1), nn.Flatten(),
+                                       nn.Linear(16, 10))
+        original_model.eval()
+        model_in = torch.rand(2, 3, 16, 16)
+        cfg_path = os.path.join(out_path, "model.cfg")
+        bonsai_parser(original_model, model_in).save_cfg(cfg_path)
+        bonsai = Bonsai(cfg_path, WeightL2Prunner)
+        bonsai.model = BonsaiModel.from_torch_module(original_model, model_in, bonsai)
+
+        bonsai._rank(None, None, 1)
+        bonsai._prune_model(8, 1)
+
+        plan = bonsai.export_pruning_plan()
+        assert {"0.0", "0.2", "0.10", "3"} <= set(plan)
+        apply_pruning_plan(original_model, plan)
+        bonsai.model.eval()
+        assert torch.allclose(original_model(model_in), bonsai.model(model_in)[0], atol=1e-5)
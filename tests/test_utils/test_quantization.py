@@ -0,0 +1,39 @@
+import pytest
+import torch
+from torch.utils.data import DataLoader, TensorDataset
+from bonsai import Bonsai
+
+
+@pytest.fixture()
+def vgg16():
+    cfg_path = "tests/example_models_for_tests/configs/FCN-VGG16.cfg"
+    bonsai = Bonsai(cfg_path)
+    yield bonsai
+
+
+@pytest.fixture()
+def resnet18():
+    cfg_path = "tests/example_models_for_tests/configs/resnet18.cfg"
+    bonsai = Bonsai(cfg_path)
+    yield bonsai
+
+
+@pytest.fixture()
+def calibration_dl():
+    dataset = TensorDataset(torch.rand(8, 3, 32, 32), torch.randint(0, 10, (8,)))
+    yield DataLoader(dataset, batch_size=4)
+
+
+class TestStaticQuantization:
+
+    def test_quantize_fcn_vgg16(self, vgg16, calibration_dl):
+        vgg16.quantize(calibration_dl)
+        assert isinstance(vgg16.model.module_list[0].conv2d, torch.nn.intrinsic.quantized.ConvReLU2d)
+        model_output = vgg16.model(torch.rand(1, 3, 32, 32))
+        assert model_output[0].size() == (1, 10)
+        assert model_output[0].dtype == torch.float32
+
+    def test_quantize_resnet18(self, resnet18, calibration_dl):
+        resnet18.quantize(calibration_dl)
+        model_output = resnet18.model(torch.rand(1, 3, 32, 32))
+        assert model_output[0].size() == (1, 10)
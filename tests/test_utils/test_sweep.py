@@ -0,0 +1,99 @@
+import os
+import pytest
+import torch
+from bonsai import Bonsai
+from bonsai.pruning import WeightL2Prunner
+from bonsai.utils.sweep import expand_grid, trial_budget, prefix_key, _iteration_recorder
+from bonsai.utils.sweep_store import SweepStore
+from bonsai.utils.telemetry import PhaseEvents
+
+VGG19_CFG = "tests/example_models_for_tests/configs/VGG19.cfg"
+
+
+@pytest.fixture()
+def weights(tmpdir):
+    path = os.path.join(str(tmpdir), "weights.pth")
+    torch.save(Bonsai(VGG19_CFG, WeightL2Prunner).model.state_dict(), path)
+    yield path
+
+
+@pytest.fixture()
+def settings(weights):
+    yield {"model": VGG19_CFG, "weights": weights, "data": "data:loaders", "data_kwargs": {},
+           "pruner": "WeightL2Prunner", "normalize": False}
+
+
+class TestSweep:
+
+    def test_expand_grid(self):
+        trials = expand_grid({"pruner": ["WeightL2Prunner", "ActivationL2Prunner"],
+                              "pruning.prune_percent": [0.1, 0.2], "normalize": True})
+        assert len(trials) == 4
+        assert trials[0] == {"pruner": "WeightL2Prunner", "pruning.prune_percent": 0.1, "normalize": True}
+        assert expand_grid({}) == [{}]
+
+    def test_trial_budget(self):
+        assert trial_budget(max_parallel=1) == 1
+        assert trial_budget(cpus_per_trial=10 ** 6) == 1
+        assert trial_budget(memory_per_trial=2 ** 60) == 1
+
+    def test_prefix_key(self, settings):
+        base = prefix_key(settings, {"pruning.prune_percent": 0.1, "pruning.finetune_epochs": 1})
+        assert base == prefix_key(settings, {"pruning.prune_percent": 0.2, "pruning.finetune_epochs": 3})
+        assert base != prefix_key(settings, {"pruning.prune_percent": 0.1, "normalize": True})
+        assert base != prefix_key(settings, {"pruner": "ActivationL2Prunner"})
+        assert base != prefix_key(settings, {}, {"execution": {"autocast": "bfloat16"}})
+        # randomly initialized models don't share ranks
+        assert prefix_key(dict(settings, weights=None), {}) is None
+
+    def test_store(self, tmpdir):
+        with SweepStore(os.path.join(str(tmpdir), "sweep.db")) as store:
+            trial_id = store.add_trial("test", {"pruner": "WeightL2Prunner"}, "abc")
+            store.start_trial(trial_id, "out")
+            store.record_iteration(trial_id, 0, {"loss": 1.}, latency_ms=2., num_parameters=10)
+            store.record_iteration(trial_id, 1, {"loss": 1.5}, latency_ms=1., num_parameters=5)
+            store.finish_trial(trial_id)
+
+            assert store.find_trial("test", {"pruner": "WeightL2Prunner"})["status"] == "done"
+            assert store.find_trial("other", {"pruner": "WeightL2Prunner"}) is None
+            assert store.trials("test")[0]["params"] == {"pruner": "WeightL2Prunner"}
+            iterations = store.iterations(trial_id)
+            assert [iteration["metrics"]["loss"] for iteration in iterations] == [1., 1.5]
+            assert iterations[1]["num_parameters"] == 5
+
+    def test_latency_recorded_only_when_timed(self, tmpdir):
+        bonsai = Bonsai(VGG19_CFG, WeightL2Prunner)
+        bonsai.last_metrics = {"loss": 1.}
+        with SweepStore(os.path.join(str(tmpdir), "sweep.db")) as store:
+            trial_id = store.add_trial("test", {}, None)
+            start, record = _iteration_recorder(store, trial_id, bonsai)
+            bonsai.telemetry.engine.add_event_handler(PhaseEvents.PHASE_STARTED, start)
+            bonsai.telemetry.engine.add_event_handler(PhaseEvents.PHASE_COMPLETED, record)
+            with bonsai.telemetry.phase("eval", 0):
+                bonsai.metrics_list.append({"avg_time": 0.002})
+            # the next evaluation isn't timed, the previous latency isn't recorded again
+            with bonsai.telemetry.phase("eval", 1):
+                pass
+            iterations = store.iterations(trial_id)
+        assert iterations[0]["latency_ms"] == pytest.approx(2.)
+        assert iterations[1]["latency_ms"] is None
+
+    def test_rank_cache(self, tmpdir, weights, monkeypatch):
+        cache = os.path.join(str(tmpdir), "ranks.pt")
+        first = Bonsai(VGG19_CFG, WeightL2Prunner)
+        first.model.load_state_dict(torch.load(weights))
+        first.rank_cache = cache
+        first._rank(None, None, 1)
+        assert os.path.exists(cache)
+
+        second = Bonsai(VGG19_CFG, WeightL2Prunner)
+        second.model.load_state_dict(torch.load(weights))
+        second.rank_cache = cache
+
+        def fail():
+            raise AssertionError("ranks should be loaded from the cache")
+        monkeypatch.setattr(second.prunner, "compute_model_ranks", fail)
+        second._rank(None, None, 1)
+        for (_, module), (_, cached) in zip(first.prunner._prunable_modules_iterator(),
+                                            second.prunner._prunable_modules_iterator()):
+            assert torch.equal(module.ranking, cached.ranking)
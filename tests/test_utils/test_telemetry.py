@@ -0,0 +1,55 @@
+import json
+import time
+import torch
+from ignite.engine import Engine
+from bonsai.utils.telemetry import PipelineTelemetry, PhaseEvents
+
+
+class SlowLoader:
+
+    def __init__(self, num_batches, batch_size, delay):
+        self.num_batches = num_batches
+        self.batch_size = batch_size
+        self.delay = delay
+
+    def __len__(self):
+        return self.num_batches
+
+    def __iter__(self):
+        for _ in range(self.num_batches):
+            time.sleep(self.delay)
+            yield torch.rand(self.batch_size, 3), torch.rand(self.batch_size)
+
+
+class TestTelemetry:
+
+    def test_phase_record(self, tmp_path):
+        jsonl_path = str(tmp_path / "telemetry.jsonl")
+        telemetry = PipelineTelemetry(jsonl_path=jsonl_path)
+        completed = []
+        telemetry.engine.add_event_handler(PhaseEvents.PHASE_COMPLETED,
+                                           lambda engine: completed.append(engine.state.phase_record))
+
+        engine = Engine(lambda engine, batch: time.sleep(0.01))
+        with telemetry.phase("eval", 2):
+            telemetry.attach(engine)
+            engine.run(SlowLoader(4, 5, 0.02), max_epochs=1)
+
+        record = telemetry.records[0]
+        assert completed == [record]
+        assert record["phase"] == "eval" and record["iteration"] == 2
+        assert record["samples"] == 20
+        assert record["data_wait_time"] >= 0.06
+        assert record["compute_time"] >= 0.03
+        assert record["wall_time"] >= record["data_wait_time"] + record["compute_time"]
+        with open(jsonl_path) as f:
+            assert [json.loads(line) for line in f] == [record]
+
+    def test_attach_outside_phase(self):
+        telemetry = PipelineTelemetry()
+        engine = Engine(lambda engine, batch: None)
+        telemetry.attach(engine)
+        engine.run([torch.rand(2, 3)], max_epochs=1)
+        with telemetry.phase("prune", 1):
+            pass
+        assert telemetry.records[0]["samples"] == 0